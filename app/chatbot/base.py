@@ -2,12 +2,13 @@ from openai import OpenAI
 from config import Config
 import time
 import json
-from typing import Optional, List, Dict, Any, Union, Callable
+from typing import Optional, List, Dict, Any, Union, Callable, Tuple
 from supabase import create_client
 import logging
 import datetime
 from functools import lru_cache
 from app.models import TIMEZONE
+from app.services.cache_service import get_shared_cache, hashed_key
 
 client = OpenAI(api_key=Config.OPENAI_API_KEY)
 supabase = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
@@ -29,7 +30,6 @@ class BaseChatbot:
         self.model = model
         self.assistant_id = assistant_id
         self.assistant = None
-        self._name_cache = {}
         try:
             self.initialize_assistant()
         except Exception as e:
@@ -58,10 +58,68 @@ class BaseChatbot:
     def initialize_assistant(self) -> None:
         self._initialize_assistant()
 
+    def _get_cached_name(self, scope: str, raw: str) -> Tuple[bool, Optional[str]]:
+        """
+        Consulta o cache compartilhado de nomes extraídos.
+        
+        Returns:
+            (encontrado, nome); nome é None quando ficou registrado que não há nome
+        """
+        value = get_shared_cache().get(hashed_key(f"name:{scope}", raw))
+        if value is None:
+            return False, None
+        return True, value or None
+
+    def _cache_name(self, scope: str, raw: str, name: Optional[str]) -> None:
+        """Armazena um nome (ou a ausência de nome) no cache compartilhado, com TTL."""
+        get_shared_cache().set(hashed_key(f"name:{scope}", raw), name or "", ttl=Config.NAME_CACHE_TTL)
+
     def _log_interaction(self, thread_id: str, role: str, content: str, user_name: str) -> None:
         timestamp = datetime.datetime.now(tz=TIMEZONE).isoformat()
         logger.info(f"Interação registrada - Thread: {thread_id}, Role: {role}, User: {user_name}, Content: {content}, Timestamp: {timestamp}")
 
+    @staticmethod
+    def _tool_signature(tool: Any) -> Dict[str, Any]:
+        """Campos de uma ferramenta que importam para o modelo, seja dict ou objeto da API."""
+        if hasattr(tool, "model_dump"):
+            tool = tool.model_dump()
+        function = tool.get("function") or {}
+        return {
+            "type": tool.get("type"),
+            "name": function.get("name"),
+            "description": function.get("description"),
+            "parameters": function.get("parameters"),
+        }
+
+    def sync_assistant(self, apply: bool = True) -> Dict[str, Any]:
+        """
+        Leva ao assistente existente (ASSISTANT_ID_*) as instruções e ferramentas
+        definidas no código, se mudaram, e devolve as alterações.
+        
+        Não roda na inicialização: sobrescreve o que foi editado no painel da
+        OpenAI e depende da configuração do host (ex.: SEMANTIC_INDEX_DIR).
+        Use scripts/sync_assistants.py; com apply=False só compara.
+        """
+        changes: Dict[str, Any] = {}
+        instructions = self.get_instructions()
+        if instructions and instructions != self.assistant.instructions:
+            changes["instructions"] = instructions
+        # Chatbots sem get_tools mantêm as ferramentas configuradas no assistente
+        if hasattr(self, "get_tools"):
+            tools = self.get_tools()
+            current = [self._tool_signature(tool) for tool in self.assistant.tools or []]
+            if [self._tool_signature(tool) for tool in tools] != current:
+                changes["tools"] = tools
+        if not changes or not apply:
+            return changes
+        try:
+            self.assistant = client.beta.assistants.update(self.assistant_id, **changes)
+            logger.info(f"Assistente {self.name} atualizado ({', '.join(changes)})")
+        except Exception as e:
+            # O assistente continua utilizável com a configuração anterior
+            logger.error(f"Erro ao atualizar assistente {self.name}: {str(e)}", exc_info=True)
+        return changes
+
     def _create_assistant(self) -> None:
         try:
             instructions = self.get_instructions()
@@ -106,6 +164,14 @@ class BaseChatbot:
             logger.error(f"Erro ao buscar runs ativos para thread {thread_id}: {str(e)}", exc_info=True)
             return None
 
+    def _run_options(self, thread_id: str, message: str) -> Dict[str, Any]:
+        """
+        Parâmetros extras de runs.create para esta mensagem (ex.: additional_instructions).
+
+        Subclasses sobrescrevem para anexar contexto ao run; o padrão não acrescenta nada.
+        """
+        return {}
+
     def send_message(self, thread_id: str, message: str, user_name: str = "Usuário") -> Dict[str, Any]:
         if not thread_id or not message:
             raise ValueError("thread_id e message são obrigatórios")
@@ -147,12 +213,14 @@ class BaseChatbot:
                         }
                     logger.warning(f"Tentativa {attempt + 1} falhou ao enviar mensagem: {str(e)}")
                     time.sleep(2 ** attempt)
+            run_options = self._run_options(thread_id, message)
             max_retries = 3
             for attempt in range(max_retries):
                 try:
                     run = client.beta.threads.runs.create(
                         thread_id=thread_id,
-                        assistant_id=self.assistant_id
+                        assistant_id=self.assistant_id,
+                        **run_options
                     )
                     break
                 except Exception as e:
@@ -3,12 +3,16 @@ import logging
 import json
 from typing import Dict, List, Any, Optional
 import datetime
+from app.services.lexicon import Lexicon, get_lexicon
 
 logger = logging.getLogger("chatbot.utils")
 
 def format_timestamp(timestamp) -> str:
     """Converte diferentes formatos de timestamp para ISO 8601."""
     try:
+        if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+            # Timestamp Unix numérico
+            return datetime.datetime.fromtimestamp(timestamp).isoformat()
         if isinstance(timestamp, str):
             if timestamp.replace('.', '').isdigit():
                 # Se for um timestamp Unix como string
@@ -40,8 +44,43 @@ def sanitize_content(content: str) -> str:
     # Remover caracteres potencialmente problemáticos
     return content.replace("\0", "")
 
-def extract_entities(text: str) -> Dict[str, List[str]]:
-    """Extrai entidades do texto usando regras simples."""
+def format_timestamps(timestamps: List[Any]) -> List[str]:
+    """
+    Versão em lote de format_timestamp: cada valor distinto é convertido uma
+    única vez e valores ausentes/inválidos recebem o mesmo "agora" do lote.
+    """
+    now = None
+    converted: Dict[Any, str] = {}
+    result = []
+    for timestamp in timestamps:
+        if timestamp is None or timestamp == "":
+            if now is None:
+                now = datetime.datetime.now().isoformat()
+            result.append(now)
+            continue
+        try:
+            value = converted.get(timestamp)
+        except TypeError:
+            # Valor não hashable (lista, dict...): inválido
+            value = format_timestamp(None)
+        if value is None:
+            value = converted[timestamp] = format_timestamp(timestamp)
+        result.append(value)
+    return result
+
+def sanitize_contents(contents: List[str]) -> List[str]:
+    """Versão em lote de sanitize_content."""
+    return [sanitize_content(content) if content and (len(content) > 10000 or "\0" in content) else (content or "")
+            for content in contents]
+
+def extract_entities(text: str, lexicon: Optional[Lexicon] = None) -> Dict[str, List[str]]:
+    """
+    Extrai entidades do texto usando regras simples e o léxico de entidades.
+    
+    Args:
+        text: Texto a analisar
+        lexicon: Léxico com categorias de entidades (padrão: get_lexicon('entities'))
+    """
     entities = {
         "pessoas": [],
         "organizações": [],
@@ -57,4 +96,10 @@ def extract_entities(text: str) -> Dict[str, List[str]]:
         elif word.startswith("#"):
             entities["organizações"].append(word[1:])
     
-    return entities
\ No newline at end of file
+    # Termos do léxico, encontrados em uma única passada (sem acentos/maiúsculas)
+    for category, term in (lexicon or get_lexicon('entities')).find(text):
+        found = entities.setdefault(category, [])
+        if term not in found:
+            found.append(term)
+    
+    return entities
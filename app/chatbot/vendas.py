@@ -5,19 +5,33 @@ import re
 from datetime import datetime
 from .base import BaseChatbot, supabase, client  # Import client from base.py
 from config import Config
+from app.models import ThreadDisplayName
+from app.services.name_extractor import match_name_rules
+from app.services.search_service import CachedMessageSearch, SupabaseMessageSearch, search_terms
+from app.services.semantic_index import get_semantic_index
+from app.services.version_service import watermarks
 
 logger = logging.getLogger("chatbot.vendas")
 
+# Busca indexada (FTS + trigramas) com cache de resultados compartilhado entre
+# instâncias; cada nova mensagem gravada invalida o cache (whatsapp_handler)
+message_search = CachedMessageSearch(
+    SupabaseMessageSearch(supabase), watermarks, ttl=Config.MESSAGE_SEARCH_CACHE_TTL
+)
+
 class VendasChatbot(BaseChatbot):
     """Chatbot especialista em vendas para mentoria."""
 
     def __init__(self):
+        self.message_search = message_search
+        # Índice semântico local; None sem numpy ou com SEMANTIC_INDEX_DIR vazio.
+        # Definido antes do super().__init__, que usa get_tools() ao criar o assistente
+        self.semantic_index = get_semantic_index()
         super().__init__(
             name="Assistente de Vendas (Mentor)",
             model="gpt-4o",
             assistant_id=Config.ASSISTANT_ID_VENDAS
         )
-        self._name_cache = {}  # Cache para armazenar nomes de usuários por thread_id
 
     def get_instructions(self) -> str:
         return (
@@ -26,11 +40,13 @@ class VendasChatbot(BaseChatbot):
             "e analisar conversas anteriores para identificar pontos de melhoria. "
             "Use a função query_whatsapp_messages para acessar histórico de conversas do WhatsApp "
             "quando o usuário mencionar 'histórico', 'mensagens anteriores', 'consultar conversas' "
-            "ou termos similares. Seja sempre construtivo e focado em resultados."
+            "ou termos similares. Para perguntas sobre assuntos ou temas das conversas "
+            "(ex.: 'do que os clientes reclamaram'), use semantic_search_whatsapp_messages "
+            "quando disponível. Seja sempre construtivo e focado em resultados."
         )
 
     def get_tools(self) -> List[Dict[str, Any]]:
-        return [
+        tools = [
             {
                 "type": "function",
                 "function": {
@@ -83,11 +99,30 @@ class VendasChatbot(BaseChatbot):
                 }
             }
         ]
+        if self.semantic_index is not None:
+            tools.append({
+                "type": "function",
+                "function": {
+                    "name": "semantic_search_whatsapp_messages",
+                    "description": "Busca mensagens do WhatsApp por assunto (similaridade), não por texto exato",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {"type": "string", "description": "Assunto ou pergunta, ex.: reclamações sobre atendimento"},
+                            "limit": {"type": "integer", "default": 10, "description": "Limite de resultados"}
+                        },
+                        "required": ["query"]
+                    }
+                }
+            })
+        return tools
 
     def _execute_function(self, function_name: str, arguments: Dict, thread_id: str) -> str:
         try:
             if function_name == "query_whatsapp_messages":
                 return self._query_whatsapp_data(arguments)
+            elif function_name == "semantic_search_whatsapp_messages":
+                return self._semantic_search_whatsapp(arguments)
             elif function_name == "log_interaction":
                 return self._log_interaction_function(arguments)
             elif function_name == "update_user_name":
@@ -100,25 +135,20 @@ class VendasChatbot(BaseChatbot):
 
     def _query_whatsapp_data(self, params: Dict) -> str:
         try:
-            query = supabase.table("whatsapp_messages").select("*")
-            if sender_name := params.get("sender_name"):
-                query = query.ilike("sender_name", f"%{sender_name}%")
-            if content := params.get("content"):
-                query = query.ilike("content", f"%{content}%")
-            if start_date := params.get("start_date"):
-                if end_date := params.get("end_date"):
-                    query = query.gte("timestamp", start_date).lte("timestamp", end_date)
-                else:
-                    query = query.gte("timestamp", start_date)
-            query = query.order("timestamp", desc=True).limit(params.get("limit", 10))
-            result = query.execute()
+            rows = self.message_search.search(
+                content=params.get("content"),
+                sender_name=params.get("sender_name"),
+                start_date=params.get("start_date"),
+                end_date=params.get("end_date"),
+                limit=params.get("limit", 10)
+            )
             formatted_messages = [
                 {
                     "sender": msg.get("sender_name", "Desconhecido"),
                     "message": msg.get("content", ""),
                     "date": msg.get("timestamp", "")
                 }
-                for msg in result.data
+                for msg in rows
             ]
             logger.info(f"Consulta Supabase retornou: {len(formatted_messages)} itens")
             return json.dumps({
@@ -135,6 +165,38 @@ class VendasChatbot(BaseChatbot):
                 "query_params": params
             }, ensure_ascii=False)
 
+    def _semantic_search_whatsapp(self, params: Dict) -> str:
+        try:
+            if self.semantic_index is None:
+                return json.dumps({"status": "error", "message": "Índice semântico indisponível"})
+            query = (params.get("query") or "").strip()
+            if not query:
+                return json.dumps({"status": "error", "message": "query é obrigatório"})
+            hits = self.semantic_index.search(query, k=min(int(params.get("limit", 10)), 50))
+            formatted_messages = [
+                {
+                    "sender": hit.get("sender_name") or "Desconhecido",
+                    "message": hit.get("content", ""),
+                    "date": hit.get("timestamp", ""),
+                    "score": hit["score"]
+                }
+                for hit in hits
+            ]
+            logger.info(f"Busca semântica retornou: {len(formatted_messages)} itens")
+            return json.dumps({
+                "status": "success",
+                "data": formatted_messages,
+                "count": len(formatted_messages),
+                "query_params": params
+            }, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"Erro na busca semântica: {str(e)}", exc_info=True)
+            return json.dumps({
+                "status": "error",
+                "message": str(e),
+                "query_params": params
+            }, ensure_ascii=False)
+
     def _log_interaction_function(self, params: Dict) -> str:
         try:
             logger.info(f"Interação registrada: {params}")
@@ -304,48 +366,15 @@ class VendasChatbot(BaseChatbot):
         if not message:
             return ""
         
-        # Lista de padrões específicos para identificar nomes
-        patterns = [
-            r"meu nome[^\w]* (?:é|eh)[^\w]* ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",  # "Meu nome é João Silva"
-            r"me chamo[^\w]* ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",    # "Me chamo João Silva"
-            r"(?:pode[^\w]* )?me chamar de[^\w]* ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",  # "Pode me chamar de João"
-            r"meu nome é ([A-Za-zÀ-ÿ]+)",  # "Meu nome é João"
-            r"sou o ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",  # "Sou o João Silva"
-            r"sou a ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",  # "Sou a Maria Silva"
-            r"([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?) é meu nome",  # "João Silva é meu nome"
-        ]
-        
-        # Lista de palavras para filtrar falsos positivos
-        common_words = [
-            "sim", "não", "nao", "ok", "oi", "olá", "ola", "bom", "boa", "dia", "tarde", "noite",
-            "obrigado", "obrigada", "ajuda", "claro", "todos", "todas", "porque", "como",
-            "quero", "queria", "vamos", "agora", "hoje", "amanhã", "amanha", "ontem",
-            "vendedor", "cliente", "pessoa", "gente", "pessoal", "equipe", "empresa"
-        ]
-        
-        # Tenta cada padrão até encontrar um match
-        for pattern in patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                name = match.group(1).strip()
-                # Limpa o nome removendo pontuações no final
-                name = re.sub(r'[.,;:!?"]$', '', name)
-                
-                # Verifica se o nome obtido não é uma palavra comum
-                if name.lower() in common_words:
-                    logger.debug(f"Nome extraído '{name}' é uma palavra comum, ignorando")
-                    continue
-                    
-                # Verifica comprimento válido (entre 2 e 30 caracteres)
-                if 2 <= len(name) <= 30:
-                    logger.info(f"Nome extraído da mensagem: {name}")
-                    return name
-        
-        return ""
+        # Regras compiladas compartilhadas com o extrator em camadas (app/services/name_extractor.py)
+        name = match_name_rules(message)
+        if name:
+            logger.info(f"Nome extraído da mensagem: {name}")
+        return name
         
     def get_user_name(self, thread_id: str) -> str:
         """
-        Recupera o nome do usuário do cache ou das mensagens.
+        Recupera o nome do usuário do cache ou da tabela thread_display_names.
         
         Args:
             thread_id: ID da thread
@@ -354,30 +383,24 @@ class VendasChatbot(BaseChatbot):
             Nome do usuário ou "Usuário Anônimo" se não encontrado
         """
         # Verificar se já temos o nome em cache
-        if thread_id in self._name_cache:
-            return self._name_cache[thread_id]
+        found, cached_name = self._get_cached_name('thread', thread_id)
+        if found and cached_name:
+            return cached_name
         
-        try:
-            # Buscar nas mensagens
-            result = supabase.table("mensagens_chatbot").select("user_name").eq("thread_id", thread_id).eq("role", "user").order('timestamp', desc=True).limit(10).execute()
-            
-            if result.data:
-                for msg in result.data:
-                    user_name = msg.get("user_name")
-                    if user_name and user_name != "Usuário Anônimo" and user_name.strip():
-                        # Armazenar em cache
-                        self._name_cache[thread_id] = user_name
-                        logger.info(f"Nome do usuário recuperado das mensagens: {user_name}")
-                        return user_name
-        except Exception as e:
-            logger.error(f"Erro ao recuperar nome do usuário: {str(e)}", exc_info=True)
+        # Buscar o nome de exibição armazenado para a thread
+        user_name = ThreadDisplayName.get(thread_id)
+        if user_name:
+            # Armazenar em cache
+            self._cache_name('thread', thread_id, user_name)
+            logger.info(f"Nome do usuário recuperado da thread: {user_name}")
+            return user_name
         
         # Valor padrão se não encontrar
         return "Usuário Anônimo"
         
     def save_user_name(self, thread_id: str, user_name: str) -> None:
         """
-        Salva o nome do usuário no banco de dados Supabase.
+        Salva o nome de exibição do usuário para a thread.
         
         Args:
             thread_id: ID da thread atual
@@ -394,21 +417,56 @@ class VendasChatbot(BaseChatbot):
                 return
                 
             # Armazenar o nome do usuário em cache para uso futuro nesta sessão
-            self._name_cache[thread_id] = user_name
+            self._cache_name('thread', thread_id, user_name)
                 
-            logger.info(f"Salvando nome do usuário na tabela mensagens_chatbot: {user_name}")
-            
-            # Atualizar mensagens do usuário neste thread
-            result = supabase.table("mensagens_chatbot").update(
-                {"user_name": user_name}
-            ).eq("thread_id", thread_id).eq("role", "user").execute()
+            logger.info(f"Salvando nome de exibição da thread: {user_name}")
             
-            affected_rows = len(result.data) if hasattr(result, 'data') else 0
-            logger.info(f"Nome do usuário salvo com sucesso. Registros atualizados: {affected_rows}")
+            # Uma única escrita; as mensagens recebem o nome na leitura
+            if ThreadDisplayName.set(thread_id, user_name):
+                logger.info(f"Nome do usuário salvo com sucesso: {user_name}")
                 
         except Exception as e:
             logger.error(f"Erro ao salvar nome do usuário no Supabase: {str(e)}", exc_info=True)
             
+    def _run_options(self, thread_id: str, message: str) -> Dict[str, Any]:
+        """
+        Pré-recuperação: busca a mensagem do usuário no índice semântico local e
+        envia as mensagens do WhatsApp mais parecidas como additional_instructions
+        do run. Quando o contexto basta, o modelo responde sem chamar
+        query_whatsapp_messages, economizando um ciclo requires_action/submit.
+
+        Desligada por padrão (Config.VENDAS_PRERETRIEVAL); qualquer falha apenas
+        deixa o run sem contexto extra.
+        """
+        if not Config.VENDAS_PRERETRIEVAL or self.semantic_index is None or not search_terms(message):
+            return {}
+        try:
+            hits = self.semantic_index.search(
+                message, k=Config.VENDAS_PRERETRIEVAL_K, min_score=Config.VENDAS_PRERETRIEVAL_MIN_SCORE
+            )
+        except Exception as e:
+            logger.error(f"Erro na pré-recuperação: {str(e)}", exc_info=True)
+            return {}
+        if not hits:
+            return {}
+        logger.info(f"Pré-recuperação anexou {len(hits)} mensagens do WhatsApp ao run")
+        return {"additional_instructions": self._format_retrieved_context(hits)}
+
+    @staticmethod
+    def _format_retrieved_context(hits: List[Dict[str, Any]], max_chars: int = 300) -> str:
+        lines = [
+            "Mensagens do WhatsApp possivelmente relevantes para a pergunta do usuário, "
+            "recuperadas automaticamente do histórico (da mais para a menos parecida). "
+            "Use-as se bastarem para responder; para outros filtros (remetente, datas, mais resultados), "
+            "chame query_whatsapp_messages ou semantic_search_whatsapp_messages."
+        ]
+        for hit in hits:
+            content = " ".join((hit.get("content") or "").split())
+            if len(content) > max_chars:
+                content = content[:max_chars].rstrip() + "…"
+            lines.append(f"- [{hit.get('timestamp') or 's/ data'}] {hit.get('sender_name') or 'Desconhecido'}: {content}")
+        return "\n".join(lines)
+
     def send_message(self, thread_id: str, message: str, user_name: str = "Usuário Anônimo") -> Dict[str, Any]:
         """
         Envia uma mensagem para o chatbot e processa a extração de nome do usuário.
@@ -433,9 +491,7 @@ class VendasChatbot(BaseChatbot):
             # Verificar se o nome extraído é diferente do nome atual
           if extracted_name != user_name:
                 user_name = extracted_name
-                # Atualizar o cache
-                self._name_cache[thread_id] = user_name
-                # Salva o nome do usuário no banco de dados
+                # Salva o nome do usuário no banco de dados e no cache compartilhado
                 self.save_user_name(thread_id, user_name)
                 logger.info(f"Nome do usuário atualizado para: {user_name}")
         
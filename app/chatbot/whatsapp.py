@@ -2,6 +2,8 @@
 from typing import Dict, List, Any, Optional
 import logging
 from .base import BaseChatbot, client
+from app.models import Message
+from app.services.name_extractor import UNRESOLVED, NameExtractor, OpenAINameResolver
 from config import Config
 import json
 import asyncio
@@ -18,31 +20,18 @@ class WhatsAppChatbot(BaseChatbot):
             model="gpt-4o",
             assistant_id=Config.ASSISTANT_ID_WHATSAPP
         )
-        # Cache para armazenar nomes extraídos
-        self._name_cache = {}
         self.max_history = Config.MAX_HISTORY_MESSAGES  # Limite de mensagens no histórico
+        # Regras e heurística locais; só as mensagens ambíguas chegam ao modelo (gpt-3.5, em lote)
+        self.name_extractor = NameExtractor(llm_resolver=OpenAINameResolver(lambda: client))
     
     def get_messages(self, thread_id: str) -> List[Dict]:
         """Obtém apenas as últimas N mensagens do histórico."""
-        messages = Message.get_messages(thread_id)
-        return messages[-self.max_history:] if messages else []
+        return Message.get_window(thread_id, self.max_history)
 
     def send_message(self, thread_id: str, message: str) -> Dict:
         """Envia mensagem mantendo histórico limitado."""
-        messages = self.get_messages(thread_id)
-        if len(messages) >= self.max_history:
-            # Remove mensagens antigas se exceder o limite
-            Message.clear_thread_history(thread_id)
-            # Mantém apenas as últimas mensagens
-            for msg in messages[-self.max_history:]:
-                Message.create(
-                    thread_id=thread_id,
-                    role=msg['role'],
-                    content=msg['content'],
-                    user_id=msg.get('user_id'),
-                    chatbot_type='whatsapp'
-                )
-        
+        # Remove apenas as mensagens mais antigas que a janela (um único delete)
+        Message.trim_thread_history(thread_id, self.max_history)
         return super().send_message(thread_id, message)
     
     def get_instructions(self) -> str:
@@ -54,46 +43,40 @@ class WhatsAppChatbot(BaseChatbot):
         )
     
     def extract_name(self, message: str) -> Optional[str]:
-        """Extrai o nome do usuário usando o modelo de linguagem com cache."""
+        """Extrai o nome do usuário com o extrator em camadas (regras, heurística local, LLM) e cache."""
         # Verificação rápida para mensagens muito curtas
         if len(message.strip()) <= 2 or message.strip().lower() == "é":
             return None
             
         # Verificar cache
-        if message in self._name_cache:
-            return self._name_cache[message]
-                
-        try:
-            # Usar uma abordagem mais eficiente com uma única chamada à API
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",  # Modelo mais leve e rápido para esta tarefa
-                messages=[
-                    {"role": "system", "content": "Extraia apenas o primeiro nome da pessoa desta mensagem. Responda apenas com o nome, sem pontuação ou frases adicionais. Se não houver nome, responda 'Nenhum'."},
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=10  # Limitar tokens para resposta rápida
-            )
-            
-            extracted = response.choices[0].message.content.strip()
-            
-            # Validação do nome extraído
-            if extracted.lower() in ["nenhum", "none", "não há", "não encontrado"] or len(extracted) <= 2:
-                self._name_cache[message] = None
-                return None
-                
-            # Verificar palavras comuns
-            common_words = ["oi", "olá", "bom", "boa", "dia", "tarde", "noite", "é", "eh", "sim", "não", "nao"]
-            if extracted.lower() in common_words:
-                self._name_cache[message] = None
-                return None
-                
-            # Armazenar no cache
-            self._name_cache[message] = extracted
-            return extracted
-            
-        except Exception as e:
-            logger.error(f"Erro na extração de nome: {e}", exc_info=True)
+        found, cached_name = self._get_cached_name('message', message)
+        if found:
+            return cached_name
+        
+        extracted = self.name_extractor.extract(message, on_failure=UNRESOLVED)
+        if extracted is UNRESOLVED:
+            # Falha do LLM: não grava "sem nome" no cache, a próxima chamada tenta de novo
             return None
+        self._cache_name('message', message, extracted)
+        return extracted
+
+    def extract_names(self, messages: List[str]) -> List[Optional[str]]:
+        """Extrai nomes de várias mensagens; as ambíguas vão ao LLM em uma única requisição por lote."""
+        results: List[Optional[str]] = [None] * len(messages)
+        pending = []
+        for index, message in enumerate(messages):
+            found, cached_name = self._get_cached_name('message', message)
+            if found:
+                results[index] = cached_name
+            else:
+                pending.append(index)
+        extracted = self.name_extractor.extract_many([messages[i] for i in pending], on_failure=UNRESOLVED)
+        for index, name in zip(pending, extracted):
+            if name is UNRESOLVED:
+                continue
+            results[index] = name
+            self._cache_name('message', messages[index], name)
+        return results
     
     @lru_cache(maxsize=20)
     def generate_summary(self, messages_key: str) -> str:
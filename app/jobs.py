@@ -0,0 +1,87 @@
+# app/jobs.py
+"""
+Tarefas em segundo plano e o agendador que as executa.
+
+Todos os workers iniciam o agendador, mas cada tarefa só roda no líder.
+Tarefas que alteram o banco (retenção) usam a trava de arquivo no host e,
+se configurada, a trava consultiva no Postgres, ou seja, rodam uma vez por
+implantação. Tarefas sobre arquivos locais do host (cache compartilhado,
+fila do webhook, índice semântico, contadores de pontuação) usam só uma
+trava de arquivo e rodam uma vez em cada host. Novas tarefas são
+registradas em build_scheduler.
+"""
+import datetime
+import logging
+from app.models import supabase, Message
+from app.services.cache_service import get_shared_cache
+from app.services.search_service import WHATSAPP_MESSAGES_VERSION
+from app.services.semantic_index import get_semantic_index
+from app.services.version_service import watermarks
+from app.services.scheduler import FileLeaderLock, JobScheduler, LeaderElection, PostgresAdvisoryLock
+from app.whatsapp_handler import whatsapp_queue, whatsapp_retention_engine
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def delete_whatsapp_messages():
+    """Remove as mensagens do WhatsApp mais antigas que a janela de retenção, em lotes."""
+    progress = whatsapp_retention_engine().run()
+    if progress['deleted']:
+        watermarks.bump(*WHATSAPP_MESSAGES_VERSION)
+    logger.info(
+        f"Retenção do WhatsApp ({progress['status']}): {progress['deleted']} mensagens removidas "
+        f"em {progress['chunks']} lotes, {progress['duration_seconds']}s"
+    )
+
+def rollup_conversation_scores():
+    """Pré-calcula os contadores de pontuação dos usuários ativos no último dia no cache deste host."""
+    since = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+    users = supabase.table('usuarios_chatbot').select('id').gte('last_interaction', since).execute().data or []
+    for user in users:
+        Message.calculate_conversation_scores(user['id'])
+    logger.info(f"Pontuações de {len(users)} usuários ativos atualizadas")
+
+def sweep_caches():
+    """Remove entradas expiradas do cache compartilhado e chaves antigas de idempotência do webhook."""
+    expired = get_shared_cache().cleanup_expired()
+    keys = whatsapp_queue.prune_seen()
+    logger.info(f"Limpeza de caches: {expired} entradas expiradas, {keys} chaves de idempotência antigas")
+
+def forget_old_semantic_entries():
+    """Remove do índice semântico local as mensagens fora da janela de retenção."""
+    index = get_semantic_index()
+    if index is None:
+        return
+    # O corte é o mesmo da retenção; o índice é local, então cada host apara o seu
+    forgotten = index.forget_before(whatsapp_retention_engine().cutoff())
+    if forgotten:
+        logger.info(f"Índice semântico: {forgotten} mensagens antigas removidas")
+
+def leader_election() -> LeaderElection:
+    """Um líder por implantação: trava de arquivo e, se configurada, trava consultiva no Postgres."""
+    locks = [FileLeaderLock(Config.SCHEDULER_LOCK_PATH)]
+    if Config.SCHEDULER_PG_LOCK_DSN:
+        locks.append(PostgresAdvisoryLock(Config.SCHEDULER_PG_LOCK_DSN, Config.SCHEDULER_PG_LOCK_KEY))
+    return LeaderElection(locks)
+
+def host_election() -> LeaderElection:
+    """Um líder por host, para tarefas sobre arquivos locais."""
+    return LeaderElection([FileLeaderLock(Config.SCHEDULER_HOST_LOCK_PATH)])
+
+def build_scheduler() -> JobScheduler:
+    """Agendador com todas as tarefas periódicas registradas."""
+    scheduler = JobScheduler(leader_election(), cache=get_shared_cache())
+    host = host_election()
+    scheduler.register('delete_whatsapp_messages_job', delete_whatsapp_messages,
+                       minutes=Config.WHATSAPP_RETENTION_INTERVAL_MINUTES,
+                       name='Rolling retention of WhatsApp messages')
+    scheduler.register('conversation_score_rollup_job', rollup_conversation_scores,
+                       minutes=Config.SCORE_ROLLUP_INTERVAL_MINUTES,
+                       name='Conversation score rollup', election=host)
+    scheduler.register('cache_sweep_job', sweep_caches,
+                       minutes=Config.CACHE_SWEEP_INTERVAL_MINUTES,
+                       name='Shared cache sweep', election=host)
+    scheduler.register('semantic_index_retention_job', forget_old_semantic_entries,
+                       minutes=Config.WHATSAPP_RETENTION_INTERVAL_MINUTES,
+                       name='Semantic index retention', election=host)
+    return scheduler
@@ -6,9 +6,18 @@ import pytz
 import uuid
 from typing import Optional, Dict, List, Any, Union
 import logging
-from functools import lru_cache
+from flask import g, has_app_context
 from openai import OpenAI
+from postgrest.exceptions import APIError
 import os
+import base64
+import json
+from app.services.prompt_builder import PromptBudgetBuilder
+from app.services.version_service import watermarks
+from app.services.cache_service import get_shared_cache
+from app.services.login_service import SupabaseLoginService
+from app.services.activity_coalescer import ActivityCoalescer
+from app.services.conversation_scoring import conversation_scorer
 
 # Configuração do logger
 logging.basicConfig(level=logging.INFO)
@@ -29,6 +38,9 @@ except Exception as e:
     # Criar uma instância vazia do cliente para evitar erros de importação
     supabase = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
 
+# Versões de thread/usuário dos ETags lidas do banco (scripts/sql/009_content_versions.sql)
+watermarks.attach(lambda: supabase)
+
 # Inicialização do cliente OpenAI
 try:
     client = OpenAI(api_key=Config.OPENAI_API_KEY)
@@ -38,11 +50,84 @@ except Exception as e:
     # Criar uma instância vazia para evitar erros de importação
     client = None
 
+# Falso quando touch_last_interactions não existe (scripts/sql/002_touch_last_interactions.sql não aplicado)
+_touch_rpc_available = True
+
+def _write_last_interactions(rows: List[Dict[str, str]]) -> None:
+    """Grava em lote os timestamps de última interação acumulados pelo coalescer."""
+    global _touch_rpc_available
+    if _touch_rpc_available:
+        try:
+            supabase.rpc('touch_last_interactions', {'p_rows': rows}).execute()
+            return
+        except APIError as e:
+            if e.code != FUNCTION_NOT_FOUND:
+                raise
+            _touch_rpc_available = False
+            logger.error("Função touch_last_interactions não existe: aplique "
+                         "scripts/sql/002_touch_last_interactions.sql. Gravando um usuário por vez")
+    for row in rows:
+        # Como na função: nunca recua um last_interaction mais recente
+        supabase.table('usuarios_chatbot').update({'last_interaction': row['last_interaction']})\
+            .eq('id', row['id'])\
+            .or_(f'last_interaction.is.null,last_interaction.lt."{row["last_interaction"]}"')\
+            .execute()
+
+# Acumula as atualizações de last_interaction e grava em lote a cada intervalo
+last_interaction_coalescer = ActivityCoalescer(
+    _write_last_interactions,
+    interval=Config.LAST_INTERACTION_FLUSH_INTERVAL
+)
+
+# IDs de usuários cuja existência já foi confirmada neste processo. A garantia
+# definitiva é a FK mensagens_chatbot.user_id (scripts/sql/004_mensagens_user_fk.sql);
+# o conjunto só evita consultas antes de cada insert.
+_known_user_ids = set()
+_KNOWN_USERS_MAX = 100000
+
+# Código do Postgres para violação de chave estrangeira
+FOREIGN_KEY_VIOLATION = '23503'
+
+# Código do PostgREST para função inexistente (migração de scripts/sql ainda não aplicada)
+FUNCTION_NOT_FOUND = 'PGRST202'
+
+# Colunas de mensagens efetivamente usadas pela interface de chat
+HISTORY_COLUMNS = 'id,role,content,timestamp,user_name'
+
+def encode_history_cursor(message: Dict) -> Optional[str]:
+    """Gera um cursor opaco (timestamp + id) a partir de uma mensagem."""
+    if not message or message.get('id') is None or not message.get('timestamp'):
+        return None
+    raw = json.dumps([message['timestamp'], message['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_history_cursor(cursor: str) -> tuple:
+    """Decodifica um cursor gerado por encode_history_cursor.
+
+    Raises:
+        ValueError: se o cursor for inválido
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        # Os valores entram no filtro or_ do PostgREST: só um id inteiro e um
+        # timestamp ISO-8601 válido são aceitos
+        if not isinstance(message_id, int) or isinstance(message_id, bool) or not isinstance(timestamp, str):
+            raise ValueError
+        datetime.datetime.fromisoformat(timestamp)
+        return timestamp, message_id
+    except Exception:
+        raise ValueError(f"Cursor inválido: {cursor}")
+
 class Auth:
+    # Pipeline de login em uma única ida ao banco (RPC login_user)
+    login_service = SupabaseLoginService(supabase)
+    # Falso quando login_user não existe (scripts/sql/001_login_user.sql não aplicado)
+    login_rpc_available = True
+
     @staticmethod
-    
-    def verify_credentials(email: str, password: str) -> bool:
-        """Verifica credenciais com validação aprimorada."""
+    def _validate_format(email: str, password: str) -> bool:
+        """Valida o formato de email e senha antes de consultar o banco."""
         # Validar formato de email
         if not email or '@' not in email or '.' not in email:
             logger.warning(f"Tentativa de login com email inválido: {email}")
@@ -52,6 +137,56 @@ class Auth:
         if not password or len(password) < 6:
             logger.warning(f"Tentativa de login com senha inválida para: {email}")
             return False
+        return True
+
+    @staticmethod
+    def login(email: str, password: str) -> Optional[Dict]:
+        """
+        Verifica as credenciais, cria ou atualiza o usuário e incrementa o contador
+        de login em uma única chamada ao banco.
+        
+        Returns:
+            A linha do usuário em usuarios_chatbot ou None se as credenciais forem inválidas
+        """
+        if not Auth._validate_format(email, password):
+            return None
+        if not Auth.login_rpc_available:
+            return Auth._login_without_rpc(email, password)
+        try:
+            user = Auth.login_service.login(email, password)
+        except APIError as e:
+            if e.code != FUNCTION_NOT_FOUND:
+                logger.error(f"Erro ao executar login: {e}")
+                return None
+            Auth.login_rpc_available = False
+            logger.error("Função login_user não existe: aplique scripts/sql/001_login_user.sql. "
+                         "Usando o login em várias consultas")
+            return Auth._login_without_rpc(email, password)
+        except Exception as e:
+            logger.error(f"Erro ao executar login: {e}")
+            return None
+        if user:
+            User.cache_profile(user)
+            watermarks.bump_user(user['id'])
+        return user
+
+    @staticmethod
+    def _login_without_rpc(email: str, password: str) -> Optional[Dict]:
+        """Login anterior à função login_user: verifica as credenciais e cria/atualiza o usuário."""
+        if not Auth.verify_credentials(email, password):
+            return None
+        user = User.get_or_create_by_email(email)
+        if not user or 'error' in user:
+            return None
+        User.cache_profile(user)
+        watermarks.bump_user(user['id'])
+        return user
+
+    @staticmethod
+    def verify_credentials(email: str, password: str) -> bool:
+        """Verifica credenciais com validação aprimorada."""
+        if not Auth._validate_format(email, password):
+            return False
         
         # Continuar com a verificação no banco de dados...
         try:
@@ -67,14 +202,89 @@ class Auth:
             return False
 
 class User:
+    @staticmethod
+    def _profile_cache_key(user_id: str) -> str:
+        return f"user_profile:{user_id}"
+
+    @staticmethod
+    def _request_profiles() -> Optional[Dict[str, Dict]]:
+        """Perfis já lidos durante a requisição atual (None fora de um contexto Flask)."""
+        if not has_app_context():
+            return None
+        if not hasattr(g, '_user_profiles'):
+            g._user_profiles = {}
+        return g._user_profiles
+
+    @staticmethod
+    def cache_profile(user: Dict) -> None:
+        """Armazena a linha de usuarios_chatbot no cache da requisição e no cache compartilhado."""
+        if not user or 'id' not in user:
+            return
+        profiles = User._request_profiles()
+        if profiles is not None:
+            profiles[user['id']] = user
+        User.remember(user['id'])
+        get_shared_cache().set(User._profile_cache_key(user['id']), user, ttl=Config.USER_PROFILE_CACHE_TTL)
+
+    @staticmethod
+    def remember(user_id: str) -> None:
+        """Marca o usuário como existente no conjunto local de usuários conhecidos."""
+        if not user_id:
+            return
+        if len(_known_user_ids) >= _KNOWN_USERS_MAX:
+            _known_user_ids.clear()
+        _known_user_ids.add(user_id)
+
+    @staticmethod
+    def forget(user_id: str) -> None:
+        _known_user_ids.discard(user_id)
+
+    @staticmethod
+    def is_known(user_id: str) -> bool:
+        """Indica se o usuário existe, sem ida ao banco quando já foi visto neste processo."""
+        if not user_id or user_id in _known_user_ids:
+            return True
+        # Perfil costuma já estar no cache da requisição ou no cache compartilhado
+        return User.get_profile(user_id) is not None
+
+    @staticmethod
+    def invalidate_profile(user_id: str) -> None:
+        """Remove o perfil do usuário dos caches (chamado após qualquer escrita)."""
+        profiles = User._request_profiles()
+        if profiles is not None:
+            profiles.pop(user_id, None)
+        get_shared_cache().delete(User._profile_cache_key(user_id))
+
+    @staticmethod
+    def get_profile(user_id: str) -> Optional[Dict]:
+        """
+        Obtém a linha completa do usuário, consultando o Supabase no máximo uma vez por requisição.
+        
+        Ordem de busca: cache da requisição (flask.g), cache compartilhado com TTL, Supabase.
+        """
+        if not user_id:
+            return None
+        profiles = User._request_profiles()
+        if profiles is not None and user_id in profiles:
+            return profiles[user_id]
+        
+        user = get_shared_cache().get(User._profile_cache_key(user_id))
+        if user is not None:
+            if profiles is not None:
+                profiles[user_id] = user
+            return user
+        
+        response = supabase.table('usuarios_chatbot').select('*').eq('id', user_id).execute()
+        if not response.data:
+            return None
+        User.cache_profile(response.data[0])
+        return response.data[0]
+
     @staticmethod
     def get_by_id(user_id: str) -> Optional[Dict]:
         """Obtém um usuário pelo ID."""
         try:
-            response = supabase.table('usuarios_chatbot').select('*').eq('id', user_id).execute()
-            if response.data:
-                return response.data[0]
-            return None
+            return User.get_profile(user_id)
         except Exception as e:
             logger.error(f"Erro ao obter usuário por ID: {str(e)}")
             return None
@@ -104,6 +314,7 @@ class User:
             response = supabase.table('usuarios_chatbot').insert(user_data).execute()
             if response.data:
                 logger.info(f"Usuário criado com sucesso: {response.data[0]}")
+                User.cache_profile(response.data[0])
                 return response.data[0]
             return None
         except Exception as e:
@@ -123,6 +334,7 @@ class User:
             
             # Atualizar o thread_id
             response_update = supabase.table('usuarios_chatbot').update(update_data).eq('id', user_id).execute()
+            User.invalidate_profile(user_id)
             # Check for error attribute or status code
             if hasattr(response_update, 'error') and response_update.error:
                 logger.error(f"Erro ao atualizar thread_id para usuário {user_id}: {response_update.error}")
@@ -134,11 +346,11 @@ class User:
                 logger.error(f"Nenhum dado retornado ao atualizar thread_id para usuário {user_id}")
                 return False
             
-            # Verificar se a atualização foi aplicada buscando o usuário atualizado
-            response = supabase.table('usuarios_chatbot').select('*').eq('id', user_id).execute()
-            logger.debug(f"Resposta da verificação de atualização para usuário {user_id}: {response.data}")
+            # Verificar se a atualização foi aplicada buscando o usuário atualizado (recarrega o cache)
+            user = User.get_profile(user_id)
+            logger.debug(f"Resposta da verificação de atualização para usuário {user_id}: {user}")
             
-            if not response.data:
+            if not user:
                 logger.error(f"Falha ao recuperar usuário após atualização do thread_id para usuário {user_id}")
                 return False
                 
@@ -164,20 +376,16 @@ class User:
 
     @staticmethod
     def update_last_interaction(user_id: str, chatbot_type: str) -> bool:
-        logger.info(f"Atualizando última interação para usuário: {user_id}, tipo: {chatbot_type}")
-        current_time = datetime.datetime.now(TIMEZONE).isoformat()
+        """
+        Registra a última interação do usuário.
+        
+        A escrita é adiada: o timestamp fica em memória e é gravado em lote pelo
+        last_interaction_coalescer (precisão de LAST_INTERACTION_FLUSH_INTERVAL segundos).
+        """
+        logger.debug(f"Registrando última interação para usuário: {user_id}, tipo: {chatbot_type}")
         try:
-            response = supabase.table('usuarios_chatbot').update({
-                'last_interaction': current_time
-            }).eq('id', user_id).execute()
-            
-            if response.data:
-                logger.info(f"Última interação atualizada com sucesso: {response.data}")
-                return True
-            else:
-                logger.warning(f"Nenhum dado retornado ao atualizar última interação para usuário {user_id}")
-                return False
-                
+            last_interaction_coalescer.record(user_id, chatbot_type)
+            return True
         except Exception as e:
             logger.error(f"Erro ao atualizar última interação: {str(e)}")
             return False
@@ -225,6 +433,8 @@ class User:
                 'login_count': new_count,
                 'last_interaction': datetime.datetime.now(TIMEZONE).isoformat()
             }).eq('id', user_id).execute()
+            User.invalidate_profile(user_id)
+            watermarks.bump_user(user_id)
         
             logger.info(f"Contador de login incrementado: {update_response.data}")
             return update_response.data[0] if update_response.data else None
@@ -233,26 +443,24 @@ class User:
             return None
 
     @staticmethod
-    @lru_cache(maxsize=100)
     def get_thread_id(user_id: str, chatbot_type: str) -> Optional[str]:
-        """Obtém o thread_id do usuário com cache para reduzir consultas."""
+        """Obtém o thread_id do usuário a partir do perfil em cache."""
         try:
-            response = supabase.table('usuarios_chatbot').select(f'thread_id_{chatbot_type}').eq('id', user_id).execute()
-            if response.data:
-                return response.data[0][f'thread_id_{chatbot_type}']
+            user = User.get_profile(user_id)
+            if user:
+                return user.get(f'thread_id_{chatbot_type}')
             return None
         except Exception as e:
             logger.error(f"Erro ao obter thread_id: {e}")
             return None
 
     @staticmethod
-    @lru_cache(maxsize=100)
     def get_name(user_id: str) -> str:
-        """Obtém o nome do usuário com cache para reduzir consultas."""
+        """Obtém o nome do usuário a partir do perfil em cache."""
         try:
-            response = supabase.table('usuarios_chatbot').select('name').eq('id', user_id).execute()
-            if response.data and response.data[0]['name'] not in ["Usuário Anônimo", "Nenhum nome encontrado"]:
-                return response.data[0]['name']
+            user = User.get_profile(user_id)
+            if user and user.get('name') not in ["Usuário Anônimo", "Nenhum nome encontrado"]:
+                return user['name']
             return "Usuário Anônimo"
         except Exception as e:
             logger.error(f"Erro ao obter nome do usuário: {e}")
@@ -267,7 +475,7 @@ class User:
             logger.debug(f"Resposta do Supabase ao atualizar nome: {response}")
             
             # Invalidar o cache
-            User.get_name.cache_clear()
+            User.invalidate_profile(user_id)
             
             if response.data:
                 logger.info(f"Nome do usuário atualizado com sucesso no Supabase: {name}")
@@ -280,13 +488,12 @@ class User:
             return None
         
     @staticmethod
-    @lru_cache(maxsize=100)
     def get_login_count(user_id: str) -> int:
-        """Obtém a contagem de logins com cache."""
+        """Obtém a contagem de logins a partir do perfil em cache."""
         try:
-            response = supabase.table('usuarios_chatbot').select('login_count').eq('id', user_id).execute()
-            if response.data:
-                return response.data[0]['login_count']
+            user = User.get_profile(user_id)
+            if user:
+                return user.get('login_count')
             return 0
         except Exception as e:
             logger.error(f"Erro ao obter contagem de logins: {e}")
@@ -299,9 +506,8 @@ class User:
             supabase.table('usuarios_chatbot').delete().eq('id', user_id).execute()
             
             # Limpar caches
-            User.get_name.cache_clear()
-            User.get_thread_id.cache_clear()
-            User.get_login_count.cache_clear()
+            User.invalidate_profile(user_id)
+            User.forget(user_id)
             
             logger.info(f"Usuário {user_id} deletado com sucesso")
             return True
@@ -309,58 +515,283 @@ class User:
             logger.error(f"Erro ao deletar usuário {user_id}: {str(e)}")
             return False
 
+class ThreadDisplayName:
+    """Nome de exibição do usuário, armazenado uma única vez por thread."""
+
+    # Nomes que não devem substituir o nome armazenado
+    PLACEHOLDER_NAMES = ("", "Usuário Anônimo", "Nenhum nome encontrado")
+
+    # View de mensagens_chatbot com o nome de exibição da thread (scripts/sql/003_thread_display_names.sql)
+    VIEW = 'mensagens_chatbot_nomes'
+    VIEW_MISSING = {'42P01', '42703', 'PGRST205'}
+    view_available = True
+
+    @staticmethod
+    def get(thread_id: str) -> Optional[str]:
+        """Obtém o nome de exibição da thread (None se ainda não houver)."""
+        if not thread_id:
+            return None
+        try:
+            response = supabase.table('thread_display_names').select('display_name').eq('thread_id', thread_id).limit(1).execute()
+            if response.data:
+                return response.data[0]['display_name']
+            return None
+        except Exception as e:
+            logger.error(f"Erro ao obter nome de exibição da thread {thread_id}: {str(e)}")
+            return None
+
+    @staticmethod
+    def set(thread_id: str, display_name: str, user_id: str = None) -> bool:
+        """Grava o nome de exibição da thread com um único upsert."""
+        if not thread_id or (display_name or "").strip() in ThreadDisplayName.PLACEHOLDER_NAMES:
+            return False
+        try:
+            record = {
+                'thread_id': thread_id,
+                'display_name': display_name.strip(),
+                'updated_at': datetime.datetime.now(TIMEZONE).isoformat()
+            }
+            if user_id:
+                record['user_id'] = user_id
+            supabase.table('thread_display_names').upsert(record, on_conflict='thread_id').execute()
+            watermarks.bump_thread(thread_id)
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao gravar nome de exibição da thread {thread_id}: {str(e)}", exc_info=True)
+            return False
+
+    @staticmethod
+    def fetch(thread_id: str, columns: str, build) -> List[Dict]:
+        """
+        Lê mensagens do thread já com o nome de exibição, numa única consulta.
+        
+        `build(query)` aplica filtros, ordem e limite sobre o select de `columns`.
+        A leitura vai para a view, que traz display_name junto de cada linha; sem
+        a migração, lê mensagens_chatbot e aplica o nome com uma segunda consulta.
+        """
+        if ThreadDisplayName.view_available:
+            view_columns = columns if columns == '*' else f'{columns},display_name'
+            try:
+                rows = build(supabase.table(ThreadDisplayName.VIEW).select(view_columns)).execute().data or []
+                for msg in rows:
+                    display_name = msg.pop('display_name', None)
+                    if display_name and msg.get('role') == 'user':
+                        msg['user_name'] = display_name
+                return rows
+            except APIError as e:
+                if e.code not in ThreadDisplayName.VIEW_MISSING:
+                    raise
+                ThreadDisplayName.view_available = False
+                logger.error(f"View {ThreadDisplayName.VIEW} não existe: aplique "
+                             "scripts/sql/003_thread_display_names.sql. Lendo o nome em uma consulta separada")
+        rows = build(supabase.table('mensagens_chatbot').select(columns)).execute().data or []
+        return ThreadDisplayName.apply(thread_id, rows)
+
+    @staticmethod
+    def apply(thread_id: str, messages: List[Dict]) -> List[Dict]:
+        """Preenche user_name das mensagens do usuário com o nome de exibição atual da thread."""
+        if not any(msg.get('role') == 'user' for msg in messages):
+            return messages
+        display_name = ThreadDisplayName.get(thread_id)
+        if display_name:
+            for msg in messages:
+                if msg.get('role') == 'user':
+                    msg['user_name'] = display_name
+        return messages
+
 # app/models.py (continuação da classe Message)
 class Message:
+    @staticmethod
+    def _build_row(thread_id: str, role: str, content: str, user_id: str = None,
+                   chatbot_type: str = None, user_name: str = None, timestamp: str = None) -> Dict:
+        """Monta a linha de mensagens_chatbot; o nome do usuário vem sempre do chamador."""
+        if role == "assistant":
+            # Mensagens do assistente têm nome específico baseado no tipo de chatbot
+            if chatbot_type == 'treinamento' or chatbot_type == 'novo':
+                user_name = "IA Treinamento de Vendas"
+            else:
+                user_name = "IA Especialista em Vendas"
+        elif role == "user" and (user_name is None or user_name.strip() == ""):
+            user_name = "Usuário Anônimo"
+        return {
+            'thread_id': thread_id,
+            'role': role,
+            'content': content,
+            'timestamp': timestamp or datetime.datetime.now(TIMEZONE).isoformat(),
+            'chatbot_type': chatbot_type,
+            'user_name': user_name,
+            'user_id': user_id
+        }
+
+    @staticmethod
+    def _after_insert(rows: List[Dict]) -> None:
+        for thread_id in {row['thread_id'] for row in rows}:
+            watermarks.bump_thread(thread_id)
+        for user_id in {row['user_id'] for row in rows if row.get('user_id')}:
+            watermarks.bump_user(user_id)
+            User.remember(user_id)
+
+    # Contadores de pontuação em cache (calculate_conversation_scores). Cada
+    # gravação de mensagens incrementa "started" antes do insert e "finished"
+    # depois; a entrada em cache guarda o "finished" que ela reflete (as_of).
+    # Quem monta os contadores a partir do banco só os grava se nenhuma
+    # gravação estava em andamento nem começou durante a leitura; cada
+    # gravação concluída soma suas mensagens à entrada, na mesma transação
+    # do cache, ou a descarta se ela não estiver em dia. Exclusões descartam
+    # a entrada e marcam uma gravação concluída.
+    # Esses contadores só enxergam as gravações deste host. Por isso a entrada
+    # também guarda a versão do usuário em content_versions (db_version), que
+    # os gatilhos do banco incrementam a cada instrução em mensagens_chatbot,
+    # venha de onde vier: a entrada só vale enquanto a versão for a mesma, e
+    # uma gravação deste host só a atualiza se a versão avançou exatamente
+    # um passo (o da própria instrução).
+    @staticmethod
+    def _conversation_stats_key(user_id: str) -> str:
+        return f"conversation_stats:{user_id}"
+
+    @staticmethod
+    def _stats_counter_keys(user_id: str) -> tuple:
+        return f"conversation_stats:started:{user_id}", f"conversation_stats:finished:{user_id}"
+
+    @staticmethod
+    def _begin_stats_write(user_ids) -> None:
+        """Marca gravações em andamento para os usuários (antes de tocar no banco)."""
+        try:
+            cache = get_shared_cache()
+            with cache.transaction():
+                for user_id in user_ids:
+                    cache.incr(Message._stats_counter_keys(user_id)[0])
+                    cache.set(f"conversation_stats:writing:{user_id}", True, ttl=Config.CONVERSATION_STATS_WRITE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Erro ao marcar gravação nos contadores de pontuação: {str(e)}")
+
+    @staticmethod
+    def _end_stats_write(user_ids, rows: Optional[List[Dict]] = None) -> None:
+        """Conclui as gravações: soma `rows` às entradas em dia e descarta as demais."""
+        try:
+            cache = get_shared_cache()
+            # Lidas fora da transação para não segurar o cache durante a consulta
+            versions = {}
+            if rows is not None:
+                for user_id in user_ids:
+                    entry = cache.get(Message._conversation_stats_key(user_id))
+                    if entry and entry.get('db_version') is not None:
+                        versions[user_id] = watermarks.database_version('user', user_id)
+            with cache.transaction():
+                for user_id in user_ids:
+                    key = Message._conversation_stats_key(user_id)
+                    finished = cache.incr(Message._stats_counter_keys(user_id)[1])
+                    entry = cache.get(key)
+                    if rows is None or not entry or entry.get('as_of') != finished - 1:
+                        cache.delete(key)
+                        continue
+                    if entry.get('db_version') is not None:
+                        # Outro avanço além do deste insert: houve escrita em outro host
+                        if versions.get(user_id) != entry['db_version'] + 1:
+                            cache.delete(key)
+                            continue
+                        entry['db_version'] = versions[user_id]
+                    for row in rows:
+                        if row.get('user_id') == user_id:
+                            conversation_scorer.add(entry['stats'], row['role'], row['content'])
+                    entry['as_of'] = finished
+                    cache.set(key, entry, ttl=Config.CONVERSATION_STATS_TTL)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar contadores de pontuação: {str(e)}")
+
+    @staticmethod
+    def _invalidate_conversation_stats(user_ids) -> None:
+        """Descarta os contadores em cache após excluir mensagens desses usuários."""
+        user_ids = {user_id for user_id in user_ids if user_id}
+        if user_ids:
+            Message._begin_stats_write(user_ids)
+            Message._end_stats_write(user_ids)
+
+    @staticmethod
+    def _insert_rows(payload: Union[Dict, List[Dict]]):
+        """Insere uma linha (ou lista de linhas) em mensagens_chatbot mantendo os contadores de pontuação em dia."""
+        rows = payload if isinstance(payload, list) else [payload]
+        user_ids = {row['user_id'] for row in rows if row.get('user_id')}
+        Message._begin_stats_write(user_ids)
+        inserted = False
+        try:
+            response = supabase.table('mensagens_chatbot').insert(payload).execute()
+            inserted = True
+            return response
+        finally:
+            # Em caso de falha o resultado é incerto: a entrada é descartada
+            Message._end_stats_write(user_ids, rows if inserted else None)
+
     @staticmethod
     def create(thread_id: str, role: str, content: str, user_id: str = None, 
                chatbot_type: str = None, user_name: str = None) -> Optional[Dict]:
-        """Cria uma nova mensagem no banco de dados."""
+        """
+        Cria uma nova mensagem no banco de dados com um único insert.
+        
+        A existência de user_id é garantida pela FK de mensagens_chatbot e pelo
+        conjunto local de usuários conhecidos; user_name deve ser informado pelo chamador.
+        """
         logger.info(f"Criando mensagem: thread_id={thread_id}, role={role}, user_id={user_id}, chatbot_type={chatbot_type}")
-        current_time = datetime.datetime.now(TIMEZONE).isoformat()
         try:
-            # Verificar se o user_id existe na tabela usuarios_chatbot
-            if user_id:
-                user_check = supabase.table('usuarios_chatbot').select('id').eq('id', user_id).execute()
-                if not user_check.data:
-                    logger.error(f"Falha ao criar mensagem: user_id {user_id} não existe na tabela usuarios_chatbot")
-                    return None
-
-            # Define valores corretos para user_name baseado no role e chatbot_type
-            if role == "assistant":
-                # Mensagens do assistente têm nome específico baseado no tipo de chatbot
-                if chatbot_type == 'treinamento' or chatbot_type == 'novo':
-                    user_name = "IA Treinamento de Vendas"
-                else:
-                    user_name = "IA Especialista em Vendas"
-            elif role == "user" and user_id and (user_name is None or user_name.strip() == ""):
-                # Se user_name não informado para usuário, tenta buscar do banco
-                try:
-                    response = supabase.table('usuarios_chatbot').select('name').eq('id', user_id).execute()
-                    if response.data and response.data[0]['name'] and response.data[0]['name'].strip():
-                        user_name = response.data[0]['name']
-                    else:
-                        # Se não encontrou ou está vazio, deixa como Usuário Anônimo
-                        user_name = "Usuário Anônimo"
-                except Exception as e:
-                    logger.error(f"Erro ao obter nome do usuário para mensagem: {e}")
-                    user_name = "Usuário Anônimo"
-
-            message_data = {
-                'thread_id': thread_id,
-                'role': role,
-                'content': content,
-                'timestamp': current_time,
-                'chatbot_type': chatbot_type,
-                'user_name': user_name,
-                'user_id': user_id
-            }
-            response = supabase.table('mensagens_chatbot').insert(message_data).execute()
+            if user_id and not User.is_known(user_id):
+                logger.error(f"Falha ao criar mensagem: user_id {user_id} não existe na tabela usuarios_chatbot")
+                return None
+
+            message_data = Message._build_row(thread_id, role, content, user_id, chatbot_type, user_name)
+            response = Message._insert_rows(message_data)
             logger.debug(f"Mensagem criada: {response.data}")
+            Message._after_insert([message_data])
             return response.data[0] if response.data else None
+        except APIError as e:
+            if e.code == FOREIGN_KEY_VIOLATION:
+                logger.error(f"Falha ao criar mensagem: user_id {user_id} não existe na tabela usuarios_chatbot")
+                User.forget(user_id)
+            else:
+                logger.error(f"Erro ao criar mensagem: {str(e)}", exc_info=True)
+            return None
         except Exception as e:
             logger.error(f"Erro ao criar mensagem: {str(e)}", exc_info=True)
             return None
 
+    @staticmethod
+    def create_many(messages: List[Dict]) -> List[Dict]:
+        """
+        Cria várias mensagens com um único insert em lote.
+        
+        Args:
+            messages: dicionários com as mesmas chaves aceitas por create
+                (thread_id, role, content, user_id, chatbot_type, user_name e,
+                opcionalmente, timestamp)
+            
+        Returns:
+            List[Dict]: linhas criadas (vazia em caso de erro)
+        """
+        if not messages:
+            return []
+        try:
+            rows = [
+                Message._build_row(
+                    msg['thread_id'], msg['role'], msg['content'], msg.get('user_id'),
+                    msg.get('chatbot_type'), msg.get('user_name'), msg.get('timestamp')
+                )
+                for msg in messages
+            ]
+            response = Message._insert_rows(rows)
+            Message._after_insert(rows)
+            logger.info(f"{len(rows)} mensagens criadas em lote")
+            return response.data or []
+        except APIError as e:
+            if e.code == FOREIGN_KEY_VIOLATION:
+                logger.error("Falha ao criar mensagens em lote: user_id não existe na tabela usuarios_chatbot")
+                for user_id in {msg.get('user_id') for msg in messages if msg.get('user_id')}:
+                    User.forget(user_id)
+            else:
+                logger.error(f"Erro ao criar mensagens em lote: {str(e)}", exc_info=True)
+            return []
+        except Exception as e:
+            logger.error(f"Erro ao criar mensagens em lote: {str(e)}", exc_info=True)
+            return []
+
     @staticmethod
     def clear_thread_history(thread_id: str, user_id: str = None, chatbot_type: str = None) -> bool:
         """
@@ -392,6 +823,12 @@ class Message:
             # Executar a query
             response = query.execute()
             
+            watermarks.bump_thread(thread_id)
+            # Sem user_id, os autores vêm das linhas removidas (o delete devolve a representação)
+            Message._invalidate_conversation_stats(
+                [user_id] if user_id else [row.get('user_id') for row in response.data or []]
+            )
+            
             # Registrar resultado
             deleted_count = len(response.data) if response.data else 0
             logger.info(f"Histórico de mensagens limpo para thread_id={thread_id}: {deleted_count} mensagens removidas")
@@ -410,88 +847,264 @@ class Message:
     def get_messages(thread_id: str, chatbot_type: str = None) -> List[Dict]:
         """Recupera mensagens com base no thread_id e chatbot_type."""
         try:
-            query = supabase.table('mensagens_chatbot').select('*').eq('thread_id', thread_id)
+            def build(query):
+                query = query.eq('thread_id', thread_id)
+                if chatbot_type:
+                    query = query.eq('chatbot_type', chatbot_type)
+                return query.order('timestamp', desc=False)
             
-            if chatbot_type:
-                query = query.eq('chatbot_type', chatbot_type)
-                
-            query = query.order('timestamp', desc=False)
-            response = query.execute()
-            
-            return response.data if response.data else []
+            return ThreadDisplayName.fetch(thread_id, '*', build)
         except Exception as e:
             logger.error(f"Erro ao recuperar mensagens: {str(e)}", exc_info=True)
             return []
 
     @staticmethod
-    def update_user_name(thread_id: str, user_id: str, new_name: str) -> bool:
-        """Atualiza o nome do usuário em todas as mensagens de um thread."""
+    def get_window(thread_id: str, size: int) -> List[Dict]:
+        """
+        Recupera as últimas `size` mensagens do thread em ordem cronológica.
+        
+        Usa o índice (thread_id, timestamp desc, id desc) com limit, sem ler o thread inteiro.
+        """
         try:
-            # Atualizar apenas mensagens do usuário específico
-            response = supabase.table('mensagens_chatbot').update({
-                'user_name': new_name
-            }).eq('thread_id', thread_id).eq('user_id', user_id).execute()
-            
-            logger.info(f"Nome do usuário atualizado em {len(response.data) if response.data else 0} mensagens")
-            return True
+            rows = ThreadDisplayName.fetch(
+                thread_id, '*',
+                lambda query: query.eq('thread_id', thread_id).order('timestamp', desc=True).order('id', desc=True).limit(size)
+            )
+            return list(reversed(rows))
         except Exception as e:
-            logger.error(f"Erro ao atualizar nome do usuário nas mensagens: {str(e)}", exc_info=True)
-            return False
+            logger.error(f"Erro ao recuperar janela de mensagens: {str(e)}", exc_info=True)
+            return []
+
+    # Falso quando trim_thread_history não existe no banco
+    _trim_rpc_available = True
+    TRIM_FALLBACK_BATCH = 500
+
+    @staticmethod
+    def _trim_by_id(thread_id: str, keep: int) -> List[Dict]:
+        """Remoção sem a função do banco; devolve as mesmas linhas {user_id, deleted}."""
+        boundary = supabase.table('mensagens_chatbot').select('id,timestamp').eq('thread_id', thread_id)\
+            .order('timestamp', desc=True).order('id', desc=True)\
+            .range(max(keep, 1) - 1, max(keep, 1) - 1).execute().data
+        if not boundary:
+            return []
+        timestamp, message_id = boundary[0]['timestamp'], boundary[0]['id']
+        older = supabase.table('mensagens_chatbot').select('id,user_id').eq('thread_id', thread_id)\
+            .or_(f'timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",id.lt.{message_id})')\
+            .order('timestamp').order('id').limit(Message.TRIM_FALLBACK_BATCH).execute().data or []
+        if not older:
+            return []
+        supabase.table('mensagens_chatbot').delete().in_('id', [row['id'] for row in older]).execute()
+        counts: Dict[Optional[str], int] = {}
+        for row in older:
+            counts[row.get('user_id')] = counts.get(row.get('user_id'), 0) + 1
+        return [{'user_id': user_id, 'deleted': count} for user_id, count in counts.items()]
+
+    @staticmethod
+    def trim_thread_history(thread_id: str, keep: int) -> int:
+        """
+        Remove as mensagens mais antigas que a janela das `keep` mais recentes.
+        
+        Um único delete por faixa no banco (função trim_thread_history); as
+        mensagens dentro da janela nunca são apagadas ou reinseridas. Sem a
+        função (scripts/sql/005_thread_history_window.sql), remove por id até
+        TRIM_FALLBACK_BATCH mensagens por chamada.
+        
+        Returns:
+            int: número de mensagens removidas
+        """
+        try:
+            if Message._trim_rpc_available:
+                try:
+                    response = supabase.rpc('trim_thread_history', {'p_thread_id': thread_id, 'p_keep': keep}).execute()
+                    # Uma linha por autor das mensagens removidas: {user_id, deleted}
+                    rows = response.data or []
+                except APIError as e:
+                    if e.code != FUNCTION_NOT_FOUND:
+                        raise
+                    Message._trim_rpc_available = False
+                    logger.error("Função trim_thread_history não existe: aplique "
+                                 "scripts/sql/005_thread_history_window.sql. Removendo por id, em lotes")
+            if not Message._trim_rpc_available:
+                rows = Message._trim_by_id(thread_id, keep)
+            deleted = sum(row.get('deleted') or 0 for row in rows)
+            if deleted:
+                watermarks.bump_thread(thread_id)
+                Message._invalidate_conversation_stats(row.get('user_id') for row in rows)
+                logger.info(f"Histórico do thread {thread_id} reduzido: {deleted} mensagens antigas removidas")
+            return deleted
+        except Exception as e:
+            logger.error(f"Erro ao reduzir histórico do thread {thread_id}: {str(e)}", exc_info=True)
+            return 0
+
+    @staticmethod
+    def get_messages_page(thread_id: str, chatbot_type: str = None, before: str = None,
+                          after: str = None, since: str = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        Recupera uma página do histórico usando paginação por cursor (timestamp + id).
+        
+        Args:
+            thread_id: ID do thread
+            chatbot_type: Tipo de chatbot (opcional)
+            before: Cursor; retorna as mensagens anteriores a ele (rolagem para cima)
+            after: Cursor; retorna as mensagens posteriores a ele (avanço de página)
+            since: Cursor ou timestamp ISO; retorna apenas as mensagens novas (sincronização delta)
+            limit: Tamanho máximo da página
+            
+        Returns:
+            Dicionário com 'messages' em ordem cronológica, 'has_more',
+            'prev_cursor' (mais antiga da página) e 'next_cursor' (mais recente)
+            
+        Raises:
+            ValueError: se um cursor for inválido ou mais de um modo for informado
+        """
+        if sum(1 for value in (before, after, since) if value) > 1:
+            raise ValueError("Use apenas um dentre before, after e since")
+        
+        descending = not (after or since)
+        # Cursores validados antes de qualquer consulta
+        keyset, since_timestamp = None, None
+        if before or after:
+            timestamp, message_id = decode_history_cursor(before or after)
+            op = 'lt' if before else 'gt'
+            keyset = f'timestamp.{op}."{timestamp}",and(timestamp.eq."{timestamp}",id.{op}.{message_id})'
+        elif since:
+            try:
+                timestamp, message_id = decode_history_cursor(since)
+                keyset = f'timestamp.gt."{timestamp}",and(timestamp.eq."{timestamp}",id.gt.{message_id})'
+            except ValueError:
+                # Aceitar também um timestamp ISO simples
+                datetime.datetime.fromisoformat(since)
+                since_timestamp = since
+        
+        def build(query):
+            query = query.eq('thread_id', thread_id)
+            if chatbot_type:
+                query = query.eq('chatbot_type', chatbot_type)
+            if keyset:
+                query = query.or_(keyset)
+            elif since_timestamp:
+                query = query.gt('timestamp', since_timestamp)
+            # Buscar um item a mais para saber se existem outras páginas
+            return query.order('timestamp', desc=descending).order('id', desc=descending).limit(limit + 1)
+        
+        rows = ThreadDisplayName.fetch(thread_id, HISTORY_COLUMNS, build)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if descending:
+            rows.reverse()
+        
+        return {
+            'messages': rows,
+            'has_more': has_more,
+            'prev_cursor': encode_history_cursor(rows[0]) if rows else before,
+            'next_cursor': encode_history_cursor(rows[-1]) if rows else (after or since)
+        }
+
+    @staticmethod
+    def update_user_name(thread_id: str, user_id: str, new_name: str) -> bool:
+        """
+        Atualiza o nome do usuário exibido nas mensagens de um thread.
+        
+        O nome é gravado uma única vez em thread_display_names e aplicado às
+        mensagens na leitura, sem reescrever o histórico.
+        """
+        return ThreadDisplayName.set(thread_id, new_name, user_id=user_id)
+
+    # Respostas de contingência (serviço indisponível ou erro): não devem ser
+    # versionadas nem guardadas pelo navegador (ver /get_dashboard_data)
+    FALLBACK_SCORES = {"clareza": 50, "persuasao": 50, "conhecimento": 50, "empatia": 50, "resolucao": 50}
+    FEEDBACK_UNAVAILABLE = "O serviço de feedback da IA não está disponível no momento."
+    FEEDBACK_FAILED = "Não foi possível gerar feedback neste momento. Por favor, tente novamente mais tarde."
+    POSITIONING_UNAVAILABLE = "O serviço de análise de posicionamento não está disponível no momento."
+    POSITIONING_FAILED = "Não foi possível analisar seu posicionamento neste momento. Por favor, tente novamente mais tarde."
+
+    @staticmethod
+    def is_fallback(value: Any) -> bool:
+        """Indica se um valor do dashboard é uma resposta de contingência."""
+        if isinstance(value, str):
+            return value in (Message.FEEDBACK_UNAVAILABLE, Message.FEEDBACK_FAILED,
+                             Message.POSITIONING_UNAVAILABLE, Message.POSITIONING_FAILED)
+        return value is Message.FALLBACK_SCORES
 
     @staticmethod
     def calculate_conversation_scores(user_id: str) -> Dict:
-        """Calcula pontuações de conversas para um usuário com base em análise de sentimento."""
+        """
+        Calcula pontuações de conversas para um usuário com o pontuador local.
+        
+        Os contadores (léxico de vendas e estrutura dos turnos) ficam no cache
+        compartilhado e são atualizados a cada mensagem gravada; as mensagens
+        só são lidas do banco quando eles não estão em cache ou quando a versão
+        do usuário em content_versions mudou por escrita de outro host (ver
+        _conversation_stats_key).
+        """
         try:
-            # Obter todas as mensagens do usuário
-            response = supabase.table('mensagens_chatbot').select('*').eq('user_id', user_id).execute()
+            cache = get_shared_cache()
+            key = Message._conversation_stats_key(user_id)
+            started_key, finished_key = Message._stats_counter_keys(user_id)
+            with cache.transaction():
+                started, finished = cache.counter(started_key), cache.counter(finished_key)
+                entry = cache.get(key)
+                if started != finished and cache.get(f"conversation_stats:writing:{user_id}") is None:
+                    # Gravação que nunca terminou (worker morto): dá as pendentes por concluídas
+                    finished = cache.incr(finished_key, started - finished)
+                    cache.delete(key)
+                    entry = None
+            # None sem a migração 009: vale só o controle local
+            db_version = watermarks.database_version('user', user_id)
+            if entry and entry.get('as_of') == finished and entry.get('db_version') == db_version:
+                return conversation_scorer.score(entry['stats'])
+
+            # Mensagens em ordem cronológica, apenas as colunas usadas; a versão
+            # lida antes delas, se ficar para trás, só força um novo cálculo
+            response = supabase.table('mensagens_chatbot').select('role,content').eq('user_id', user_id).order('timestamp').execute()
+            stats = conversation_scorer.build_stats(response.data or [])
+            if started == finished:
+                with cache.transaction():
+                    # Só grava se nenhuma gravação começou durante a leitura do banco
+                    if cache.counter(started_key) == started:
+                        cache.set(key, {'as_of': finished, 'db_version': db_version, 'stats': stats},
+                                  ttl=Config.CONVERSATION_STATS_TTL)
             
-            if not response.data:
-                return {
-                    "clareza": 0,
-                    "persuasao": 0,
-                    "conhecimento": 0,
-                    "empatia": 0,
-                    "resolucao": 0
-                }
-                
-            # Implementação real usaria análise de sentimento ou LLM para avaliar as mensagens
-            # Esta é uma implementação simplificada para demonstração
-            messages = response.data
-            total_messages = len(messages)
-            
-            if total_messages == 0:
-                return {
-                    "clareza": 0,
-                    "persuasao": 0,
-                    "conhecimento": 0,
-                    "empatia": 0,
-                    "resolucao": 0
-                }
-            
-            # Calcular pontuações baseadas no comprimento das mensagens e palavras-chave
-            clareza = min(100, sum(len(m['content'].split()) for m in messages if m['role'] == 'user') / total_messages * 10)
-            persuasao = min(100, sum(1 for m in messages if m['role'] == 'user' and any(word in m['content'].lower() for word in ['benefício', 'vantagem', 'melhor', 'ideal'])) / max(1, total_messages) * 100)
-            conhecimento = min(100, sum(len(m['content']) for m in messages if m['role'] == 'user') / total_messages / 10)
-            empatia = min(100, sum(1 for m in messages if m['role'] == 'user' and any(word in m['content'].lower() for word in ['entendo', 'compreendo', 'ajudar', 'apoiar'])) / max(1, total_messages) * 100)
-            resolucao = min(100, 70 + (total_messages % 10) * 3)  # Valor base + variação
-            
-            return {
-                "clareza": round(clareza),
-                "persuasao": round(persuasao),
-                "conhecimento": round(conhecimento),
-                "empatia": round(empatia),
-                "resolucao": round(resolucao)
-            }
+            return conversation_scorer.score(stats)
             
         except Exception as e:
             logger.error(f"Erro ao calcular pontuações de conversas: {str(e)}", exc_info=True)
-            return {
-                "clareza": 50,
-                "persuasao": 50,
-                "conhecimento": 50,
-                "empatia": 50,
-                "resolucao": 50
-            }
+            return Message.FALLBACK_SCORES
+
+    @staticmethod
+    def _analysis_candidates(user_id: str, columns: str, role: str = None) -> List[Dict]:
+        """
+        Candidatos para os prompts de análise, amostrados em todo o histórico do usuário.
+        
+        O intervalo entre a primeira e a última mensagem é dividido em
+        Config.ANALYSIS_TIME_STRATA faixas de tempo; cada faixa contribui com até
+        ANALYSIS_CANDIDATE_POOL / faixas mensagens (as mais recentes da faixa).
+        Históricos que cabem numa faixa são lidos numa única consulta.
+        """
+        strata = max(1, Config.ANALYSIS_TIME_STRATA)
+        per_stratum = max(1, Config.ANALYSIS_CANDIDATE_POOL // strata)
+        
+        def query():
+            q = supabase.table('mensagens_chatbot').select(columns).eq('user_id', user_id)
+            return q.eq('role', role) if role else q
+        
+        newest = query().order('timestamp', desc=True).limit(per_stratum).execute().data or []
+        if len(newest) < per_stratum:
+            return newest
+        oldest = query().order('timestamp', desc=False).limit(1).execute().data or []
+        if not oldest:
+            return newest
+        start = datetime.datetime.fromisoformat(oldest[0]['timestamp'])
+        end = datetime.datetime.fromisoformat(newest[0]['timestamp'])
+        bounds = [(start + (end - start) * i / strata).isoformat() for i in range(strata + 1)]
+        
+        rows = []
+        for i, (lower, upper) in enumerate(zip(bounds, bounds[1:])):
+            q = query().gte('timestamp', lower)
+            # A última faixa inclui a mensagem mais recente
+            q = q.lte('timestamp', upper) if i == strata - 1 else q.lt('timestamp', upper)
+            rows.extend(q.order('timestamp', desc=True).limit(per_stratum).execute().data or [])
+        return rows
 
     @staticmethod
     def get_ia_feedback(user_id: str) -> str:
@@ -499,25 +1112,21 @@ class Message:
         try:
             # Verificar se o cliente OpenAI está disponível
             if client is None:
-                return "O serviço de feedback da IA não está disponível no momento."
+                return Message.FEEDBACK_UNAVAILABLE
                 
-            # Obter mensagens recentes do usuário
-            response = supabase.table('mensagens_chatbot').select('*').eq('user_id', user_id).order('timestamp', desc=True).limit(20).execute()
+            # Mensagens de todo o histórico do usuário (apenas as colunas usadas no prompt)
+            candidates = Message._analysis_candidates(user_id, 'role,content,timestamp')
             
-            if not response.data:
+            if not candidates:
                 return "Ainda não há dados suficientes para gerar um feedback personalizado."
                 
-            # Usar OpenAI para gerar feedback
-            messages = response.data
-            
-        # Preparar prompt para a API
-            prompt = "Com base nas seguintes mensagens de um vendedor, forneça um feedback construtivo sobre suas habilidades de comunicação e vendas:\n\n"
-            
-            for msg in messages:
-                if msg['role'] == 'user':
-                    prompt += f"Vendedor: {msg['content']}\n"
-                else:
-                    prompt += f"Cliente: {msg['content']}\n"
+            # Montar o prompt dentro do orçamento de tokens
+            builder = PromptBudgetBuilder(Config.FEEDBACK_TOKEN_BUDGET)
+            prompt = builder.build(
+                candidates,
+                render=lambda msg: f"{'Vendedor' if msg['role'] == 'user' else 'Cliente'}: {msg['content']}",
+                header="Com base nas seguintes mensagens de um vendedor, forneça um feedback construtivo sobre suas habilidades de comunicação e vendas:\n\n"
+            )
             
             response = client.chat.completions.create(
                 model="gpt-3.5-turbo",
@@ -533,7 +1142,7 @@ class Message:
             
         except Exception as e:
             logger.error(f"Erro ao gerar feedback da IA: {str(e)}", exc_info=True)
-            return "Não foi possível gerar feedback neste momento. Por favor, tente novamente mais tarde."
+            return Message.FEEDBACK_FAILED
 
     @staticmethod
     def analyze_positioning(user_id: str) -> str:
@@ -541,16 +1150,17 @@ class Message:
         try:
             # Verificar se o cliente OpenAI está disponível
             if client is None:
-                return "O serviço de análise de posicionamento não está disponível no momento."
+                return Message.POSITIONING_UNAVAILABLE
                 
-            # Obter mensagens do usuário
-            response = supabase.table('mensagens_chatbot').select('*').eq('user_id', user_id).eq('role', 'user').execute()
+            # Mensagens de todo o histórico do usuário (apenas as colunas usadas no prompt)
+            candidates = Message._analysis_candidates(user_id, 'content,timestamp', role='user')
             
-            if not response.data or len(response.data) < 5:
+            if len(candidates) < 5:
                 return "Ainda não há mensagens suficientes para analisar seu posicionamento."
                 
-            # Concatenar mensagens para análise
-            messages = "\n".join([msg['content'] for msg in response.data])
+            # Amostrar mensagens ao longo do tempo dentro do orçamento de tokens
+            builder = PromptBudgetBuilder(Config.POSITIONING_TOKEN_BUDGET)
+            messages = builder.build(candidates, render=lambda msg: msg['content'])
             
             # Usar OpenAI para análise
             response = client.chat.completions.create(
@@ -567,7 +1177,7 @@ class Message:
             
         except Exception as e:
             logger.error(f"Erro ao analisar posicionamento: {str(e)}", exc_info=True)
-            return "Não foi possível analisar seu posicionamento neste momento. Por favor, tente novamente mais tarde."
+            return Message.POSITIONING_FAILED
 
     @staticmethod
     def get_whatsapp_messages() -> List[Dict]:
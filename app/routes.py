@@ -1,11 +1,18 @@
 # app/routes.py (refatorado)
 import logging
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, make_response, g
 from app.chatbot import ChatbotFactory
-from app.models import User, Message, Auth
+from app.chatbot.vendas import message_search
+from app.models import User, Message, Auth, encode_history_cursor, TIMEZONE
+from config import Config
+from app.services.version_service import watermarks
+from app.services.admission import AdmissionController
+from app.services.cache_service import get_shared_cache
+from app.services.semantic_index import get_semantic_index
+import hmac
 import uuid
 from functools import wraps
-from .whatsapp_handler import process_whatsapp_message
+from .whatsapp_handler import enqueue_whatsapp_payload, whatsapp_queue, PayloadTooLarge, retention_progress
 from typing import Dict, Any, Callable, Optional
 import datetime
 
@@ -26,8 +33,70 @@ def login_required(f: Callable) -> Callable:
         return f(*args, **kwargs)
     return decorated_function
 
+def conditional_json(etag: str, build: Callable[[], Any],
+                     cacheable: Optional[Callable[[Any], bool]] = None):
+    """
+    Responde 304 se o cliente já possui a versão identificada por `etag`;
+    caso contrário chama `build` e devolve o JSON com o cabeçalho ETag.
+
+    Se `cacheable` devolver False para o payload (ex.: alguma seção caiu na
+    resposta de contingência), o JSON sai sem ETag e com Cache-Control no-store.
+    """
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        payload = build()
+        if isinstance(payload, tuple):
+            # Respostas de erro (payload, status) não são versionadas
+            return payload
+        response = make_response(jsonify(payload))
+        if cacheable is not None and not cacheable(payload):
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+    response.set_etag(etag)
+    # Permitir cache no navegador, mas sempre revalidando com o servidor
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Controle de admissão: o webhook é recusado sob sobrecarga e parte da
+# capacidade do worker fica reservada para o chat (/send_message)
+admission = AdmissionController(
+    capacity=Config.WORKER_CAPACITY,
+    reserved_interactive=Config.INTERACTIVE_RESERVED_SLOTS,
+    max_webhook_in_flight=Config.WEBHOOK_MAX_IN_FLIGHT,
+    max_queue_depth=Config.WEBHOOK_MAX_QUEUE_DEPTH,
+    depth_fn=whatsapp_queue.depth,
+    drain_rate=Config.WHATSAPP_QUEUE_BATCH_SIZE / max(Config.WHATSAPP_QUEUE_FLUSH_INTERVAL, 0.001)
+)
+
+def _request_kind() -> str:
+    if request.endpoint == 'main.whatsapp_webhook' and request.method == 'POST':
+        return 'webhook'
+    if request.endpoint == 'main.send_message':
+        return 'interactive'
+    return 'other'
+
 # Rotas
 
+@main.before_request
+def admit_request():
+    """Conta a requisição em andamento e aplica o descarte de carga no webhook."""
+    kind = _request_kind()
+    admitted, status, retry_after = admission.try_admit(kind)
+    if not admitted:
+        logger.warning(f"Webhook do WhatsApp recusado por sobrecarga ({status}, Retry-After {retry_after}s)")
+        response = jsonify({'status': 'error', 'message': 'Servidor sobrecarregado, tente novamente'})
+        response.status_code = status
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    g.admission_kind = kind
+
+@main.teardown_request
+def release_request(exc=None):
+    kind = g.pop('admission_kind', None)
+    if kind is not None:
+        admission.release(kind)
+
 @main.before_request
 def check_session_expiry():
     """Verifica se a sessão expirou."""
@@ -61,22 +130,10 @@ def login():
             logger.warning("Tentativa de login com dados incompletos")
             return jsonify({'success': False, 'message': 'Email e senha são obrigatórios'})
         
-        # Verificar credenciais
-        if Auth.verify_credentials(email, password):
-            # Obter ou criar usuário
-            user = User.get_or_create_by_email(email)
-            
-            if not user or 'id' not in user:
-                logger.error(f"Falha ao obter ou criar usuário para email: {email}")
-                return jsonify({'success': False, 'message': 'Erro ao processar usuário'})
-            
-            # Verificar se o usuário existe no banco de dados
-            user_check = User.get_name(user['id'])
-            # Accept "Usuário Anônimo" as valid user name
-            if user_check == "Nenhum nome encontrado":
-                logger.error(f"Usuário com ID {user['id']} não existe no banco de dados após login")
-                return jsonify({'success': False, 'message': 'Usuário inválido ou não encontrado'})
-            
+        # Verificar credenciais, obter ou criar usuário e contar o login em uma única chamada
+        user = Auth.login(email, password)
+        
+        if user and 'id' in user:
             # Configurar sessão
             session['user_id'] = user['id']
             session['email'] = email
@@ -179,19 +236,35 @@ def send_message():
         # Use o nome armazenado em users mesmo que vazio, pois o chatbot vai pedir na primeira interação
         user_name = user.get('name', '') if user else ''
 
-        # Registrar mensagem do usuário com o nome atual (mesmo que vazio)
-        Message.create(
-            thread_id=thread_id,
-            role="user",
-            content=message,
-            user_id=user_id,
-            chatbot_type=chatbot_type,
-            user_name=user_name
-        )
-
-        # Obter resposta do chatbot
-        chatbot = ChatbotFactory.create_chatbot(chatbot_type)
-        response = chatbot.send_message(thread_id, message)
+        # A mensagem do usuário (com o nome atual, mesmo que vazio) é gravada
+        # junto com a resposta, num único insert; o horário é o da chegada
+        rows = [{
+            'thread_id': thread_id,
+            'role': "user",
+            'content': message,
+            'user_id': user_id,
+            'chatbot_type': chatbot_type,
+            'user_name': user_name,
+            'timestamp': datetime.datetime.now(TIMEZONE).isoformat()
+        }]
+        response = None
+        try:
+            # Obter resposta do chatbot
+            chatbot = ChatbotFactory.create_chatbot(chatbot_type)
+            response = chatbot.send_message(thread_id, message)
+            if response and 'response' in response:
+                # O nome do assistente vem do tipo do chatbot (Message._build_row)
+                rows.append({
+                    'thread_id': thread_id,
+                    'role': "assistant",
+                    'content': response['response'],
+                    'user_id': user_id,
+                    'chatbot_type': chatbot_type
+                })
+        finally:
+            # Sem resposta (ou com erro no chatbot) a mensagem do usuário é gravada sozinha
+            created = Message.create_many(rows)
+        assistant_message = created[-1] if len(rows) == 2 and len(created) == 2 else None
 
         # Se o chatbot extraiu um nome da mensagem e esse nome não está no banco de dados
         # Vamos atualizar o nome do usuário
@@ -201,29 +274,14 @@ def send_message():
             if updated:
                 logger.info(f"Nome do usuário atualizado para: {response['user_name']}")
 
-        # Registrar resposta do assistente com nome específico baseado no tipo do chatbot
-        if response and 'response' in response:
-            assistant_name = "IA Especialista em Vendas"  # Nome padrão
-            
-            # Usar nome específico para cada tipo de chatbot
-            if chatbot_type == 'treinamento' or chatbot_type == 'novo':
-                assistant_name = "IA Treinamento de Vendas"
-            
-            Message.create(
-                thread_id=thread_id,
-                role="assistant",
-                content=response['response'],
-                user_id=user_id,
-                chatbot_type=chatbot_type,
-                user_name=assistant_name
-            )
-
         # Atualizar última interação
         User.update_last_interaction(user_id, chatbot_type)
 
         response_data = {
             'response': response.get('response', ''),
-            'thread_id': thread_id
+            'thread_id': thread_id,
+            # Cursor da última mensagem gravada, para sincronização delta do histórico
+            'cursor': encode_history_cursor(assistant_message)
         }
 
         return jsonify(response_data)
@@ -271,8 +329,8 @@ def new_user():
         # Limpar cache de instâncias para garantir que uma nova instância será criada
         if create_new_thread:
             ChatbotFactory.clear_cache()
-            # Invalidar cache do thread_id do usuário
-            User.get_thread_id.cache_clear()
+            # Invalidar o perfil em cache (inclui os thread_ids do usuário)
+            User.invalidate_profile(user_id)
             
         thread_id = chatbot.create_thread()
         if not thread_id:
@@ -341,9 +399,27 @@ def get_chat_history():
         if not thread_id:
             return jsonify({'error': 'ID de thread não especificado'})
         
-        messages = Message.get_messages(thread_id, chatbot_type)
+        limit = min(request.args.get('limit', Config.CHAT_HISTORY_PAGE_SIZE, type=int) or Config.CHAT_HISTORY_PAGE_SIZE,
+                    Config.CHAT_HISTORY_MAX_PAGE_SIZE)
+        before = request.args.get('before')
+        after = request.args.get('after')
+        since = request.args.get('since')
         
-        return jsonify({'messages': messages})
+        def build():
+            try:
+                return Message.get_messages_page(
+                    thread_id,
+                    chatbot_type,
+                    before=before,
+                    after=after,
+                    since=since,
+                    limit=max(1, limit)
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        etag = watermarks.etag('thread', thread_id, chatbot_type, before, after, since, limit)
+        return conditional_json(etag, build)
     except Exception as e:
         logger.error(f"Erro ao recuperar histórico de chat: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)})
@@ -361,31 +437,43 @@ def get_dashboard_data():
     try:
         user_id = session.get('user_id')
         
-        # Obter contagem de logins
-        login_count = User.get_login_count(user_id)
-        
-        # Calcular pontuações de conversas
-        scores = Message.calculate_conversation_scores(user_id)
-        
-        # Obter feedback da IA
-        ia_feedback = Message.get_ia_feedback(user_id)
-        
-        # Analisar posicionamento
-        posicionamento = Message.analyze_positioning(user_id)
+        def build():
+            # Obter contagem de logins
+            login_count = User.get_login_count(user_id)
+            
+            # Calcular pontuações de conversas
+            scores = Message.calculate_conversation_scores(user_id)
+            
+            # Obter feedback da IA
+            ia_feedback = Message.get_ia_feedback(user_id)
+            
+            # Analisar posicionamento
+            posicionamento = Message.analyze_positioning(user_id)
+            
+            return {
+                'login_count': login_count,
+                'scores': scores,
+                'ia_feedback': ia_feedback,
+                'posicionamento': posicionamento
+            }
         
-        return jsonify({
-            'login_count': login_count,
-            'scores': scores,
-            'ia_feedback': ia_feedback,
-            'posicionamento': posicionamento
-        })
+        etag = watermarks.etag('user', user_id, request.args.get('period'))
+        return conditional_json(
+            etag, build,
+            cacheable=lambda payload: not any(Message.is_fallback(value) for value in payload.values())
+        )
     except Exception as e:
         logger.error(f"Erro ao obter dados do dashboard: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)})
 
 @main.route('/whatsapp-webhook', methods=['POST', 'GET'])
 def whatsapp_webhook():
-    """Manipula requisições para o webhook do WhatsApp."""
+    """Manipula requisições para o webhook do WhatsApp.
+    
+    O POST aceita uma mensagem, uma lista ou um envelope de lote do provedor;
+    só valida as mensagens e as grava na fila local, devolvendo o status de
+    cada item. O consumidor da fila grava em whatsapp_messages em lote.
+    """
     if request.method == 'GET':
         # Verificação do webhook
         logger.info("Recebida solicitação GET para webhook do WhatsApp")
@@ -393,17 +481,39 @@ def whatsapp_webhook():
     
     elif request.method == 'POST':
         try:
-            # Processar mensagem recebida
-            logger.info("Recebida mensagem POST para webhook do WhatsApp")
-            data = request.json
-            
-            # Processar a mensagem
-            result = process_whatsapp_message(data)
-            
+            data = request.get_json(silent=True)
+            result = enqueue_whatsapp_payload(data)
             return jsonify(result)
+        except PayloadTooLarge as e:
+            logger.warning(str(e))
+            return jsonify({'status': 'error', 'message': str(e)}), 413
         except Exception as e:
-            logger.error(f"Erro ao processar webhook do WhatsApp: {str(e)}", exc_info=True)
-            return jsonify({'error': str(e)})
+            # Falha ao gravar na fila local: 503 para o provedor reenviar
+            logger.error(f"Erro ao enfileirar webhook do WhatsApp: {str(e)}", exc_info=True)
+            return jsonify({'status': 'error', 'message': 'Fila indisponível'}), 503
+
+def metrics_authorized() -> bool:
+    """Usuário logado ou monitoramento com o token de Config.METRICS_TOKEN."""
+    if 'user_id' in session:
+        return True
+    token = Config.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+
+@main.route('/metrics')
+def metrics():
+    """Métricas operacionais (JSON) para monitoramento."""
+    if not metrics_authorized():
+        logger.warning("Acesso a /metrics sem autenticação")
+        return jsonify({'status': 'error', 'message': 'Não autorizado'}), 401
+    return jsonify({
+        'whatsapp_queue': whatsapp_queue.metrics(),
+        'admission': admission.metrics(),
+        'whatsapp_retention': retention_progress(),
+        'scheduler': get_shared_cache().get('scheduler:jobs'),
+        'message_search_cache': message_search.metrics(),
+        'semantic_index': get_semantic_index().metrics() if get_semantic_index() else None
+    })
 
 @main.route('/generate_analysis')
 @login_required
@@ -0,0 +1,105 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import atexit
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ActivityCoalescer:
+    """Coalesces frequent "last seen" writes into periodic batched writes.
+
+    ``record`` only keeps the latest timestamp per (user_id, chatbot_type) in
+    memory. A daemon thread calls ``flush_fn`` every ``interval`` seconds with
+    one row per user (the newest timestamp across chatbot types), and a final
+    flush runs at interpreter shutdown. If ``flush_fn`` raises, the rows are
+    merged back and retried on the next flush.
+    """
+
+    def __init__(self, flush_fn: Callable[[List[Dict[str, str]]], None],
+                 interval: float = 60.0, max_pending: int = 10000):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.records = 0
+        self.rows_written = 0
+        atexit.register(self.stop)
+
+    def record(self, user_id: str, chatbot_type: str, timestamp: Optional[str] = None) -> None:
+        """Remember the latest interaction; no I/O happens here."""
+        if not user_id:
+            return
+        timestamp = timestamp or datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self._lock:
+            key = (user_id, chatbot_type or '')
+            if timestamp > self._pending.get(key, ''):
+                self._pending[key] = timestamp
+            self.records += 1
+            overflow = len(self._pending) >= self.max_pending
+        self._ensure_started()
+        if overflow:
+            self.flush()
+
+    def _drain(self) -> List[Dict[str, str]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        latest: Dict[str, str] = {}
+        for (user_id, _), timestamp in pending.items():
+            if timestamp > latest.get(user_id, ''):
+                latest[user_id] = timestamp
+        return [{'id': user_id, 'last_interaction': timestamp} for user_id, timestamp in latest.items()]
+
+    def flush(self) -> int:
+        """Write all pending timestamps in one batch and return the number of rows."""
+        with self._flush_lock:
+            rows = self._drain()
+            if not rows:
+                return 0
+            try:
+                self.flush_fn(rows)
+            except Exception as e:
+                logger.error(f"Error flushing {len(rows)} coalesced activity rows: {str(e)}")
+                self._merge_back(rows)
+                return 0
+            self.rows_written += len(rows)
+            logger.debug(f"Flushed {len(rows)} coalesced activity rows")
+            return len(rows)
+
+    def _merge_back(self, rows: List[Dict[str, str]]) -> None:
+        """Return unwritten rows to the pending map, keeping newer timestamps recorded meanwhile.
+
+        Must not go through ``record``: it may call ``flush`` while ``_flush_lock`` is held.
+        """
+        with self._lock:
+            for row in rows:
+                key = (row['id'], '')
+                if row['last_interaction'] > self._pending.get(key, ''):
+                    self._pending[key] = row['last_interaction']
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="activity-coalescer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and flush what is still pending."""
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,85 @@
+from typing import Callable, Dict, Optional, Tuple
+import math
+import threading
+import time
+
+class AdmissionController:
+    """Load shedding for webhook traffic, with capacity reserved for interactive requests.
+
+    Every request is counted in flight per class ("webhook", "interactive",
+    "other") for this worker process. A webhook request is refused when:
+
+    - the worker already runs ``capacity - reserved_interactive`` requests,
+      so the last ``reserved_interactive`` slots stay free for chat traffic;
+    - ``max_webhook_in_flight`` webhook requests are already running;
+    - the ingest queue holds more than ``max_queue_depth`` records.
+
+    In-flight limits answer 503 with a short ``Retry-After``; a deep queue
+    answers 429 with a ``Retry-After`` estimated from the depth and the
+    ``drain_rate`` (records per second). Queue depth is read through
+    ``depth_fn`` at most once per ``depth_ttl`` seconds.
+    """
+
+    def __init__(self, capacity: int, reserved_interactive: int, max_webhook_in_flight: int,
+                 max_queue_depth: int, depth_fn: Optional[Callable[[], int]] = None,
+                 drain_rate: float = 500.0, depth_ttl: float = 1.0, busy_retry_after: int = 1,
+                 max_retry_after: int = 300):
+        self.capacity = capacity
+        self.reserved_interactive = reserved_interactive
+        self.max_webhook_in_flight = max_webhook_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.depth_fn = depth_fn
+        self.drain_rate = drain_rate
+        self.depth_ttl = depth_ttl
+        self.busy_retry_after = busy_retry_after
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, int] = {"webhook": 0, "interactive": 0, "other": 0}
+        self._depth = 0
+        self._depth_at = 0.0
+        self.shed: Dict[str, int] = {"429": 0, "503": 0}
+
+    def queue_depth(self) -> int:
+        if self.depth_fn is None:
+            return 0
+        now = time.monotonic()
+        if now - self._depth_at >= self.depth_ttl:
+            self._depth = self.depth_fn()
+            self._depth_at = now
+        return self._depth
+
+    def try_admit(self, kind: str) -> Tuple[bool, int, int]:
+        """Count a request in flight if admitted; return (admitted, status, retry_after)."""
+        if kind == "webhook":
+            depth = self.queue_depth()
+            if depth > self.max_queue_depth:
+                retry_after = self._queue_retry_after(depth)
+                with self._lock:
+                    self.shed["429"] += 1
+                return False, 429, retry_after
+        with self._lock:
+            if kind == "webhook":
+                total = sum(self._in_flight.values())
+                if (total >= self.capacity - self.reserved_interactive
+                        or self._in_flight["webhook"] >= self.max_webhook_in_flight):
+                    self.shed["503"] += 1
+                    return False, 503, self.busy_retry_after
+            self._in_flight[kind] += 1
+        return True, 200, 0
+
+    def release(self, kind: str) -> None:
+        with self._lock:
+            self._in_flight[kind] = max(0, self._in_flight[kind] - 1)
+
+    def _queue_retry_after(self, depth: int) -> int:
+        backlog = depth - self.max_queue_depth
+        return max(1, min(self.max_retry_after, math.ceil(backlog / max(self.drain_rate, 1.0))))
+
+    def metrics(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "in_flight": dict(self._in_flight),
+                "capacity": self.capacity,
+                "reserved_interactive": self.reserved_interactive,
+                "shed": dict(self.shed),
+            }
@@ -0,0 +1,50 @@
+from typing import Iterable
+import hashlib
+import math
+import threading
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys.
+
+    Memory is ``bits / 8`` bytes, sized for ``capacity`` keys at
+    ``error_rate`` false positives. Membership answers are "definitely not
+    seen" or "probably seen"; callers must confirm positives elsewhere. Once
+    more than ``capacity`` keys were added the filter clears itself, so the
+    false-positive rate stays bounded (at the cost of forgetting old keys).
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.resets = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        array = self._array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str) -> None:
+        positions = self._positions(key)
+        with self._lock:
+            if self.count >= self.capacity:
+                self._array = bytearray(len(self._array))
+                self.count = 0
+                self.resets += 1
+            array = self._array
+            for p in positions:
+                array[p >> 3] |= 1 << (p & 7)
+            self.count += 1
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._array)
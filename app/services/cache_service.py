@@ -1,10 +1,14 @@
 from typing import Dict, Any, Optional, Union
 import logging
+import hashlib
 import json
 import time
+import uuid
 from functools import wraps
 from threading import Lock
 from .interfaces import CacheServiceInterface
+from .local_store import LocalSQLite
+from config import Config
 
 logger = logging.getLogger(__name__)
 
@@ -150,3 +154,144 @@ class JSONSerializableCacheService(MemoryCacheService):
         except Exception as e:
             logger.error(f"Error deserializing cache value: {str(e)}")
             return None
+
+
+class SQLiteCacheService(CacheServiceInterface):
+    """Cache service backed by a local SQLite file.
+
+    Every gunicorn worker on the same host opens the same file, so values
+    written by one worker are visible to the others. Entries support TTL,
+    and the table is bounded by ``max_entries`` (oldest entries are evicted
+    first). Values are JSON-serialized.
+
+    Counters (``incr`` / ``counter``) live in a separate ``counters`` table
+    that is never evicted or cleared: they back version watermarks, and a
+    counter that went back to 0 would reissue versions (and ETags) already
+    handed out for different content.
+    """
+
+    # Verificar o limite de entradas a cada N escritas
+    _EVICTION_INTERVAL = 100
+
+    def __init__(self, path: str, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._db = LocalSQLite(path)
+        self._writes = 0
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        with self._db.immediate() as conn:
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'counters'").fetchone():
+                conn.execute("CREATE TABLE counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                # Arquivo anterior à tabela counters: os contadores recomeçam do 0, então o epoch muda
+                conn.execute("DELETE FROM cache_meta WHERE key = 'epoch'")
+            conn.execute("INSERT OR IGNORE INTO cache_meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+        self.epoch = self._db.execute("SELECT value FROM cache_meta WHERE key = 'epoch'").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value from cache."""
+        try:
+            row = self._db.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            logger.error(f"Error retrieving from shared cache: {str(e)}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        """Set a value in cache."""
+        try:
+            now = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl if ttl else None, now)
+            )
+            self._after_write()
+            return True
+        except Exception as e:
+            logger.error(f"Error setting shared cache value: {str(e)}")
+            return False
+
+    def delete(self, key: str) -> bool:
+        """Delete a value from cache."""
+        try:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting from shared cache: {str(e)}")
+            return False
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Atomically increment an integer counter (created at 0) and return the new value."""
+        with self._db.immediate() as conn:
+            conn.execute(
+                "INSERT INTO counters (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, amount)
+            )
+            row = conn.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0]
+
+    def transaction(self):
+        """Context manager holding the file's write lock: the calls made inside it commit together."""
+        return self._db.immediate()
+
+    def counter(self, key: str) -> int:
+        """Current value of a counter (0 if it was never incremented)."""
+        row = self._db.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def clear(self) -> bool:
+        """Clear all cached values."""
+        try:
+            self._db.execute("DELETE FROM cache")
+            return True
+        except Exception as e:
+            logger.error(f"Error clearing shared cache: {str(e)}")
+            return False
+
+    def cleanup_expired(self) -> int:
+        """Remove expired entries and return count of removed items."""
+        try:
+            cursor = self._db.execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error cleaning up expired shared cache entries: {str(e)}")
+            return 0
+
+    def _after_write(self) -> None:
+        """Evict the oldest entries once the table grows past ``max_entries``."""
+        self._writes += 1
+        if self._writes % self._EVICTION_INTERVAL:
+            return
+        count = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self.cleanup_expired()
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY expires_at IS NULL, created_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+
+def hashed_key(namespace: str, raw: str) -> str:
+    """Build a compact, fixed-length cache key from arbitrary text."""
+    digest = hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+    return f"{namespace}:{digest}"
+
+_shared_cache: Optional[SQLiteCacheService] = None
+
+def get_shared_cache() -> SQLiteCacheService:
+    """Get the cache shared by all workers on this host."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SQLiteCacheService(Config.SHARED_CACHE_PATH, Config.SHARED_CACHE_MAX_ENTRIES)
+    return _shared_cache
@@ -0,0 +1,257 @@
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+import hashlib
+import json
+import logging
+from .conversation_scoring import ConversationScorer
+
+logger = logging.getLogger(__name__)
+
+GRADE_FIELDS = ("clareza", "persuasao", "conhecimento", "empatia", "resolucao")
+
+SYSTEM_PROMPT = (
+    "Você é um especialista em vendas que avalia conversas de vendedores. "
+    "Para cada conversa recebida, dê notas de 0 a 100 para clareza, persuasão, "
+    "conhecimento, empatia e resolução, e um comentário curto. Responda uma "
+    "avaliação por conversa, usando o mesmo id recebido."
+)
+
+# Structured output: one grade object per conversation in the request
+GRADES_SCHEMA = {
+    "name": "conversation_grades",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "grades": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": dict(
+                        {"id": {"type": "string"}, "comentario": {"type": "string"}},
+                        **{field: {"type": "integer"} for field in GRADE_FIELDS}
+                    ),
+                    "required": ["id", *GRADE_FIELDS, "comentario"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["grades"],
+        "additionalProperties": False,
+    },
+}
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def conversation_hash(messages: Iterable[Mapping[str, Any]]) -> str:
+    """Content hash of a conversation (roles and texts, in order)."""
+    canonical = json.dumps(
+        [[m.get("role"), m.get("content") or ""] for m in messages],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ConversationGrader:
+    """Model-graded conversation scores, many conversations per request.
+
+    Each grade is cached under the hash of the conversation content, so only
+    new or changed conversations are sent to the model. Grading can run
+    online (``grade``) or through the OpenAI Batch API: ``write_batch_file``
+    writes the requests as JSONL and ``read_batch_results`` loads the output
+    file back into the cache. ``process_batch_file_locally`` produces an
+    output file without the API, for tests and local runs.
+    """
+
+    def __init__(self, client_getter: Optional[Callable] = None, cache=None, model: str = "gpt-4o",
+                 batch_size: int = 10, max_chars: int = 6000, ttl: Optional[int] = None):
+        self.client_getter = client_getter
+        self.cache = cache
+        self.model = model
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.stats: Dict[str, int] = {"cache_hits": 0, "graded": 0, "requests": 0}
+
+    # Cache -----------------------------------------------------------------
+
+    @staticmethod
+    def _cache_key(content_hash: str) -> str:
+        return f"conversation_grade:{content_hash}"
+
+    def cached_grade(self, messages: Sequence[Mapping[str, Any]]) -> Optional[Dict[str, Any]]:
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(conversation_hash(messages)))
+
+    def _store(self, content_hash: str, grade: Dict[str, Any]) -> None:
+        if self.cache is not None:
+            self.cache.set(self._cache_key(content_hash), grade, ttl=self.ttl)
+
+    def _split_cached(self, conversations: Mapping[str, Sequence[Mapping[str, Any]]]
+                      ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """Return (cached grades by id, content hash by id of conversations still to grade)."""
+        grades: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[str, str] = {}
+        for conversation_id, messages in conversations.items():
+            content_hash = conversation_hash(messages)
+            cached = self.cache.get(self._cache_key(content_hash)) if self.cache is not None else None
+            if cached is not None:
+                grades[conversation_id] = cached
+                self.stats["cache_hits"] += 1
+            else:
+                pending[conversation_id] = content_hash
+        return grades, pending
+
+    # Request building ------------------------------------------------------
+
+    def _render(self, messages: Sequence[Mapping[str, Any]]) -> str:
+        lines = [f"{'Vendedor' if m.get('role') == 'user' else 'Cliente'}: {m.get('content') or ''}" for m in messages]
+        text = "\n".join(lines)
+        # Keep the end of long conversations, where the outcome is
+        return text if len(text) <= self.max_chars else "...\n" + text[-self.max_chars:]
+
+    def _request_body(self, conversations: Mapping[str, Sequence[Mapping[str, Any]]], ids: Sequence[str]) -> Dict[str, Any]:
+        blocks = [f"### Conversa id={conversation_id}\n{self._render(conversations[conversation_id])}" for conversation_id in ids]
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": "\n\n".join(blocks)},
+            ],
+            "response_format": {"type": "json_schema", "json_schema": GRADES_SCHEMA},
+        }
+
+    def _chunks(self, ids: Sequence[str]) -> List[List[str]]:
+        return [list(ids[i:i + self.batch_size]) for i in range(0, len(ids), self.batch_size)]
+
+    def _parse(self, content: str, hashes: Mapping[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Parse a grades response, cache each grade and return the ones for known ids.
+
+        Items with a missing id or a non-numeric score are logged and skipped.
+        """
+        grades: Dict[str, Dict[str, Any]] = {}
+        for item in json.loads(content).get("grades", []):
+            try:
+                conversation_id = str(item.get("id"))
+                if conversation_id not in hashes:
+                    continue
+                grade = {field: max(0, min(100, int(item.get(field, 0)))) for field in GRADE_FIELDS}
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping invalid grade {str(item)[:200]}: {str(e)}")
+                continue
+            grade["comentario"] = item.get("comentario", "")
+            grades[conversation_id] = grade
+            self._store(hashes[conversation_id], grade)
+            self.stats["graded"] += 1
+        return grades
+
+    # Online grading --------------------------------------------------------
+
+    def grade(self, conversations: Mapping[str, Sequence[Mapping[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Grade conversations ({id: messages}); cached ones cost no request."""
+        grades, pending = self._split_cached(conversations)
+        for ids in self._chunks(list(pending)):
+            self.stats["requests"] += 1
+            try:
+                response = self.client_getter().chat.completions.create(**self._request_body(conversations, ids))
+                grades.update(self._parse(response.choices[0].message.content, {i: pending[i] for i in ids}))
+            except Exception as e:
+                logger.error(f"Error grading {len(ids)} conversations: {str(e)}", exc_info=True)
+        return grades
+
+    # Batch API -------------------------------------------------------------
+
+    @staticmethod
+    def mapping_path(path: str) -> str:
+        """Sidecar file written next to a batch file: custom_id -> {conversation id: content hash}."""
+        return path + ".map.json"
+
+    def write_batch_file(self, conversations: Mapping[str, Sequence[Mapping[str, Any]]], path: str) -> int:
+        """Write Batch API requests for the conversations not in cache; return the number of requests.
+
+        The conversation ids and content hashes of each request are saved in
+        ``mapping_path(path)``, which ``read_batch_results`` needs.
+        """
+        _, pending = self._split_cached(conversations)
+        chunks = self._chunks(list(pending))
+        mapping: Dict[str, Dict[str, str]] = {}
+        with open(path, "w", encoding="utf-8") as f:
+            for number, ids in enumerate(chunks):
+                custom_id = f"grades-{number}"
+                mapping[custom_id] = {i: pending[i] for i in ids}
+                line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT,
+                        "body": self._request_body(conversations, ids)}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        with open(self.mapping_path(path), "w", encoding="utf-8") as f:
+            json.dump(mapping, f)
+        return len(chunks)
+
+    def read_batch_results(self, output_path: str, requests_path: str) -> Dict[str, Dict[str, Any]]:
+        """Load a Batch API output file, caching every grade it contains.
+
+        ``requests_path`` is the file given to ``write_batch_file``. A line
+        that cannot be read (malformed JSON or response) is logged and
+        skipped; the grades of the other lines are still returned.
+        """
+        with open(self.mapping_path(requests_path), encoding="utf-8") as f:
+            mapping = json.load(f)
+        grades: Dict[str, Dict[str, Any]] = {}
+        with open(output_path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    result = json.loads(line)
+                    response = result.get("response") or {}
+                    if result.get("error") or response.get("status_code") != 200:
+                        logger.error(f"Batch request {result.get('custom_id')} failed: "
+                                     f"{result.get('error') or response.get('status_code')}")
+                        continue
+                    hashes = mapping.get(result.get("custom_id"))
+                    if hashes is None:
+                        continue
+                    content = response["body"]["choices"][0]["message"]["content"]
+                    grades.update(self._parse(content, hashes))
+                except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+                    logger.error(f"Skipping unreadable line {number} of {output_path}: {str(e)}")
+        return grades
+
+
+def local_grades_responder(body: Mapping[str, Any]) -> str:
+    """Answer a grading request with ConversationScorer instead of a model."""
+    scorer = ConversationScorer()
+    grades = []
+    for block in body["messages"][-1]["content"].split("### Conversa id=")[1:]:
+        header, _, text = block.partition("\n")
+        messages = []
+        for line in text.splitlines():
+            speaker, _, content = line.partition(": ")
+            messages.append({"role": "user" if speaker == "Vendedor" else "assistant", "content": content})
+        grade = scorer.score_messages(messages)
+        grades.append(dict(grade, id=header.strip(), comentario="Avaliação local"))
+    return json.dumps({"grades": grades}, ensure_ascii=False)
+
+
+def process_batch_file_locally(input_path: str, output_path: str,
+                               responder: Callable[[Mapping[str, Any]], str] = local_grades_responder) -> int:
+    """Stand-in for the Batch API: read a requests JSONL and write an output JSONL in the same format."""
+    count = 0
+    with open(input_path, encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            count += 1
+            result = {
+                "id": f"batch_req_{count}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": f"local_{count}",
+                    "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": responder(request["body"])}}]},
+                },
+                "error": None,
+            }
+            dst.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return count
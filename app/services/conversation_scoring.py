@@ -0,0 +1,139 @@
+from typing import Any, Dict, Iterable, Mapping, Optional
+import logging
+from .lexicon import Lexicon, get_lexicon
+
+logger = logging.getLogger(__name__)
+
+# Running counters kept per user; all values are ints so the dict is JSON-serializable
+_COUNTERS = (
+    "messages", "user_messages", "user_words", "user_chars",
+    "questions", "answered_questions", "objections", "handled_objections",
+    "persuasao", "empatia", "positivo", "negativo", "resolved", "pending",
+)
+
+# Weights of the resolution score: 50 + sum(weight * feature), each feature in [-1, 1]
+_RESOLUTION_WEIGHTS = (
+    ("resolution_balance", 25.0),
+    ("sentiment", 10.0),
+    ("objection_handling", 10.0),
+    ("answer_rate", 5.0),
+)
+
+
+def _balance(positive: int, negative: int) -> float:
+    total = positive + negative
+    return (positive - negative) / total if total else 0.0
+
+
+class ConversationScorer:
+    """Local conversation scoring from lexicon hits and turn structure.
+
+    Scores are computed from a small dict of running counters (see
+    ``new_stats``). ``add`` folds one message into the counters in a single
+    lexicon pass, and ``score`` turns the counters into the dashboard scores
+    in constant time. Both take microseconds, so scores can be kept up to
+    date on every message write without calling a model.
+
+    Turn-structure features:
+        - answer rate: questions followed by a message from the other role
+        - objection handling: objections answered by the other role with
+          objection-handling markers ("entendo", "desconto", "garantia", ...)
+    """
+
+    def __init__(self, lexicon: Optional[Lexicon] = None):
+        self.lexicon = lexicon
+
+    def _lexicon(self) -> Lexicon:
+        return self.lexicon or get_lexicon("conversation")
+
+    @staticmethod
+    def new_stats() -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict.fromkeys(_COUNTERS, 0)
+        stats["last_role"] = None
+        stats["open_question"] = False
+        stats["open_objection"] = False
+        return stats
+
+    def add(self, stats: Dict[str, Any], role: str, content: str) -> Dict[str, Any]:
+        """Fold one message into ``stats`` (in place) and return it."""
+        content = content or ""
+        hits = self._lexicon().count(content)
+        other_turn = stats["last_role"] is not None and role != stats["last_role"]
+
+        if other_turn and stats["open_question"]:
+            stats["answered_questions"] += 1
+        if other_turn and stats["open_objection"] and hits.get("tratamento_objecao"):
+            stats["handled_objections"] += 1
+        if other_turn or stats["last_role"] is None:
+            stats["open_question"] = False
+            stats["open_objection"] = False
+
+        stats["messages"] += 1
+        if role == "user":
+            stats["user_messages"] += 1
+            stats["user_words"] += len(content.split())
+            stats["user_chars"] += len(content)
+            if hits.get("persuasao"):
+                stats["persuasao"] += 1
+            if hits.get("empatia"):
+                stats["empatia"] += 1
+
+        if "?" in content:
+            stats["questions"] += 1
+            stats["open_question"] = True
+        if hits.get("objecao"):
+            stats["objections"] += 1
+            stats["open_objection"] = True
+
+        stats["positivo"] += hits.get("positivo", 0)
+        stats["negativo"] += hits.get("negativo", 0)
+        # Pending markers weigh double: "não funcionou" also contains "funcionou"
+        net = hits.get("resolucao", 0) - 2 * hits.get("pendente", 0)
+        if net > 0:
+            stats["resolved"] += 1
+        elif net < 0:
+            stats["pending"] += 1
+
+        stats["last_role"] = role
+        return stats
+
+    def build_stats(self, messages: Iterable[Mapping[str, Any]]) -> Dict[str, Any]:
+        """Counters for a chronologically ordered list of {'role', 'content'} messages."""
+        stats = self.new_stats()
+        for message in messages:
+            self.add(stats, message.get("role"), message.get("content"))
+        return stats
+
+    @staticmethod
+    def features(stats: Mapping[str, Any]) -> Dict[str, float]:
+        """Normalized features in [-1, 1] used by the resolution score."""
+        questions, objections = stats["questions"], stats["objections"]
+        answer_rate = stats["answered_questions"] / questions if questions else 1.0
+        handling = stats["handled_objections"] / objections if objections else 1.0
+        return {
+            "resolution_balance": _balance(stats["resolved"], stats["pending"]),
+            "sentiment": _balance(stats["positivo"], stats["negativo"]),
+            "objection_handling": 2 * handling - 1,
+            "answer_rate": 2 * answer_rate - 1,
+        }
+
+    def score(self, stats: Mapping[str, Any]) -> Dict[str, int]:
+        """Dashboard scores (0-100) from the running counters."""
+        total = stats["messages"]
+        if not total:
+            return {"clareza": 0, "persuasao": 0, "conhecimento": 0, "empatia": 0, "resolucao": 0}
+        features = self.features(stats)
+        resolucao = 50 + sum(weight * features[name] for name, weight in _RESOLUTION_WEIGHTS)
+        return {
+            "clareza": round(min(100, stats["user_words"] / total * 10)),
+            "persuasao": round(min(100, stats["persuasao"] / total * 100)),
+            "conhecimento": round(min(100, stats["user_chars"] / total / 10)),
+            "empatia": round(min(100, stats["empatia"] / total * 100)),
+            "resolucao": round(max(0, min(100, resolucao))),
+        }
+
+    def score_messages(self, messages: Iterable[Mapping[str, Any]]) -> Dict[str, int]:
+        return self.score(self.build_stats(messages))
+
+
+conversation_scorer = ConversationScorer()
@@ -3,6 +3,8 @@ import logging
 from datetime import datetime
 from supabase import create_client, Client
 from .interfaces import DatabaseServiceInterface
+from .search_service import CachedMessageSearch, SupabaseMessageSearch
+from .version_service import watermarks
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -12,6 +14,9 @@ class SupabaseService(DatabaseServiceInterface):
     
     def __init__(self):
         self.client: Client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+        self.message_search = CachedMessageSearch(
+            SupabaseMessageSearch(self.client), watermarks, ttl=Config.MESSAGE_SEARCH_CACHE_TTL
+        )
         
     def log_interaction(self, data: Dict[str, Any]) -> bool:
         """Log an interaction to the database."""
@@ -43,31 +48,17 @@ class SupabaseService(DatabaseServiceInterface):
     def query_messages(self, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Query messages with filters."""
         try:
-            query = self.client.table('whatsapp_messages').select('*')
+            messages = self.message_search.search(
+                content=filters.get('content'),
+                sender_name=filters.get('sender_name'),
+                start_date=filters.get('start_date'),
+                end_date=filters.get('end_date'),
+                limit=filters.get('limit') or 100
+            )
             
-            # Apply filters
-            if filters.get('sender_name'):
-                query = query.ilike('sender_name', f"%{filters['sender_name']}%")
-            
-            if filters.get('content'):
-                query = query.ilike('content', f"%{filters['content']}%")
-            
-            if filters.get('start_date') and filters.get('end_date'):
-                query = query.gte('timestamp', filters['start_date'])\
-                           .lte('timestamp', filters['end_date'])
-            
-            # Apply sorting
-            query = query.order('timestamp', desc=True)
-            
-            # Apply limit
-            if filters.get('limit'):
-                query = query.limit(filters['limit'])
-            
-            result = query.execute()
-            
-            if result.data:
-                logger.info(f"Retrieved {len(result.data)} messages")
-                return self._format_messages(result.data)
+            if messages:
+                logger.info(f"Retrieved {len(messages)} messages")
+                return self._format_messages(messages)
             else:
                 logger.info("No messages found matching filters")
                 return []
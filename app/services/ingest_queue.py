@@ -0,0 +1,330 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import atexit
+import json
+import logging
+import threading
+import time
+from .bloom_filter import BloomFilter
+from .local_store import LocalSQLite
+
+logger = logging.getLogger(__name__)
+
+class IngestQueue:
+    """Durable host-local queue drained in batches by a background consumer.
+
+    ``put`` / ``put_many`` only append rows to a local SQLite file, so a
+    request handler can acknowledge as soon as the payload is on disk. A
+    daemon thread (started on the first ``put``) claims up to ``batch_size``
+    rows at a time and hands them to ``flush_fn`` in one call; rows are
+    deleted only after ``flush_fn`` returns.
+
+    Every gunicorn worker on the host may run a consumer: claims are leases
+    (``lease`` seconds) taken in a write transaction, so a batch is processed
+    by one worker, and rows claimed by a worker that died are picked up again
+    once the lease expires. A failed batch is released with exponential
+    backoff (``retry_backoff`` * 2^attempts seconds, at most ``max_backoff``),
+    so an outage costs retries spread over time rather than attempts. Rows
+    are retried until they are ``max_age`` seconds old (``None`` = forever);
+    older ones are marked dead, logged at CRITICAL, counted as ``dead`` in
+    ``metrics`` and kept in the file until ``requeue_dead`` puts them back.
+
+    The file is only as durable as the disk it is on: on hosts with an
+    ephemeral filesystem, records not yet flushed when the host is replaced
+    are lost (``stop`` drains what it can on a clean shutdown).
+
+    Records may carry an idempotency key (``put_many(records, keys)``). Keys
+    are remembered for ``dedupe_ttl`` seconds in a ``seen`` table of the same
+    file, which is the exact, cross-worker check: keys are looked up and
+    recorded inside the enqueue write transaction. A per-process Bloom
+    filter sits in front of it, so a key this process has never seen goes
+    straight to that transaction, while a probable retry is confirmed with a
+    read-only lookup and dropped without taking the write lock. Each queued
+    row keeps its key, and the keys of rows marked dead are forgotten, so a
+    sender retrying a message that never reached ``flush_fn`` is accepted
+    again instead of being dropped as a duplicate.
+    """
+
+    def __init__(self, path: str, flush_fn: Callable[[List[Dict[str, Any]]], None],
+                 batch_size: int = 500, interval: float = 1.0, lease: float = 60.0,
+                 retry_backoff: float = 2.0, max_backoff: float = 300.0,
+                 max_age: Optional[float] = None, name: str = "ingest-queue",
+                 dedupe_ttl: float = 7 * 86400, dedupe_capacity: int = 1_000_000):
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.max_age = max_age
+        self.name = name
+        self._db = LocalSQLite(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+            "enqueued_at REAL NOT NULL, claimed_until REAL NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0, dead_at REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(queue)")}
+        if "dead_at" not in columns:
+            # Arquivo criado antes do backoff: linhas voltam a ser tentadas
+            self._db.execute("ALTER TABLE queue ADD COLUMN dead_at REAL")
+        if "dedupe_key" not in columns:
+            self._db.execute("ALTER TABLE queue ADD COLUMN dedupe_key TEXT")
+        self._db.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS seen_seen_at ON seen (seen_at)")
+        self.dedupe_ttl = dedupe_ttl
+        self._bloom = BloomFilter(dedupe_capacity)
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._atexit_registered = False
+        self.enqueued = 0
+        self.flushed = 0
+        self.failures = 0
+        self.duplicates = 0
+
+    # Producer --------------------------------------------------------------
+
+    def put(self, record: Dict[str, Any], key: Optional[str] = None) -> bool:
+        return self.put_many([record], [key])[0]
+
+    def put_many(self, records: Sequence[Dict[str, Any]], keys: Optional[Sequence[Optional[str]]] = None) -> List[bool]:
+        """Append records in one transaction; no remote I/O happens here.
+
+        ``keys`` holds an idempotency key per record (``None`` = no dedupe).
+        Returns, per record, whether it was enqueued (False = duplicate).
+        """
+        if not records:
+            return []
+        keys = list(keys) if keys is not None else [None] * len(records)
+        accepted = [True] * len(records)
+        batch_keys = set()
+        probable = []
+        for index, key in enumerate(keys):
+            if key is None:
+                continue
+            if key in batch_keys:
+                accepted[index] = False
+                continue
+            batch_keys.add(key)
+            if key in self._bloom:
+                probable.append(index)
+        if probable:
+            # Provável reenvio: confirmação exata só com leitura
+            seen = self._seen([keys[i] for i in probable])
+            for index in probable:
+                if keys[index] in seen:
+                    accepted[index] = False
+
+        now = time.time()
+        with self._db.immediate() as conn:
+            pending = [index for index, key in enumerate(keys) if key is not None and accepted[index]]
+            if pending:
+                # Dentro da transação de escrita: nenhum outro worker reivindica as mesmas chaves
+                seen = self._seen([keys[i] for i in pending], conn)
+                for index in pending:
+                    if keys[index] in seen:
+                        # Já visto por outro worker
+                        accepted[index] = False
+                conn.executemany(
+                    "INSERT OR REPLACE INTO seen (key, seen_at) VALUES (?, ?)",
+                    [(keys[i], now) for i in pending if accepted[i]]
+                )
+            rows = [(json.dumps(record), now, key) for record, key, ok in zip(records, keys, accepted) if ok]
+            if rows:
+                conn.executemany("INSERT INTO queue (payload, enqueued_at, dedupe_key) VALUES (?, ?, ?)", rows)
+        for key in batch_keys:
+            self._bloom.add(key)
+
+        self.duplicates += len(records) - len(rows)
+        self.enqueued += len(rows)
+        self._puts += 1
+        if self._puts % 1000 == 0:
+            self.prune_seen()
+        if rows:
+            self._ensure_started()
+            if len(rows) >= self.batch_size:
+                self._wakeup.set()
+        return accepted
+
+    def _seen(self, keys: List[str], conn=None) -> set:
+        """Keys among ``keys`` seen less than ``dedupe_ttl`` seconds ago."""
+        conn = conn or self._db.connection()
+        found = set()
+        cutoff = time.time() - self.dedupe_ttl
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(row[0] for row in conn.execute(
+                f"SELECT key FROM seen WHERE seen_at > ? AND key IN ({placeholders})", (cutoff, *chunk)
+            ))
+        return found
+
+    def prune_seen(self) -> int:
+        """Forget idempotency keys older than ``dedupe_ttl``."""
+        return self._db.execute("DELETE FROM seen WHERE seen_at <= ?", (time.time() - self.dedupe_ttl,)).rowcount
+
+    # Consumer --------------------------------------------------------------
+
+    def _claim(self) -> List[Tuple[int, Dict[str, Any]]]:
+        now = time.time()
+        with self._db.immediate() as conn:
+            rows = conn.execute(
+                "SELECT id, payload FROM queue WHERE claimed_until <= ? AND dead_at IS NULL ORDER BY id LIMIT ?",
+                (now, self.batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE queue SET claimed_until = ? WHERE id = ?",
+                    [(now + self.lease, row[0]) for row in rows]
+                )
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def drain_once(self) -> int:
+        """Claim and flush one batch; return the number of records written."""
+        claimed = self._claim()
+        if not claimed:
+            return 0
+        ids = [(row_id,) for row_id, _ in claimed]
+        try:
+            self.flush_fn([record for _, record in claimed])
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Error flushing {len(claimed)} queued records from {self.name}: {str(e)}")
+            self._release_failed([row_id for row_id, _ in claimed])
+            return 0
+        with self._db.immediate() as conn:
+            conn.executemany("DELETE FROM queue WHERE id = ?", ids)
+        self.flushed += len(claimed)
+        logger.debug(f"Flushed {len(claimed)} queued records from {self.name}")
+        return len(claimed)
+
+    def _release_failed(self, ids: List[int]) -> None:
+        """Schedule a failed batch for a later retry, or mark it dead once older than ``max_age``.
+
+        Dead rows drop their idempotency keys from ``seen``: the records were
+        never written, so a retry from the sender must not count as a duplicate.
+        """
+        now = time.time()
+        with self._db.immediate() as conn:
+            conn.executemany(
+                "UPDATE queue SET attempts = attempts + 1, "
+                "claimed_until = ? + MIN(?, ? * (1 << MIN(attempts, 30))) WHERE id = ?",
+                [(now, self.max_backoff, self.retry_backoff, row_id) for row_id in ids]
+            )
+            dead = 0
+            if self.max_age is not None:
+                placeholders = ",".join("?" * len(ids))
+                dead = conn.execute(
+                    f"UPDATE queue SET dead_at = ? WHERE enqueued_at <= ? AND id IN ({placeholders})",
+                    (now, now - self.max_age, *ids)
+                ).rowcount
+                if dead:
+                    conn.execute(
+                        f"DELETE FROM seen WHERE key IN (SELECT dedupe_key FROM queue "
+                        f"WHERE dead_at = ? AND id IN ({placeholders}))", (now, *ids)
+                    )
+        if dead:
+            logger.critical(f"{dead} records in {self.name} failed for more than {self.max_age}s "
+                            f"and were marked dead; use requeue_dead to retry them")
+
+    def requeue_dead(self) -> int:
+        """Put every dead record back in the queue with its attempts reset; return how many.
+
+        Their idempotency keys are recorded again. A record the sender already
+        re-sent after it died may be written twice; the destination is
+        expected to ignore the duplicate key.
+        """
+        now = time.time()
+        with self._db.immediate() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO seen (key, seen_at) SELECT dedupe_key, ? FROM queue "
+                "WHERE dead_at IS NOT NULL AND dedupe_key IS NOT NULL", (now,)
+            )
+            count = conn.execute(
+                "UPDATE queue SET dead_at = NULL, attempts = 0, claimed_until = 0, enqueued_at = ? "
+                "WHERE dead_at IS NOT NULL", (now,)
+            ).rowcount
+        if count:
+            logger.warning(f"{count} dead records requeued in {self.name}")
+            self._wakeup.set()
+        return count
+
+    def dead_records(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Dead records (oldest first), for inspection or export."""
+        return [json.loads(row[0]) for row in self._db.execute(
+            "SELECT payload FROM queue WHERE dead_at IS NOT NULL ORDER BY id LIMIT ?", (limit,))]
+
+    def drain(self) -> int:
+        """Flush batches until the queue is empty or a batch fails."""
+        total = 0
+        while True:
+            written = self.drain_once()
+            if not written:
+                return total
+            total += written
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Error in {self.name} consumer: {str(e)}", exc_info=True)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def start(self) -> None:
+        """Start the consumer without waiting for a ``put`` (e.g. to drain rows left by a restart)."""
+        self._ensure_started()
+
+    def stop(self) -> None:
+        """Stop the consumer and try to flush what is still queued."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        try:
+            self.drain()
+        except Exception as e:
+            logger.error(f"Error draining {self.name} on shutdown: {str(e)}")
+
+    # Metrics ---------------------------------------------------------------
+
+    def depth(self) -> int:
+        """Records waiting to be written (excluding dead ones), across all workers."""
+        return self._db.execute("SELECT COUNT(*) FROM queue WHERE dead_at IS NULL").fetchone()[0]
+
+    def metrics(self) -> Dict[str, Any]:
+        depth, retrying, dead, oldest = self._db.execute(
+            "SELECT COALESCE(SUM(dead_at IS NULL), 0), COALESCE(SUM(dead_at IS NULL AND attempts > 0), 0), "
+            "COALESCE(SUM(dead_at IS NOT NULL), 0), MIN(CASE WHEN dead_at IS NULL THEN enqueued_at END) FROM queue"
+        ).fetchone()
+        return {
+            "depth": depth,
+            "retrying": retrying,
+            "dead": dead,
+            "oldest_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "duplicates": self.duplicates,
+            "dedupe_filter_keys": self._bloom.count,
+            "dedupe_filter_bytes": self._bloom.size_bytes,
+        }
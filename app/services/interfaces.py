@@ -38,6 +38,16 @@ class DatabaseServiceInterface(ABC):
         """Query messages with filters."""
         pass
 
+class MessageSearchInterface(ABC):
+    """Interface for WhatsApp message search."""
+    
+    @abstractmethod
+    def search(self, content: Optional[str] = None, sender_name: Optional[str] = None,
+               start_date: Optional[str] = None, end_date: Optional[str] = None,
+               limit: int = 10) -> List[Dict[str, Any]]:
+        """Search messages, best matches first; rows carry id, sender_name, content, timestamp and rank."""
+        pass
+
 class CacheServiceInterface(ABC):
     """Interface for caching operations."""
     
@@ -56,6 +66,17 @@ class CacheServiceInterface(ABC):
         """Delete a value from cache."""
         pass
 
+class LoginServiceInterface(ABC):
+    """Interface for the single round-trip login pipeline."""
+    
+    @abstractmethod
+    def login(self, email: str, password: str) -> Optional[Dict[str, Any]]:
+        """Verify credentials, upsert the user and increment its login count atomically.
+        
+        Returns the ``usuarios_chatbot`` row, or None if the credentials are invalid.
+        """
+        pass
+
 class LoggingServiceInterface(ABC):
     """Interface for logging operations."""
     
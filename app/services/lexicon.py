@@ -0,0 +1,202 @@
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+import json
+import logging
+import re
+import unicodedata
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Bytes that are not [a-z0-9] become spaces, so bytes.split() yields the tokens
+_SEPARATORS = bytes(c if (48 <= c <= 57 or 97 <= c <= 122) else 32 for c in range(256))
+
+
+def _folded_bytes(text: str) -> bytes:
+    return unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore")
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents ("Benefício" -> "beneficio"); other non-ASCII characters are dropped."""
+    return _folded_bytes(text).decode("ascii")
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded word tokens of a text."""
+    return _folded_bytes(text).translate(_SEPARATORS).decode("ascii").split()
+
+
+class Lexicon:
+    """Multi-category keyword matcher built on a word-level Aho-Corasick automaton.
+
+    Terms are accent- and case-insensitive and may span several words
+    ("nao consegui"). A term ending in ``*`` matches any word starting with
+    it ("benefici*" matches "benefício" and "benefícios"; when several
+    prefixes fit the same word, the longest wins). Every category is counted
+    in a single pass over the message.
+
+    The automaton runs over words instead of characters, and only for
+    messages that share a word with the lexicon; prefix terms are matched by
+    one compiled pattern. This keeps the per-message Python work small.
+    """
+
+    def __init__(self, categories: Mapping[str, Iterable[str]]):
+        self.categories: List[str] = list(categories)
+        self._goto: List[Dict[bytes, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, int]]] = [[]]
+        self._terms: List[str] = []
+        self._prefixes: Dict[bytes, List[Tuple[int, int]]] = {}
+
+        for category_index, category in enumerate(self.categories):
+            for term in categories[category]:
+                words = [word.encode("ascii") for word in tokenize(term)]
+                if not words:
+                    continue
+                self._terms.append(term)
+                term_index = len(self._terms) - 1
+                if term.rstrip().endswith("*") and len(words) == 1:
+                    self._prefixes.setdefault(words[0], []).append((category_index, term_index))
+                else:
+                    self._add(words, category_index, term_index)
+        self._build_failure_links()
+        # Every word that appears in some term: messages sharing none skip the automaton
+        self._vocabulary = frozenset(word for state in self._goto for word in state)
+        # Prefix terms are matched at word starts by one compiled pattern (longest prefix first)
+        self._prefix_re = None
+        if self._prefixes:
+            alternatives = b"|".join(re.escape(p) for p in sorted(self._prefixes, key=len, reverse=True))
+            self._prefix_re = re.compile(rb"\b(?:" + alternatives + rb")")
+
+    def _add(self, words: List[bytes], category_index: int, term_index: int) -> None:
+        state = 0
+        for word in words:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((category_index, term_index))
+
+    def _build_failure_links(self) -> None:
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for word, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _scan(self, text: str) -> List[Tuple[int, int]]:
+        """(category_index, term_index) of every occurrence in the text."""
+        folded = _folded_bytes(text).translate(_SEPARATORS)
+        found: List[Tuple[int, int]] = []
+        tokens = folded.split()
+        if not self._vocabulary.isdisjoint(tokens):
+            goto, fail, out = self._goto, self._fail, self._out
+            state = 0
+            for token in tokens:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+                if state and out[state]:
+                    found.extend(out[state])
+        if self._prefix_re is not None:
+            for match in self._prefix_re.finditer(folded):
+                found.extend(self._prefixes[match.group()])
+        return found
+
+    def count(self, text: str) -> Dict[str, int]:
+        """Number of term occurrences per category (every category is present)."""
+        counts = [0] * len(self.categories)
+        if text:
+            for category_index, _ in self._scan(text):
+                counts[category_index] += 1
+        return dict(zip(self.categories, counts))
+
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """(category, term) of every occurrence, in text order."""
+        if not text:
+            return []
+        return [(self.categories[c], self._terms[t]) for c, t in self._scan(text)]
+
+
+# Categories used by Message.calculate_conversation_scores and ConversationScorer
+CONVERSATION_LEXICON = {
+    "persuasao": ["benefici*", "vantage*", "melhor*", "ideal*"],
+    "empatia": ["entendo", "compreendo", "ajudar*", "apoiar*"],
+    "positivo": [
+        "obrigad*", "otimo", "otima", "excelente", "perfeito", "perfeita", "gostei", "adorei",
+        "maravilh*", "show", "top", "legal", "satisfeit*", "feliz", "parabens",
+    ],
+    "negativo": [
+        "pessimo", "pessima", "horrivel", "ruim", "insatisfeit*", "decepcion*", "absurdo",
+        "reclama*", "demora*", "atrasad*", "chatead*", "irritad*", "nunca mais", "descaso",
+    ],
+    "objecao": [
+        "caro", "cara demais", "muito caro", "sem dinheiro", "sem orcamento", "vou pensar",
+        "nao tenho interesse", "nao preciso", "concorrente", "mais barato", "depois eu vejo",
+        "nao sei se", "nao confio", "sem tempo",
+    ],
+    "tratamento_objecao": [
+        "entendo", "compreendo", "faz sentido", "desconto*", "parcel*", "garantia", "condicao especial",
+        "posso oferecer", "alternativa*", "sem compromisso", "teste gratis", "custo beneficio", "retorno",
+    ],
+    "resolucao": [
+        "resolvid*", "resolveu", "solucionad*", "funcionou", "combinado", "fechado", "fechamos",
+        "pedido confirmado", "pagamento confirmado", "pago", "paguei", "recebi", "chegou", "deu certo",
+    ],
+    "pendente": [
+        "nao funcionou", "nao resolveu", "ainda nao", "continua", "aguardando", "sem resposta",
+        "problema", "erro", "cancelar", "cancelamento", "reembolso", "devolver", "devolucao",
+    ],
+}
+
+# Categories used by app.chatbot.utils.extract_entities
+ENTITY_LEXICON = {
+    "datas": [
+        "hoje", "amanha", "ontem", "segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo",
+        "janeiro", "fevereiro", "marco", "abril", "maio", "junho", "julho", "agosto",
+        "setembro", "outubro", "novembro", "dezembro", "semana que vem", "mes que vem",
+    ],
+}
+
+_lexicons: Dict[str, Lexicon] = {}
+
+def get_lexicon(name: str) -> Lexicon:
+    """Shared Lexicon by name ("conversation" or "entities"), loaded once per process.
+
+    ``Config.CONVERSATION_LEXICON_PATH`` / ``Config.ENTITY_LEXICON_PATH`` may
+    point to a JSON file replacing the built-in categories.
+    """
+    lexicon = _lexicons.get(name)
+    if lexicon is None:
+        if name == "conversation":
+            lexicon = load_lexicon(Config.CONVERSATION_LEXICON_PATH, CONVERSATION_LEXICON)
+        elif name == "entities":
+            lexicon = load_lexicon(Config.ENTITY_LEXICON_PATH, ENTITY_LEXICON)
+        else:
+            raise ValueError(f"Unknown lexicon: {name}")
+        _lexicons[name] = lexicon
+    return lexicon
+
+
+def load_lexicon(path: Optional[str], default: Mapping[str, Iterable[str]]) -> Lexicon:
+    """Build a Lexicon from a JSON file ({"category": ["term", ...]}), falling back to ``default``."""
+    categories = default
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                categories = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading lexicon from {path}, using defaults: {str(e)}")
+            categories = default
+    return Lexicon(categories)
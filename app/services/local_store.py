@@ -0,0 +1,71 @@
+from typing import Iterator
+from contextlib import contextmanager
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+class LocalSQLite:
+    """Per-thread, fork-aware connections to a local SQLite file.
+
+    Used by the host-local stores (shared cache, queues) so that all gunicorn
+    workers on a machine can share state through one file. Connections run
+    in autocommit mode with WAL enabled; use ``immediate`` for transactions.
+    """
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connection(self) -> sqlite3.Connection:
+        """Return a connection owned by the current thread and process."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        """Execute a single statement on the current thread's connection."""
+        return self.connection().execute(sql, params)
+
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """Run a read transaction: every query inside it sees the same snapshot."""
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN DEFERRED")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def immediate(self) -> Iterator[sqlite3.Connection]:
+        """Run a write transaction (BEGIN IMMEDIATE), committing on success.
+
+        Nested calls on the same thread join the outer transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
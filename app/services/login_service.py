@@ -0,0 +1,77 @@
+from typing import Dict, Any, Optional
+import datetime
+import logging
+import uuid
+from .interfaces import LoginServiceInterface
+from .local_store import LocalSQLite
+
+logger = logging.getLogger(__name__)
+
+class SupabaseLoginService(LoginServiceInterface):
+    """Login through the ``login_user`` Postgres function (scripts/sql/001_login_user.sql).
+
+    Credential check, user upsert and the login_count increment happen in a
+    single statement on the server, so login costs one round-trip and
+    concurrent logins cannot lose increments.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def login(self, email: str, password: str) -> Optional[Dict[str, Any]]:
+        response = self.client.rpc('login_user', {'p_email': email, 'p_password': password}).execute()
+        data = response.data
+        if isinstance(data, list):
+            return data[0] if data else None
+        return data or None
+
+
+class SQLiteLoginService(LoginServiceInterface):
+    """SQLite stand-in for ``login_user``, used by tests and local development.
+
+    Mirrors the Postgres function: one transaction that checks
+    ``usuarios_autorizados`` and upserts ``usuarios_chatbot`` with
+    ``ON CONFLICT (email) DO UPDATE ... RETURNING``.
+    """
+
+    def __init__(self, path: str):
+        self._db = LocalSQLite(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usuarios_autorizados ("
+            "email TEXT PRIMARY KEY, password TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS usuarios_chatbot ("
+            "id TEXT PRIMARY KEY, name TEXT, email TEXT UNIQUE, last_interaction TEXT, "
+            "login_count INTEGER DEFAULT 0, thread_id_atual TEXT, thread_id_novo TEXT, "
+            "thread_id_treinamento TEXT)"
+        )
+
+    def authorize(self, email: str, password: str) -> None:
+        """Add an entry to ``usuarios_autorizados``."""
+        self._db.execute(
+            "INSERT OR REPLACE INTO usuarios_autorizados (email, password) VALUES (?, ?)",
+            (email, password)
+        )
+
+    def login(self, email: str, password: str) -> Optional[Dict[str, Any]]:
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self._db.immediate() as conn:
+            authorized = conn.execute(
+                "SELECT 1 FROM usuarios_autorizados WHERE email = ? AND password = ?",
+                (email, password)
+            ).fetchone()
+            if not authorized:
+                return None
+            cursor = conn.execute(
+                "INSERT INTO usuarios_chatbot (id, name, email, last_interaction, login_count) "
+                "VALUES (?, 'Usuário Anônimo', ?, ?, 1) "
+                "ON CONFLICT (email) DO UPDATE SET "
+                "login_count = COALESCE(usuarios_chatbot.login_count, 0) + 1, "
+                "last_interaction = excluded.last_interaction "
+                "RETURNING *",
+                (str(uuid.uuid4()), email, now)
+            )
+            row = cursor.fetchall()[0]
+            columns = [column[0] for column in cursor.description]
+        return dict(zip(columns, row))
@@ -0,0 +1,235 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_NAME = r"[A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?"
+
+# Rules moved from VendasChatbot.extract_name, in priority order. Each rule
+# captures the name in its own named group. The old standalone
+# r"meu nome é ([A-Za-zÀ-ÿ]+)" rule was dropped: "meu_nome" below covers it.
+NAME_RULES = [
+    ("meu_nome", rf"meu nome[^\w]* (?:é|eh)[^\w]* (?P<meu_nome>{_NAME})"),  # "Meu nome é João Silva"
+    ("me_chamo", rf"me chamo[^\w]* (?P<me_chamo>{_NAME})"),  # "Me chamo João Silva"
+    ("me_chamar_de", rf"(?:pode[^\w]* )?me chamar de[^\w]* (?P<me_chamar_de>{_NAME})"),  # "Pode me chamar de João"
+    ("sou_o", rf"sou o (?P<sou_o>{_NAME})"),  # "Sou o João Silva"
+    ("sou_a", rf"sou a (?P<sou_a>{_NAME})"),  # "Sou a Maria Silva"
+    ("nome_no_fim", rf"\b(?P<nome_no_fim>{_NAME}) é meu nome"),  # "João Silva é meu nome"
+]
+# One compiled search per rule, tried in priority order: a single alternation
+# scanned with finditer would let an earlier, lower-priority match consume the
+# text of a higher-priority one ("sou o João meu nome é Pedro")
+_RULE_RES = [(group, re.compile(pattern, re.IGNORECASE)) for group, pattern in NAME_RULES]
+# Every rule contains one of these literals; messages without them skip the regex
+_RULE_KEYWORDS = ("nome", "chamo", "chamar", "sou ")
+
+# Words that the rules may capture but are never names
+COMMON_WORDS = frozenset([
+    "sim", "não", "nao", "ok", "oi", "olá", "ola", "bom", "boa", "dia", "tarde", "noite",
+    "obrigado", "obrigada", "ajuda", "claro", "todos", "todas", "porque", "como",
+    "quero", "queria", "vamos", "agora", "hoje", "amanhã", "amanha", "ontem",
+    "vendedor", "cliente", "pessoa", "gente", "pessoal", "equipe", "empresa"
+])
+
+# Placeholder for messages whose LLM request failed (``extract_many(..., on_failure=UNRESOLVED)``):
+# unlike None ("no name"), the answer is unknown and must not be cached
+UNRESOLVED = object()
+
+# Answers the LLM gives when there is no name
+NO_NAME_ANSWERS = frozenset(["nenhum", "none", "null", "não há", "não encontrado", ""])
+
+# Heuristic tier: strong and weak cues that a message may carry a name the rules missed
+_CUE_RE = re.compile(
+    r"\b(?:nome|chamo|chama|sou|aqui [ée]|falando|att|atenciosamente|assinado|prazer|"
+    r"name|i'm|i am|this is)\b",
+    re.IGNORECASE
+)
+_WEAK_CUE_RE = re.compile(r"\b(?:aqui|fala|quem)\b", re.IGNORECASE)
+# Short replies that look like a bare name but are not
+_FILLER_WORDS = frozenset(["valeu", "beleza", "blz", "kkk", "kkkk", "kkkkk", "tchau", "perfeito", "certo", "show"])
+_TOKEN_RE = re.compile(r"[A-Za-zÀ-ÿ]+|[.!?]")
+_URL_OR_NUMBER_RE = re.compile(r"https?://|www\.|\d{4,}")
+
+
+def match_name_rules(message: str) -> str:
+    """Return the name captured by the highest-priority rule, or an empty string.
+
+    Messages without any rule keyword are rejected with plain substring
+    checks; the rest try each precompiled rule in priority order, as the
+    original ``re.search`` loop did. Only a rule's first match counts: if it
+    is a common word or outside 2-30 characters, the next rule is tried.
+    """
+    if not message:
+        return ""
+    lowered = message.lower()
+    if not any(keyword in lowered for keyword in _RULE_KEYWORDS):
+        return ""
+    for group, pattern in _RULE_RES:
+        match = pattern.search(message)
+        if not match:
+            continue
+        name = match.group(group)
+        if name.lower() in COMMON_WORDS:
+            logger.debug(f"Extracted name '{name}' is a common word, skipping")
+            continue
+        if 2 <= len(name) <= 30:
+            return name
+    return ""
+
+
+def name_likelihood(message: str) -> float:
+    """Cheap linear score in [0, 1] of how likely a message is to contain a name.
+
+    Features: explicit (or weak) cue words, capitalized tokens that do not start a
+    sentence and are not common words, and a short capitalized reply
+    (answers like "Pedro"). Questions, links and long numbers lower the score.
+    """
+    score = 0.0
+    if _CUE_RE.search(message):
+        score += 0.6
+    elif _WEAK_CUE_RE.search(message):
+        score += 0.2
+
+    tokens = _TOKEN_RE.findall(message)
+    words = [token for token in tokens if token not in ".!?"]
+    candidates = 0
+    sentence_start = True
+    for token in tokens:
+        if token in ".!?":
+            sentence_start = True
+            continue
+        if not sentence_start and token[0].isupper() and token.lower() not in COMMON_WORDS:
+            candidates += 1
+        sentence_start = False
+    score += min(candidates, 2) * 0.2
+
+    if (1 <= len(words) <= 3 and words[0][0].isupper()
+            and words[0].lower() not in COMMON_WORDS and words[0].lower() not in _FILLER_WORDS):
+        score += 0.4
+    if "?" in message:
+        score -= 0.2
+    if _URL_OR_NUMBER_RE.search(message):
+        score -= 0.3
+    return max(0.0, min(1.0, score))
+
+
+def clean_llm_name(name: Optional[str]) -> Optional[str]:
+    """Validate a name returned by the LLM tier (same checks WhatsAppChatbot used)."""
+    if not isinstance(name, str):
+        return None
+    name = name.strip()
+    if name.lower() in NO_NAME_ANSWERS or len(name) <= 2 or len(name) > 30:
+        return None
+    if name.lower() in COMMON_WORDS or name.lower() in ("é", "eh"):
+        return None
+    return name
+
+
+class OpenAINameResolver:
+    """Resolves many messages with one chat completion using JSON output."""
+
+    SYSTEM_PROMPT = (
+        "Para cada mensagem numerada, extraia apenas o primeiro nome da pessoa que escreve, "
+        "se ela se identificar. Responda em JSON no formato "
+        '{"names": [{"i": 0, "name": "Maria"}, {"i": 1, "name": null}]}, '
+        "com uma entrada por mensagem e null quando não houver nome."
+    )
+
+    def __init__(self, client_getter: Callable, model: str = "gpt-3.5-turbo"):
+        self.client_getter = client_getter
+        self.model = model
+
+    def __call__(self, messages: Sequence[str]) -> List[Optional[str]]:
+        numbered = "\n".join(f"{i}: {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(messages))
+        response = self.client_getter().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": numbered}
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=16 * len(messages) + 32
+        )
+        payload = json.loads(response.choices[0].message.content)
+        names: List[Optional[str]] = [None] * len(messages)
+        for position, entry in enumerate(payload.get("names", [])):
+            if isinstance(entry, dict):
+                index, name = entry.get("i", position), entry.get("name")
+            else:
+                index, name = position, entry
+            if isinstance(index, int) and 0 <= index < len(messages):
+                names[index] = name
+        return names
+
+
+class NameExtractor:
+    """Tiered name extraction: rules, then a local classifier, then a batched LLM.
+
+    1. ``match_name_rules`` resolves explicit introductions locally.
+    2. ``name_likelihood`` discards messages that almost surely carry no name.
+    3. The remaining (ambiguous) messages go to ``llm_resolver`` in batches
+       of ``batch_size``, one request per batch.
+
+    ``stats`` counts how many messages each tier resolved.
+    """
+
+    def __init__(self, llm_resolver: Optional[Callable[[Sequence[str]], List[Optional[str]]]] = None,
+                 batch_size: int = 20, ambiguity_threshold: float = 0.4):
+        self.llm_resolver = llm_resolver
+        self.batch_size = batch_size
+        self.ambiguity_threshold = ambiguity_threshold
+        self.stats: Dict[str, int] = {
+            'messages': 0, 'rule_hits': 0, 'local_rejects': 0, 'llm_messages': 0, 'llm_requests': 0
+        }
+
+    def classify(self, message: str) -> Tuple[str, Optional[str]]:
+        """Return ('rule', name), ('none', None) or ('ambiguous', None)."""
+        text = (message or "").strip()
+        if len(text) <= 2:
+            return 'none', None
+        name = match_name_rules(text)
+        if name:
+            return 'rule', name
+        if name_likelihood(text) < self.ambiguity_threshold:
+            return 'none', None
+        return 'ambiguous', None
+
+    def extract_many(self, messages: Sequence[str], on_failure: Any = None) -> List[Optional[str]]:
+        """Extract a name (or None) for each message, batching the LLM tier.
+
+        Messages whose LLM request failed get ``on_failure`` instead (e.g.
+        ``UNRESOLVED``, so callers can tell them from "no name").
+        """
+        results: List[Optional[str]] = [None] * len(messages)
+        ambiguous: List[int] = []
+        for index, message in enumerate(messages):
+            tier, name = self.classify(message)
+            if tier == 'rule':
+                results[index] = name
+                self.stats['rule_hits'] += 1
+            elif tier == 'none':
+                self.stats['local_rejects'] += 1
+            else:
+                ambiguous.append(index)
+        self.stats['messages'] += len(messages)
+
+        if ambiguous and self.llm_resolver is not None:
+            for start in range(0, len(ambiguous), self.batch_size):
+                chunk = ambiguous[start:start + self.batch_size]
+                self.stats['llm_requests'] += 1
+                self.stats['llm_messages'] += len(chunk)
+                try:
+                    names = self.llm_resolver([messages[i] for i in chunk])
+                except Exception as e:
+                    logger.error(f"Error resolving {len(chunk)} names with the LLM: {e}", exc_info=True)
+                    for index in chunk:
+                        results[index] = on_failure
+                    continue
+                for index, name in zip(chunk, names):
+                    results[index] = clean_llm_name(name)
+        return results
+
+    def extract(self, message: str, on_failure: Any = None) -> Optional[str]:
+        return self.extract_many([message], on_failure)[0]
@@ -0,0 +1,180 @@
+from typing import Dict, List, Any, Optional, Callable, Sequence
+import hashlib
+import logging
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_NORMALIZE_RE = re.compile(r"[^a-z0-9\s]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text locally, without calling a tokenizer.
+
+    Each word or punctuation mark counts as one token, and long words count
+    as an extra token per six characters, which tracks BPE tokenizers
+    closely enough for Portuguese text to be used as a budget guard.
+    """
+    if not text:
+        return 0
+    return sum(1 + len(piece) // 6 for piece in _WORD_RE.findall(text))
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and punctuation and collapse whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _SPACES_RE.sub(" ", _NORMALIZE_RE.sub(" ", stripped)).strip()
+
+
+def simhash(text: str, bits: int = 64) -> int:
+    """Compute a SimHash fingerprint over word bigrams of the normalized text."""
+    words = normalize_text(text).split()
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + 2]) for i in range(max(1, len(words) - 1))]
+    weights = [0] * bits
+    for shingle in shingles:
+        digest = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if digest >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class PromptBudgetBuilder:
+    """Selects items for a prompt so that it never exceeds a token budget.
+
+    Items are split into chronological strata and picked round-robin across
+    them, so old and recent history are both represented no matter how long
+    the history is. Near-duplicates (SimHash within ``dedupe_distance`` bits)
+    are skipped, and the selection stops as soon as the budget is full.
+    """
+
+    def __init__(self, token_budget: int, strata: int = 8, dedupe_distance: int = 3,
+                 max_item_tokens: Optional[int] = None,
+                 estimator: Callable[[str], int] = estimate_tokens):
+        if token_budget <= 0:
+            raise ValueError("token_budget must be positive")
+        self.token_budget = token_budget
+        self.strata = max(1, strata)
+        self.dedupe_distance = dedupe_distance
+        self.max_item_tokens = max_item_tokens or max(1, token_budget // 4)
+        self.estimator = estimator
+
+    def _truncate(self, text: str) -> str:
+        """Cut a single oversized item down to ``max_item_tokens``."""
+        if self.estimator(text) <= self.max_item_tokens:
+            return text
+        words = text.split()
+        kept: List[str] = []
+        used = 0
+        for word in words:
+            cost = self.estimator(word)
+            if used + cost > self.max_item_tokens:
+                break
+            kept.append(word)
+            used += cost
+        return " ".join(kept) + " (...)"
+
+    @staticmethod
+    def _spread_order(length: int) -> List[int]:
+        """Order positions 0..length-1 by repeated bisection (middle, quartiles, ...).
+
+        Taking any prefix of this order gives picks spread evenly over the
+        range instead of clustered at one edge.
+        """
+        order: List[int] = []
+        intervals = [(0, length)]
+        while intervals:
+            next_intervals = []
+            for start, end in intervals:
+                if start >= end:
+                    continue
+                middle = (start + end) // 2
+                order.append(middle)
+                next_intervals.extend([(start, middle), (middle + 1, end)])
+            intervals = next_intervals
+        return order
+
+    def _round_robin(self, count: int) -> List[int]:
+        """Return item indexes ordered so that every stratum is visited in turn."""
+        strata = min(self.strata, count)
+        bounds = [round(i * count / strata) for i in range(strata + 1)]
+        queues = [
+            [start + position for position in self._spread_order(end - start)]
+            for start, end in zip(bounds, bounds[1:])
+        ]
+        order: List[int] = []
+        depth = 0
+        while len(order) < count:
+            for queue in queues:
+                if depth < len(queue):
+                    order.append(queue[depth])
+            depth += 1
+        return order
+
+    def select(self, items: Sequence[Dict[str, Any]], text_key: str = "content",
+               time_key: Optional[str] = "timestamp", reserved_tokens: int = 0,
+               per_item_tokens: int = 1) -> List[Dict[str, Any]]:
+        """Pick the items that fit the budget, returned in chronological order.
+
+        Args:
+            items: Rows to choose from (e.g. ``mensagens_chatbot`` rows)
+            text_key: Key holding the text of each row
+            time_key: Key used to order rows chronologically (None keeps input order)
+            reserved_tokens: Tokens already used by the fixed part of the prompt
+            per_item_tokens: Fixed cost added to each item (separator, role prefix)
+
+        Returns:
+            The selected rows, each with ``text_key`` truncated if needed
+        """
+        candidates = [item for item in items if (item.get(text_key) or "").strip()]
+        if time_key:
+            candidates.sort(key=lambda item: str(item.get(time_key) or ""))
+        if not candidates:
+            return []
+
+        budget = self.token_budget - reserved_tokens
+        fingerprints: List[int] = []
+        chosen: Dict[int, Dict[str, Any]] = {}
+        used = 0
+        skipped_duplicates = 0
+
+        for index in self._round_robin(len(candidates)):
+            text = self._truncate(candidates[index][text_key].strip())
+            cost = self.estimator(text) + per_item_tokens
+            if used + cost > budget:
+                continue
+            fingerprint = simhash(text)
+            if any(bin(fingerprint ^ seen).count("1") <= self.dedupe_distance for seen in fingerprints):
+                skipped_duplicates += 1
+                continue
+            fingerprints.append(fingerprint)
+            chosen[index] = {**candidates[index], text_key: text}
+            used += cost
+            if budget - used <= 1:
+                break
+
+        logger.debug(
+            f"Prompt budget: {len(chosen)}/{len(candidates)} itens selecionados, "
+            f"{used}/{budget} tokens, {skipped_duplicates} quase-duplicados ignorados"
+        )
+        return [chosen[index] for index in sorted(chosen)]
+
+    def build(self, items: Sequence[Dict[str, Any]], render: Callable[[Dict[str, Any]], str],
+              header: str = "", text_key: str = "content",
+              time_key: Optional[str] = "timestamp") -> str:
+        """Render ``header`` followed by one line per selected item."""
+        # Prefixos como "Vendedor: " também consomem tokens em cada linha
+        prefix_tokens = max((self.estimator(render({**item, text_key: ""})) for item in items[:50]), default=0)
+        selected = self.select(items, text_key=text_key, time_key=time_key,
+                               reserved_tokens=self.estimator(header),
+                               per_item_tokens=prefix_tokens + 1)
+        return header + "\n".join(render(item) for item in selected)
@@ -0,0 +1,128 @@
+from typing import Any, Callable, Dict, List, Optional
+import datetime
+import gzip
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+class RetentionEngine:
+    """Rolling retention for an append-only table, deleting in bounded chunks.
+
+    Each run removes the rows whose ``time_column`` is older than ``window``:
+    it selects up to ``chunk_size`` of them ordered by id, optionally hands
+    them to ``archive_fn``, and deletes exactly those ids, sleeping ``pause``
+    seconds between chunks. A run stops after ``max_chunks`` chunks or
+    ``max_duration`` seconds (the next run continues where it stopped), and
+    when archiving fails nothing else is deleted.
+
+    Progress of the current/last run is kept in ``progress`` and, when a
+    ``cache`` is given, published under ``retention:<table>`` so every
+    worker can report it.
+    """
+
+    def __init__(self, client, table: str, window: datetime.timedelta, time_column: str = "timestamp",
+                 chunk_size: int = 1000, pause: float = 0.2, max_chunks: Optional[int] = None,
+                 max_duration: Optional[float] = None,
+                 archive_fn: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 cache=None, sleep: Callable[[float], None] = time.sleep):
+        self.client = client
+        self.table = table
+        self.window = window
+        self.time_column = time_column
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.max_chunks = max_chunks
+        self.max_duration = max_duration
+        self.archive_fn = archive_fn
+        self.cache = cache
+        self.sleep = sleep
+        self.progress: Dict[str, Any] = {}
+
+    def cutoff(self, now: Optional[datetime.datetime] = None) -> str:
+        return ((now or datetime.datetime.now()) - self.window).isoformat()
+
+    def _select_chunk(self, cutoff: str) -> List[Dict[str, Any]]:
+        columns = "*" if self.archive_fn else "id"
+        return self.client.table(self.table).select(columns)\
+            .lt(self.time_column, cutoff)\
+            .order("id")\
+            .limit(self.chunk_size)\
+            .execute().data or []
+
+    def _publish(self) -> None:
+        if self.cache is not None:
+            self.cache.set(f"retention:{self.table}", self.progress)
+
+    def run(self, now: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+        """Delete expired rows chunk by chunk and return the run's progress."""
+        cutoff = self.cutoff(now)
+        started = time.monotonic()
+        self.progress = {
+            "table": self.table,
+            "cutoff": cutoff,
+            "started_at": datetime.datetime.now().isoformat(),
+            "finished_at": None,
+            "status": "running",
+            "chunks": 0,
+            "deleted": 0,
+            "archived": 0,
+            "duration_seconds": 0.0,
+        }
+        self._publish()
+        status = "done"
+        try:
+            while True:
+                if self.max_chunks is not None and self.progress["chunks"] >= self.max_chunks:
+                    status = "partial"
+                    break
+                if self.max_duration is not None and time.monotonic() - started >= self.max_duration:
+                    status = "partial"
+                    break
+                rows = self._select_chunk(cutoff)
+                if not rows:
+                    break
+                if self.archive_fn is not None:
+                    self.archive_fn(rows)
+                    self.progress["archived"] += len(rows)
+                ids = [row["id"] for row in rows]
+                self.client.table(self.table).delete().in_("id", ids).execute()
+                self.progress["chunks"] += 1
+                self.progress["deleted"] += len(ids)
+                self.progress["duration_seconds"] = round(time.monotonic() - started, 3)
+                self._publish()
+                logger.info(f"Retention {self.table}: {self.progress['deleted']} rows deleted "
+                            f"({self.progress['chunks']} chunks)")
+                if len(rows) < self.chunk_size:
+                    break
+                if self.pause:
+                    self.sleep(self.pause)
+        except Exception as e:
+            status = "error"
+            self.progress["error"] = str(e)
+            logger.error(f"Retention of {self.table} stopped: {str(e)}", exc_info=True)
+        self.progress["status"] = status
+        self.progress["finished_at"] = datetime.datetime.now().isoformat()
+        self.progress["duration_seconds"] = round(time.monotonic() - started, 3)
+        self._publish()
+        return self.progress
+
+
+def jsonl_archiver(directory: str) -> Callable[[List[Dict[str, Any]]], None]:
+    """Archive rows as gzip JSON lines, one file per day (``<directory>/YYYY-MM-DD.jsonl.gz``)."""
+    def archive(rows: List[Dict[str, Any]]) -> None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{datetime.date.today().isoformat()}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+    return archive
+
+
+def table_archiver(client, table: str) -> Callable[[List[Dict[str, Any]]], None]:
+    """Archive rows into another table (same columns), ignoring rows already archived."""
+    def archive(rows: List[Dict[str, Any]]) -> None:
+        client.table(table).upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+    return archive
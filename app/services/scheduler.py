@@ -0,0 +1,239 @@
+from typing import Any, Callable, Dict, List, Optional
+import datetime
+import fcntl
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class FileLeaderLock:
+    """Host-level leadership through an exclusive, non-blocking ``flock``.
+
+    The lock belongs to the process that holds the file descriptor; the
+    kernel releases it when that process exits, so another worker takes
+    over on its next attempt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    def acquire(self) -> bool:
+        if self._fd is not None and self._pid == os.getpid():
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd, self._pid = fd, os.getpid()
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None and self._pid == os.getpid():
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = self._pid = None
+
+
+class PostgresAdvisoryLock:
+    """Deployment-level leadership through ``pg_try_advisory_lock`` on a dedicated connection.
+
+    Session advisory locks live as long as the connection, so the connection
+    is kept open while leading and checked before every use; if it drops,
+    leadership is lost and re-acquired on a later attempt. Needs psycopg2
+    (imported lazily) and a direct Postgres DSN.
+    """
+
+    def __init__(self, dsn: str, key: int):
+        self.dsn = dsn
+        self.key = key
+        self._conn = None
+
+    def acquire(self) -> bool:
+        if self._conn is not None:
+            try:
+                with self._conn.cursor() as cursor:
+                    cursor.execute("select 1")
+                return True
+            except Exception as e:
+                logger.warning(f"Advisory lock connection lost: {str(e)}")
+                self._close()
+        try:
+            import psycopg2
+            conn = psycopg2.connect(self.dsn)
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute("select pg_try_advisory_lock(%s)", (self.key,))
+                acquired = cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error acquiring advisory lock {self.key}: {str(e)}")
+            return False
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def _close(self) -> None:
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def release(self) -> None:
+        if self._conn is None:
+            return
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute("select pg_advisory_unlock(%s)", (self.key,))
+        except Exception:
+            pass
+        self._close()
+
+
+class LeaderElection:
+    """Leader = holder of every configured lock (file lock first, then the optional database lock).
+
+    The file lock elects one worker per host without any network call; the
+    advisory lock, when configured, elects one host per deployment.
+    """
+
+    def __init__(self, locks: List[Any]):
+        self.locks = locks
+        self.is_leader = False
+
+    def try_acquire(self) -> bool:
+        acquired: List[Any] = []
+        for lock in self.locks:
+            if not lock.acquire():
+                # Without every lock this process does not lead; free the ones it took
+                for held in reversed(acquired):
+                    held.release()
+                if self.is_leader:
+                    logger.warning("Scheduler leadership lost")
+                self.is_leader = False
+                return False
+            acquired.append(lock)
+        if not self.is_leader:
+            logger.info(f"Scheduler leadership acquired by pid {os.getpid()}")
+        self.is_leader = True
+        return True
+
+    def release(self) -> None:
+        for lock in reversed(self.locks):
+            lock.release()
+        self.is_leader = False
+
+
+class JobScheduler:
+    """Job registry on top of APScheduler that runs each job once per deployment.
+
+    Every worker may start the scheduler; each job run first checks
+    leadership (``election.try_acquire()``) and returns immediately in
+    non-leaders. A job registered with its own ``election`` (e.g. a file
+    lock only, for work on host-local files) is led by that one instead.
+    Runs of the same job never overlap: APScheduler gets
+    ``max_instances=1`` / ``coalesce=True`` and a per-job lock skips (and
+    counts) a run that starts while the previous one is still going.
+
+    ``stats`` keeps, per job, run counts, skips, failures and the duration
+    and status of the last run. After each run, that job's entry (with the
+    pid that ran it) is merged into ``scheduler:jobs`` in ``cache``, so any
+    worker can report every job even when different workers lead them.
+    """
+
+    def __init__(self, election: LeaderElection, cache=None, scheduler=None):
+        if scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+            scheduler = BackgroundScheduler()
+        self.election = election
+        self.cache = cache
+        self.scheduler = scheduler
+        self.jobs: Dict[str, Callable[[], Any]] = {}
+        self.elections: Dict[str, LeaderElection] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, threading.Lock] = {}
+
+    def register(self, job_id: str, func: Callable[[], Any], minutes: float, name: Optional[str] = None,
+                 election: Optional[LeaderElection] = None) -> None:
+        """Run ``func`` every ``minutes`` minutes in the leader of ``election`` (the scheduler's by default)."""
+        from apscheduler.triggers.interval import IntervalTrigger
+        self.jobs[job_id] = func
+        self.elections[job_id] = election or self.election
+        self._running[job_id] = threading.Lock()
+        self.stats[job_id] = {
+            "name": name or job_id, "interval_minutes": minutes, "runs": 0, "failures": 0,
+            "skipped_overlap": 0, "last_started_at": None, "last_duration_seconds": None, "last_status": None,
+        }
+        self.scheduler.add_job(
+            func=self.run_job,
+            args=[job_id],
+            trigger=IntervalTrigger(minutes=minutes),
+            id=job_id,
+            name=name or job_id,
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+    def run_job(self, job_id: str) -> Optional[str]:
+        """Run a registered job now if this process leads; return its status (None when not leader)."""
+        if not self.elections[job_id].try_acquire():
+            return None
+        running = self._running[job_id]
+        stats = self.stats[job_id]
+        if not running.acquire(blocking=False):
+            stats["skipped_overlap"] += 1
+            logger.warning(f"Job {job_id} still running, skipping this run")
+            self._publish(job_id)
+            return "skipped"
+        started = time.monotonic()
+        stats["last_started_at"] = datetime.datetime.now().isoformat()
+        status = "ok"
+        try:
+            self.jobs[job_id]()
+        except Exception as e:
+            status = "error"
+            stats["failures"] += 1
+            logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+        finally:
+            running.release()
+        stats["runs"] += 1
+        stats["last_duration_seconds"] = round(time.monotonic() - started, 3)
+        stats["last_status"] = status
+        self._publish(job_id)
+        return status
+
+    def _publish(self, job_id: str) -> None:
+        if self.cache is None:
+            return
+        try:
+            # Read-modify-write under the cache's write lock: other jobs' entries are kept
+            with self.cache.transaction():
+                published = self.cache.get("scheduler:jobs") or {}
+                jobs = published.get("jobs") or {}
+                jobs[job_id] = dict(self.stats[job_id], leader_pid=os.getpid())
+                self.cache.set("scheduler:jobs", {"jobs": jobs})
+        except Exception as e:
+            logger.error(f"Error publishing stats of job {job_id}: {str(e)}")
+
+    def start(self) -> None:
+        self.scheduler.start()
+
+    def shutdown(self) -> None:
+        try:
+            self.scheduler.shutdown(wait=False)
+        finally:
+            for election in {id(e): e for e in [self.election, *self.elections.values()]}.values():
+                election.release()
@@ -0,0 +1,241 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import logging
+import re
+import threading
+from postgrest.exceptions import APIError
+from .cache_service import hashed_key
+from .interfaces import MessageSearchInterface
+from .lexicon import fold, tokenize
+from .local_store import LocalSQLite
+
+logger = logging.getLogger(__name__)
+
+# Columns returned by every search backend
+SEARCH_COLUMNS = ("id", "sender_name", "content", "timestamp", "rank")
+
+# Function words dropped from content queries (accent-folded)
+STOPWORDS = frozenset([
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das", "em", "no", "na",
+    "nos", "nas", "por", "para", "pra", "com", "sem", "e", "ou", "que", "se", "ao", "aos", "me", "te",
+    "eu", "voce", "ele", "ela", "nao", "sim", "mais", "muito", "sobre", "qual", "quais", "tem",
+])
+
+# Version counter (VersionWatermarks) bumped whenever whatsapp_messages changes
+WHATSAPP_MESSAGES_VERSION: Tuple[str, str] = ("table", "whatsapp_messages")
+
+# PostgREST error code for a function that does not exist (migration not applied yet)
+FUNCTION_NOT_FOUND = "PGRST202"
+
+_DATE_ONLY = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def search_terms(text: Optional[str]) -> List[str]:
+    """Accent-folded, lowercase query terms without stopwords, in order and deduplicated."""
+    terms: List[str] = []
+    for token in tokenize(text or ""):
+        if token not in STOPWORDS and token not in terms:
+            terms.append(token)
+    return terms
+
+
+def query_terms(text: Optional[str]) -> List[str]:
+    """Terms every backend searches for: ``search_terms``, or every word when the text is only stopwords."""
+    terms = search_terms(text)
+    if text and not terms:
+        # Only stopwords: nothing selective to search for, but still a content filter
+        for token in tokenize(text):
+            if token not in terms:
+                terms.append(token)
+    return terms
+
+
+def end_of_day(end_date: Optional[str]) -> Optional[str]:
+    """Make a bare ``YYYY-MM-DD`` end date inclusive of the whole day."""
+    if end_date and _DATE_ONLY.match(end_date):
+        return f"{end_date}T23:59:59.999999"
+    return end_date
+
+
+class SupabaseMessageSearch(MessageSearchInterface):
+    """Search through the ``search_whatsapp_messages`` Postgres function
+    (scripts/sql/008_whatsapp_message_search.sql).
+
+    Content terms are matched as Portuguese full-text prefixes against a GIN
+    index and ranked with ``ts_rank_cd``; the sender filter is an accent- and
+    case-insensitive substring match backed by a trigram index. Only the
+    ``SEARCH_COLUMNS`` travel back. Until the migration is applied, the old
+    ``ilike`` query is used.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def search(self, content: Optional[str] = None, sender_name: Optional[str] = None,
+               start_date: Optional[str] = None, end_date: Optional[str] = None,
+               limit: int = 10) -> List[Dict[str, Any]]:
+        params = {
+            "p_terms": query_terms(content),
+            "p_sender": sender_name or None,
+            "p_start": start_date or None,
+            "p_end": end_of_day(end_date),
+            "p_limit": limit,
+        }
+        try:
+            return self.client.rpc("search_whatsapp_messages", params).execute().data or []
+        except APIError as e:
+            if getattr(e, "code", None) != FUNCTION_NOT_FOUND:
+                raise
+            logger.warning("search_whatsapp_messages not found, falling back to ilike")
+            return self._ilike_search(content, sender_name, start_date, end_date, limit)
+
+    def _ilike_search(self, content, sender_name, start_date, end_date, limit) -> List[Dict[str, Any]]:
+        query = self.client.table("whatsapp_messages").select("id,sender_name,content,timestamp")
+        if sender_name:
+            query = query.ilike("sender_name", f"%{sender_name}%")
+        if content:
+            query = query.ilike("content", f"%{content}%")
+        if start_date:
+            query = query.gte("timestamp", start_date)
+        if end_date:
+            query = query.lte("timestamp", end_of_day(end_date))
+        return query.order("timestamp", desc=True).limit(limit).execute().data or []
+
+
+class SQLiteMessageSearch(MessageSearchInterface):
+    """SQLite FTS5 stand-in for ``search_whatsapp_messages``, used by tests and benchmarks.
+
+    Same contract as the Postgres function: content terms must all match as
+    prefixes (``unicode61`` tokenizer with diacritics removed), results are
+    ranked by ``bm25`` then by recency, and the sender filter is an
+    accent-insensitive substring match.
+    """
+
+    def __init__(self, path: str):
+        self._db = LocalSQLite(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS whatsapp_messages ("
+            "id INTEGER PRIMARY KEY, sender_name TEXT, sender_folded TEXT, content TEXT, timestamp TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS whatsapp_messages_timestamp ON whatsapp_messages (timestamp)")
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS whatsapp_messages_fts USING fts5("
+            "content, content='whatsapp_messages', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def add_many(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Insert rows ({id?, sender_name, content, timestamp}) and index them."""
+        with self._db.immediate() as conn:
+            for row in rows:
+                cursor = conn.execute(
+                    "INSERT INTO whatsapp_messages (id, sender_name, sender_folded, content, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (row.get("id"), row.get("sender_name"), fold(row.get("sender_name") or ""),
+                     row.get("content"), row.get("timestamp"))
+                )
+                conn.execute(
+                    "INSERT INTO whatsapp_messages_fts (rowid, content) VALUES (?, ?)",
+                    (cursor.lastrowid, row.get("content"))
+                )
+
+    def search(self, content: Optional[str] = None, sender_name: Optional[str] = None,
+               start_date: Optional[str] = None, end_date: Optional[str] = None,
+               limit: int = 10) -> List[Dict[str, Any]]:
+        terms = query_terms(content)
+        where, params = [], []
+        if terms:
+            # bm25() is lower for better matches; negate it so a higher rank is better, as in Postgres
+            source = "whatsapp_messages_fts JOIN whatsapp_messages m ON m.id = whatsapp_messages_fts.rowid"
+            rank = "-bm25(whatsapp_messages_fts)"
+            order = "rank DESC, m.timestamp DESC"
+            where.append("whatsapp_messages_fts MATCH ?")
+            params.append(" AND ".join(f'"{term}"*' for term in terms))
+        else:
+            source = "whatsapp_messages m"
+            rank = "0.0"
+            order = "m.timestamp DESC"
+        if sender_name:
+            where.append("m.sender_folded LIKE ?")
+            params.append(f"%{fold(sender_name)}%")
+        if start_date:
+            where.append("m.timestamp >= ?")
+            params.append(start_date)
+        if end_date:
+            where.append("m.timestamp <= ?")
+            params.append(end_of_day(end_date))
+        sql = (f"SELECT m.id, m.sender_name, m.content, m.timestamp, {rank} AS rank FROM {source}"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + f" ORDER BY {order} LIMIT ?")
+        params.append(limit)
+        rows = self._db.execute(sql, params).fetchall()
+        return [dict(zip(SEARCH_COLUMNS, row)) for row in rows]
+
+
+class CachedMessageSearch(MessageSearchInterface):
+    """Result cache in front of another message search, for repeated tool calls.
+
+    Results are stored in the shared cache under the normalized parameters
+    (folded, sorted content terms; folded sender; inclusive end date; limit)
+    plus the current generation of ``whatsapp_messages`` in ``versions``.
+    Writers bump that generation (``versions.bump(*WHATSAPP_MESSAGES_VERSION)``)
+    after inserting or deleting messages, so every older entry stops matching
+    at once and simply expires after ``ttl`` seconds.
+
+    Generations are host-local like the shared cache itself; ``ttl`` bounds
+    how stale a result can be when messages are written on another host.
+    """
+
+    def __init__(self, search: MessageSearchInterface, versions, ttl: int = 300,
+                 scope: Tuple[str, str] = WHATSAPP_MESSAGES_VERSION):
+        self.search_backend = search
+        self.versions = versions
+        self.ttl = ttl
+        self.scope = scope
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(content: Optional[str] = None, sender_name: Optional[str] = None,
+                  start_date: Optional[str] = None, end_date: Optional[str] = None,
+                  limit: int = 10) -> List[Any]:
+        """Parameters that give the same results map to the same list."""
+        return [
+            sorted(query_terms(content)),
+            fold(sender_name.strip()) if sender_name else None,
+            start_date or None,
+            end_of_day(end_date) or None,
+            int(limit),
+        ]
+
+    def _key(self, normalized: List[Any]) -> str:
+        generation = self.versions.get(*self.scope)
+        raw = json.dumps([self.versions.cache.epoch, generation, normalized], separators=(",", ":"))
+        return hashed_key(f"search:{self.scope[1]}", raw)
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def search(self, content: Optional[str] = None, sender_name: Optional[str] = None,
+               start_date: Optional[str] = None, end_date: Optional[str] = None,
+               limit: int = 10) -> List[Dict[str, Any]]:
+        key = self._key(self.normalize(content, sender_name, start_date, end_date, limit))
+        cached = self.versions.cache.get(key)
+        if cached is not None:
+            self._count(True)
+            return cached
+        self._count(False)
+        rows = self.search_backend.search(content=content, sender_name=sender_name,
+                                          start_date=start_date, end_date=end_date, limit=limit)
+        self.versions.cache.set(key, rows, ttl=self.ttl)
+        return rows
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "generation": self.versions.get(*self.scope)}
@@ -0,0 +1,327 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+import os
+import zlib
+from .local_store import LocalSQLite
+from .search_service import STOPWORDS
+from .lexicon import tokenize
+from config import Config
+
+try:
+    import numpy as np
+except ImportError:  # numpy é opcional: sem ele o índice semântico fica desligado
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class HashingVectorizer:
+    """Hashed TF-IDF over words and character trigrams, projected to ``dim`` dimensions.
+
+    Each accent-folded word (stopwords removed) contributes itself, a crude
+    stem (its first five letters) and its trigrams (``<reclamacao>`` ->
+    ``<re``, ``rec``...), so inflections of the same stem ("reclamei",
+    "reclamação", "reclamando") end up close. Features
+    are hashed with CRC32: the hash picks a document-frequency bucket and a
+    signed output dimension (feature hashing), so no vocabulary is stored.
+    """
+
+    def __init__(self, dim: int = 256, buckets: int = 1 << 20, max_memo: int = 200000):
+        self.dim = dim
+        self.buckets = buckets
+        self.max_memo = max_memo
+        self._memo: Dict[str, List[Tuple[int, float]]] = {}
+
+    def _word_features(self, word: str) -> List[Tuple[int, float]]:
+        features = self._memo.get(word)
+        if features is None:
+            padded = f"<{word}>"
+            grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+            # A palavra e o radical (5 primeiras letras) pesam 1 cada; os trigramas dividem mais 1
+            features = [(zlib.crc32(word.encode("ascii")), 1.0)]
+            if len(word) > 5:
+                features.append((zlib.crc32(b"~" + word[:5].encode("ascii")), 1.0))
+            features += [(zlib.crc32(b"#" + gram.encode("ascii")), 1.0 / len(grams)) for gram in grams]
+            if len(self._memo) >= self.max_memo:
+                self._memo.clear()
+            self._memo[word] = features
+        return features
+
+    def features(self, text: Optional[str]) -> Dict[int, float]:
+        """Term frequencies by feature hash."""
+        counts: Dict[int, float] = {}
+        for word in tokenize(text or ""):
+            if word in STOPWORDS:
+                continue
+            for h, weight in self._word_features(word):
+                counts[h] = counts.get(h, 0.0) + weight
+        return counts
+
+    def batch(self, texts: Sequence[Optional[str]]):
+        """Flattened features of a batch: (doc index, hash, tf) arrays."""
+        docs: List[int] = []
+        hashes: List[int] = []
+        tfs: List[float] = []
+        for i, text in enumerate(texts):
+            counts = self.features(text)
+            docs.extend([i] * len(counts))
+            hashes.extend(counts.keys())
+            tfs.extend(counts.values())
+        return (np.asarray(docs, dtype=np.int64), np.asarray(hashes, dtype=np.int64),
+                np.asarray(tfs, dtype=np.float32))
+
+    def project(self, n_docs: int, docs, hashes, tfs, df, n_total: int):
+        """L2-normalized float32 matrix (n_docs x dim) from flattened features and document frequencies."""
+        buckets = hashes % self.buckets
+        idf = np.log((1.0 + n_total) / (1.0 + df[buckets])).astype(np.float32) + 1.0
+        sign = np.where((hashes // self.dim) & 1, -1.0, 1.0).astype(np.float32)
+        # tf sublinear acima de 1; pesos fracionários (trigramas) ficam como estão
+        weights = np.where(tfs > 1.0, 1.0 + np.log(np.maximum(tfs, 1.0)), tfs) * idf * sign
+        matrix = np.zeros((n_docs, self.dim), dtype=np.float32)
+        np.add.at(matrix, (docs, hashes % self.dim), weights)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class SemanticIndex:
+    """Host-local vector index over WhatsApp messages with top-k cosine search.
+
+    Vectors (``HashingVectorizer``) live in a float32 matrix memory-mapped
+    from ``<directory>/vectors[.<generation>].f32``; document frequencies in
+    ``df.i32``; row metadata (message id, sender, content, timestamps), the
+    row count and the current generation in ``meta.sqlite3``. All workers on
+    the host map the same files. Appends run inside a SQLite write
+    transaction, which serializes writers across processes; a search reads
+    the state and the metadata from one SQLite snapshot, so it only looks at
+    committed rows of the generation it mapped, and remaps the matrix when a
+    writer has grown the file or moved to a new generation.
+
+    Vectors are weighted with the document frequencies known when they are
+    added; rebuilding (scripts/build_semantic_index.py --rebuild) refreshes
+    them. ``forget_before`` zeroes the rows removed by retention and takes
+    them out of the document frequencies. Once fewer than ``compact_ratio``
+    of the rows are live, the live vectors are copied to a new generation
+    file and renumbered; the previous file is kept for searches still using
+    it and deleted at the following compaction.
+    """
+
+    def __init__(self, directory: str, dim: int = 256, buckets: int = 1 << 20,
+                 initial_capacity: int = 65536, chunk_rows: int = 262144, compact_ratio: float = 0.5):
+        if np is None:
+            raise RuntimeError("numpy is required for the semantic index")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self.chunk_rows = chunk_rows
+        self.compact_ratio = compact_ratio
+        self._db = LocalSQLite(os.path.join(directory, "meta.sqlite3"))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, message_id INTEGER UNIQUE, "
+            "sender_name TEXT, content TEXT, timestamp TEXT, processed_at TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS rows_processed_at ON rows (processed_at)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        with self._db.immediate() as conn:
+            for key, value in (("dim", dim), ("buckets", buckets), ("count", 0), ("docs", 0), ("generation", 0)):
+                conn.execute("INSERT OR IGNORE INTO state (key, value) VALUES (?, ?)", (key, value))
+        state = self._state()
+        # Um índice existente mantém as dimensões com que foi criado
+        self.vectorizer = HashingVectorizer(state["dim"], state["buckets"])
+        self.dim = state["dim"]
+        self._df_path = os.path.join(directory, "df.i32")
+        if not os.path.exists(self._df_path):
+            np.zeros(state["buckets"], dtype=np.int32).tofile(self._df_path)
+        self._df = np.memmap(self._df_path, dtype=np.int32, mode="r+", shape=(state["buckets"],))
+        if not os.path.exists(self._vectors_path(state["generation"])):
+            self._grow_file(state["generation"], initial_capacity)
+        self._vectors = None
+        self._generation = None
+        self._capacity = 0
+        self._map_vectors(state["generation"])
+
+    def _state(self, conn=None) -> Dict[str, int]:
+        rows = (conn or self._db.connection()).execute("SELECT key, value FROM state").fetchall()
+        return dict(rows)
+
+    def _vectors_path(self, generation: int) -> str:
+        name = "vectors.f32" if generation == 0 else f"vectors.{generation}.f32"
+        return os.path.join(self.directory, name)
+
+    def _grow_file(self, generation: int, capacity: int) -> None:
+        with open(self._vectors_path(generation), "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+
+    def _map_vectors(self, generation: int) -> None:
+        capacity = os.path.getsize(self._vectors_path(generation)) // (self.dim * 4)
+        if generation != self._generation or capacity != self._capacity:
+            self._vectors = np.memmap(self._vectors_path(generation), dtype=np.float32, mode="r+",
+                                      shape=(capacity, self.dim))
+            self._generation = generation
+            self._capacity = capacity
+
+    def add_many(self, messages: Iterable[Dict[str, Any]]) -> int:
+        """Index messages ({id, sender_name, content, timestamp, processed_at}); return how many were added.
+
+        Messages whose id is already indexed are skipped.
+        """
+        messages = [m for m in messages if m and m.get("content")]
+        if not messages:
+            return 0
+        with self._db.immediate() as conn:
+            ids = [m["id"] for m in messages if m.get("id") is not None]
+            if ids:
+                known = set()
+                for start in range(0, len(ids), 500):
+                    part = ids[start:start + 500]
+                    known.update(row[0] for row in conn.execute(
+                        f"SELECT message_id FROM rows WHERE message_id IN ({','.join('?' * len(part))})", part))
+                fresh, batch_ids = [], set()
+                for m in messages:
+                    if m.get("id") is None or (m["id"] not in known and m["id"] not in batch_ids):
+                        fresh.append(m)
+                        batch_ids.add(m.get("id"))
+                messages = fresh
+            if not messages:
+                return 0
+            state = self._state(conn)
+            count, docs_total = state["count"], state["docs"] + len(messages)
+            docs, hashes, tfs = self.vectorizer.batch([m["content"] for m in messages])
+            # Frequência de documento: cada bucket conta uma vez por mensagem
+            pairs = np.unique(docs * self.vectorizer.buckets + hashes % self.vectorizer.buckets)
+            np.add.at(self._df, pairs % self.vectorizer.buckets, 1)
+            matrix = self.vectorizer.project(len(messages), docs, hashes, tfs, self._df, docs_total)
+
+            end = count + len(messages)
+            self._map_vectors(state["generation"])
+            if end > self._capacity:
+                self._grow_file(state["generation"], max(end, self._capacity * 2))
+                self._map_vectors(state["generation"])
+            self._vectors[count:end] = matrix
+            self._vectors.flush()
+            self._df.flush()
+            conn.executemany(
+                "INSERT INTO rows (row, message_id, sender_name, content, timestamp, processed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(count + i, m.get("id"), m.get("sender_name"), m.get("content"), m.get("timestamp"),
+                  m.get("processed_at")) for i, m in enumerate(messages)]
+            )
+            conn.execute("UPDATE state SET value = ? WHERE key = 'count'", (end,))
+            conn.execute("UPDATE state SET value = ? WHERE key = 'docs'", (docs_total,))
+        return len(messages)
+
+    def embed(self, text: str):
+        """Query vector for ``text`` under the current document frequencies (no index update)."""
+        docs, hashes, tfs = self.vectorizer.batch([text])
+        return self.vectorizer.project(1, docs, hashes, tfs, self._df, self._state()["docs"])[0]
+
+    def search(self, query: str, k: int = 10, min_score: float = 0.05) -> List[Dict[str, Any]]:
+        """Top-``k`` messages by cosine similarity to ``query``, best first."""
+        vector = self.embed(query)
+        with self._db.snapshot() as conn:
+            state = self._state(conn)
+            count = state["count"]
+            if count == 0 or k <= 0 or not vector.any():
+                return []
+            self._map_vectors(state["generation"])
+            return self._top_k(conn, vector, count, k, min_score)
+
+    def _top_k(self, conn, vector, count: int, k: int, min_score: float) -> List[Dict[str, Any]]:
+        best_rows, best_scores = [], []
+        for start in range(0, count, self.chunk_rows):
+            scores = self._vectors[start:min(count, start + self.chunk_rows)] @ vector
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+        rows = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        order = np.argsort(-scores)[:k]
+        hits = [(int(rows[i]), float(scores[i])) for i in order if scores[i] >= min_score]
+        if not hits:
+            return []
+        meta = {
+            row[0]: row[1:] for row in conn.execute(
+                f"SELECT row, message_id, sender_name, content, timestamp FROM rows "
+                f"WHERE row IN ({','.join('?' * len(hits))})", [row for row, _ in hits])
+        }
+        return [
+            {"id": meta[row][0], "sender_name": meta[row][1], "content": meta[row][2],
+             "timestamp": meta[row][3], "score": round(score, 4)}
+            for row, score in hits if row in meta
+        ]
+
+    def forget_before(self, cutoff: str) -> int:
+        """Drop messages processed before ``cutoff`` (ISO timestamp) from the index; return how many.
+
+        Their vectors are zeroed and their features leave the document
+        frequencies; the file is compacted once few live rows remain.
+        """
+        with self._db.immediate() as conn:
+            forgotten = conn.execute(
+                "SELECT row, content FROM rows WHERE processed_at < ?", (cutoff,)).fetchall()
+            if not forgotten:
+                return 0
+            state = self._state(conn)
+            self._map_vectors(state["generation"])
+            self._vectors[np.asarray([row for row, _ in forgotten], dtype=np.int64)] = 0.0
+            self._vectors.flush()
+            docs, hashes, _ = self.vectorizer.batch([content for _, content in forgotten])
+            pairs = np.unique(docs * self.vectorizer.buckets + hashes % self.vectorizer.buckets)
+            np.subtract.at(self._df, pairs % self.vectorizer.buckets, 1)
+            np.maximum(self._df, 0, out=self._df)
+            self._df.flush()
+            conn.execute("DELETE FROM rows WHERE processed_at < ?", (cutoff,))
+            conn.execute("UPDATE state SET value = MAX(0, value - ?) WHERE key = 'docs'", (len(forgotten),))
+            live = conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            if live < state["count"] * self.compact_ratio:
+                self._compact(conn, state)
+        return len(forgotten)
+
+    def _compact(self, conn, state: Dict[str, int]) -> None:
+        """Copy the live vectors to a new generation file and renumber their rows (inside the write transaction)."""
+        live_rows = [row[0] for row in conn.execute("SELECT row FROM rows ORDER BY row")]
+        generation = state["generation"] + 1
+        path = self._vectors_path(generation)
+        if os.path.exists(path):
+            os.remove(path)  # sobra de uma compactação interrompida
+        capacity = max(len(live_rows), self.initial_capacity)
+        self._grow_file(generation, capacity)
+        source = self._vectors
+        target = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        for start in range(0, len(live_rows), self.chunk_rows):
+            part = np.asarray(live_rows[start:start + self.chunk_rows], dtype=np.int64)
+            target[start:start + len(part)] = source[part]
+        target.flush()
+        # Em ordem crescente o novo número nunca colide com uma linha ainda não movida
+        conn.executemany("UPDATE rows SET row = ? WHERE row = ?",
+                         [(new, old) for new, old in enumerate(live_rows) if new != old])
+        conn.execute("UPDATE state SET value = ? WHERE key = 'count'", (len(live_rows),))
+        conn.execute("UPDATE state SET value = ? WHERE key = 'generation'", (generation,))
+        # Buscas em andamento podem estar na geração anterior; a de antes dela já não é usada
+        if generation >= 2 and os.path.exists(self._vectors_path(generation - 2)):
+            os.remove(self._vectors_path(generation - 2))
+        logger.info(f"Semantic index compacted: {state['count']} -> {len(live_rows)} rows (generation {generation})")
+
+    def metrics(self) -> Dict[str, Any]:
+        state = self._state()
+        return {
+            "rows": state["count"],
+            "live_rows": self._db.execute("SELECT COUNT(*) FROM rows").fetchone()[0],
+            "dim": self.dim,
+            "generation": state["generation"],
+            "capacity": self._capacity,
+            "file_bytes": os.path.getsize(self._vectors_path(state["generation"])),
+        }
+
+
+_semantic_index: Optional[SemanticIndex] = None
+
+def get_semantic_index() -> Optional[SemanticIndex]:
+    """The host's semantic index, or None when it is disabled or numpy is not installed."""
+    global _semantic_index
+    if _semantic_index is None and np is not None and Config.SEMANTIC_INDEX_DIR:
+        _semantic_index = SemanticIndex(Config.SEMANTIC_INDEX_DIR, dim=Config.SEMANTIC_INDEX_DIM)
+    return _semantic_index
@@ -0,0 +1,111 @@
+from typing import Any, Callable, Optional
+import hashlib
+import logging
+import uuid
+from .cache_service import SQLiteCacheService, get_shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Scopes whose versions are kept by database triggers (scripts/sql/009_content_versions.sql)
+DATABASE_SCOPES = ("thread", "user")
+
+# Postgres/PostgREST codes for a missing content_versions table (migration not applied yet)
+TABLE_NOT_FOUND = {"42P01", "PGRST205"}
+
+class VersionWatermarks:
+    """Monotonic version counters for threads and users, used to build ETags.
+
+    Every write to a thread's messages bumps that thread's version and the
+    author's user version. Readers derive a strong ETag from the version
+    (plus the request parameters), so a matching ``If-None-Match`` can be
+    answered with 304 without querying Supabase or OpenAI.
+
+    Once a database client is attached (``attach``), thread and user
+    versions are read from the ``content_versions`` table, which triggers
+    bump on every write, so every host sees writes made through any other.
+    If that read fails, or the migration is not applied yet, the ETag is
+    random: nothing is answered with 304, but nothing stale is served.
+
+    Other scopes, and every scope without a database client, use counters
+    in the host-local shared cache (its non-evictable ``counters`` table),
+    which only the workers on the same machine agree on. The cache epoch is
+    part of those ETags: if the cache file is recreated and the counters
+    restart from 0, previously issued ETags stop matching.
+    """
+
+    def __init__(self, cache: Optional[SQLiteCacheService] = None,
+                 client_getter: Optional[Callable[[], Any]] = None):
+        self._cache = cache
+        self._client_getter = client_getter
+        self._table_missing = False
+
+    def attach(self, client_getter: Callable[[], Any]) -> None:
+        """Read thread and user versions from the database returned by ``client_getter``."""
+        self._client_getter = client_getter
+
+    @property
+    def cache(self) -> SQLiteCacheService:
+        if self._cache is None:
+            self._cache = get_shared_cache()
+        return self._cache
+
+    @staticmethod
+    def _key(scope: str, key: str) -> str:
+        return f"version:{scope}:{key}"
+
+    def get(self, scope: str, key: str) -> int:
+        """Current version of ``scope``/``key`` in the host-local counters (0 if it was never bumped)."""
+        return self.cache.counter(self._key(scope, key))
+
+    def database_version(self, scope: str, key: str) -> Optional[int]:
+        """Version kept by the database triggers; None when it cannot be read."""
+        if self._client_getter is None or self._table_missing:
+            return None
+        try:
+            rows = self._client_getter().table("content_versions").select("version")\
+                .eq("scope", scope).eq("key", str(key)).limit(1).execute().data
+            return rows[0]["version"] if rows else 0
+        except Exception as e:
+            if getattr(e, "code", None) in TABLE_NOT_FOUND:
+                self._table_missing = True
+                logger.error("content_versions does not exist: apply scripts/sql/009_content_versions.sql. "
+                             "ETags disabled for threads and users")
+            else:
+                logger.error(f"Error reading version {scope}:{key}: {str(e)}")
+            return None
+
+    def bump(self, scope: str, key: str) -> int:
+        """Increment the version of ``scope``/``key`` and return the new value."""
+        try:
+            return self.cache.incr(self._key(scope, key))
+        except Exception as e:
+            logger.error(f"Error bumping version {scope}:{key}: {str(e)}")
+            return 0
+
+    def bump_thread(self, thread_id: Optional[str]) -> None:
+        if thread_id:
+            self.bump("thread", thread_id)
+
+    def bump_user(self, user_id: Optional[str]) -> None:
+        if user_id:
+            self.bump("user", user_id)
+
+    def etag(self, scope: str, key: str, *variant: Any) -> str:
+        """Strong ETag (unquoted) for ``scope``/``key`` at its current version.
+
+        ``variant`` holds the request parameters that change the payload for
+        the same version (cursors, page size, filters...).
+        """
+        if self._client_getter is not None and scope in DATABASE_SCOPES:
+            version = self.database_version(scope, key)
+            if version is None:
+                # Never matches an If-None-Match: the payload is always rebuilt
+                return uuid.uuid4().hex
+            source = "db"
+        else:
+            source, version = self.cache.epoch, self.get(scope, key)
+        raw = "|".join([source, scope, str(key), str(version)] + [str(part) for part in variant])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+watermarks = VersionWatermarks()
@@ -22,6 +22,12 @@ document.addEventListener('DOMContentLoaded', function() {
     let threadId = chatContainer ? chatContainer.dataset.threadId : null;
     const chatbotType = chatContainer ? chatContainer.dataset.chatbotType : null;
 
+    // Cursores do histórico paginado
+    let oldestCursor = null;   // mensagem mais antiga exibida (para carregar páginas anteriores)
+    let newestCursor = null;   // mensagem mais recente conhecida (para sincronização delta)
+    let hasOlderMessages = false;
+    let isLoadingHistory = false;
+
     // Event Listeners
     if (sendBtn) {
         sendBtn.addEventListener('click', function() {
@@ -66,6 +72,20 @@ document.addEventListener('DOMContentLoaded', function() {
     // Carregar histórico de chat se o container existir
     if (chatContainer) {
         loadChatHistory();
+
+        // Carregar mensagens anteriores ao rolar até o topo
+        chatContainer.addEventListener('scroll', function() {
+            if (chatContainer.scrollTop < 50 && hasOlderMessages && !isLoadingHistory) {
+                loadOlderMessages();
+            }
+        });
+
+        // Buscar apenas mensagens novas quando a aba volta a ficar visível
+        document.addEventListener('visibilitychange', function() {
+            if (document.visibilityState === 'visible' && !isProcessing) {
+                syncNewMessages();
+            }
+        });
     }
 
     // Funções
@@ -82,15 +102,14 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         }
         
-        // Construir a URL para buscar o histórico, incluindo o threadId se disponível
-        let url = '/get_chat_history';
-        if (threadId && threadId !== 'null') {
-            url += `?thread_id=${threadId}`;
-        }
-        
-        fetch(url)
+        // Buscar apenas a página mais recente do histórico
+        isLoadingHistory = true;
+        fetch(historyUrl({}))
             .then(response => response.json())
             .then(data => {
+                isLoadingHistory = false;
+                updateCursors(data, 'initial');
+
                 if (data.thread_id) {
                     // Atualizar o threadId no DOM e na variável local
                     threadId = data.thread_id;
@@ -103,27 +122,93 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 if (data.messages && data.messages.length > 0) {
                     chatContainer.innerHTML = '';
-                    data.messages.forEach(msg => {
-                        if (msg.role === 'user') {
-                            addUserMessage(msg.content, msg.timestamp, msg.user_name);
-                            if (msg.user_name && msg.user_name !== 'Usuário Anônimo') {
-                                userName = 'Você';
-                            }
-                        } else if (msg.role === 'assistant') {
-                            addAssistantMessage(msg.content, msg.timestamp);
-                        }
-                    });
+                    data.messages.forEach(msg => renderHistoryMessage(msg, false));
                     scrollToBottom();
                 } else {
                     addSystemMessage('Olá! Como posso ajudar você hoje?');
                 }
             })
             .catch(error => {
+                isLoadingHistory = false;
                 console.error('Erro ao carregar histórico:', error);
                 addSystemMessage('Erro ao carregar histórico. Por favor, recarregue a página.');
             });
     }
 
+    function historyUrl(params) {
+        const query = new URLSearchParams(params);
+        if (threadId && threadId !== 'null') {
+            query.set('thread_id', threadId);
+        }
+        const queryString = query.toString();
+        return '/get_chat_history' + (queryString ? `?${queryString}` : '');
+    }
+
+    function updateCursors(data, mode) {
+        if (mode === 'initial' || mode === 'before') {
+            if (data.prev_cursor) oldestCursor = data.prev_cursor;
+            hasOlderMessages = Boolean(data.has_more);
+        }
+        if ((mode === 'initial' || mode === 'since') && data.next_cursor) {
+            newestCursor = data.next_cursor;
+        }
+    }
+
+    function renderHistoryMessage(msg, prepend) {
+        if (msg.role === 'user') {
+            addUserMessage(msg.content, msg.timestamp, msg.user_name, prepend);
+            if (msg.user_name && msg.user_name !== 'Usuário Anônimo') {
+                userName = 'Você';
+            }
+        } else if (msg.role === 'assistant') {
+            addAssistantMessage(msg.content, msg.timestamp, prepend);
+        }
+    }
+
+    function loadOlderMessages() {
+        if (!oldestCursor) return;
+        isLoadingHistory = true;
+        fetch(historyUrl({ before: oldestCursor }))
+            .then(response => response.json())
+            .then(data => {
+                isLoadingHistory = false;
+                if (data.error) {
+                    console.error('Erro ao carregar mensagens anteriores:', data.error);
+                    return;
+                }
+                updateCursors(data, 'before');
+                // Preservar a posição de leitura ao inserir mensagens no topo
+                const previousHeight = chatContainer.scrollHeight;
+                const previousTop = chatContainer.scrollTop;
+                (data.messages || []).slice().reverse().forEach(msg => renderHistoryMessage(msg, true));
+                chatContainer.scrollTop = chatContainer.scrollHeight - previousHeight + previousTop;
+            })
+            .catch(error => {
+                isLoadingHistory = false;
+                console.error('Erro ao carregar mensagens anteriores:', error);
+            });
+    }
+
+    function syncNewMessages() {
+        if (!newestCursor || isLoadingHistory) return;
+        isLoadingHistory = true;
+        fetch(historyUrl({ since: newestCursor }))
+            .then(response => response.json())
+            .then(data => {
+                isLoadingHistory = false;
+                if (data.error) return;
+                updateCursors(data, 'since');
+                (data.messages || []).forEach(msg => renderHistoryMessage(msg, false));
+                if (data.has_more) {
+                    syncNewMessages();
+                }
+            })
+            .catch(error => {
+                isLoadingHistory = false;
+                console.error('Erro ao sincronizar mensagens:', error);
+            });
+    }
+
     function sendMessage() {
         const message = userInput.value.trim();
         if (!message || isProcessing) return;
@@ -182,6 +267,11 @@ document.addEventListener('DOMContentLoaded', function() {
             // Adicionar resposta do assistente
             addAssistantMessage(data.response);
             
+            // Avançar o cursor de sincronização para não buscar novamente o que já foi exibido
+            if (data.cursor) {
+                newestCursor = data.cursor;
+            }
+            
             isProcessing = false;
         })
         .catch(error => {
@@ -192,7 +282,7 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function addUserMessage(message, timestamp = null, name = null) {
+    function addUserMessage(message, timestamp = null, name = null, prepend = false) {
         const messageDiv = document.createElement('div');
         messageDiv.className = 'chat-message chat-message--user';
         
@@ -218,11 +308,15 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.appendChild(contentDiv);
         messageDiv.appendChild(timestampDiv);
         
-        chatContainer.appendChild(messageDiv);
-        scrollToBottom();
+        if (prepend) {
+            chatContainer.insertBefore(messageDiv, chatContainer.firstChild);
+        } else {
+            chatContainer.appendChild(messageDiv);
+            scrollToBottom();
+        }
     }
 
-    function addAssistantMessage(message, timestamp = null) {
+    function addAssistantMessage(message, timestamp = null, prepend = false) {
         const messageDiv = document.createElement('div');
         messageDiv.className = 'chat-message chat-message--assistant';
         
@@ -254,8 +348,12 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.appendChild(contentDiv);
         messageDiv.appendChild(timestampDiv);
         
-        chatContainer.appendChild(messageDiv);
-        scrollToBottom();
+        if (prepend) {
+            chatContainer.insertBefore(messageDiv, chatContainer.firstChild);
+        } else {
+            chatContainer.appendChild(messageDiv);
+            scrollToBottom();
+        }
     }
 
     function addSystemMessage(message) {
@@ -333,8 +431,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Salvar o novo threadId no localStorage
                 localStorage.setItem('lastThreadId', threadId);
                 
-                // Limpar chat e adicionar mensagem inicial
+                // Limpar chat e cursores e adicionar mensagem inicial
                 chatContainer.innerHTML = '';
+                oldestCursor = null;
+                newestCursor = null;
+                hasOlderMessages = false;
                 userName = 'Você';
                 addSystemMessage(data.message || 'Nova conversa iniciada! Como posso ajudar?');
                 
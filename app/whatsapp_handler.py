@@ -2,68 +2,301 @@
 import logging
 from app.models import supabase
 import datetime
+import hashlib
 import json
-from typing import Dict, Any, Optional
+import os
+import tempfile
+from typing import Dict, Any, List, Optional, Tuple
+from postgrest.exceptions import APIError
 from config import Config
+from app.services.ingest_queue import IngestQueue
+from app.services.retention import RetentionEngine, jsonl_archiver, table_archiver
+from app.services.cache_service import get_shared_cache
+from app.services.search_service import WHATSAPP_MESSAGES_VERSION
+from app.services.semantic_index import get_semantic_index
+from app.services.version_service import watermarks
+from app.chatbot.utils import format_timestamps, sanitize_contents
 
 logger = logging.getLogger(__name__)
 
+class PayloadTooLarge(ValueError):
+    """Lote do webhook com mais mensagens do que Config.WHATSAPP_MAX_BATCH_ITEMS."""
+
+def extract_whatsapp_items(payload: Any) -> Tuple[List[Any], bool]:
+    """
+    Extrai as mensagens de um payload do webhook.
+
+    Aceita uma mensagem ({"sender", "content", "timestamp"}), uma lista de
+    mensagens, um envelope {"messages": [...]} ou o envelope da Cloud API do
+    WhatsApp ({"entry": [{"changes": [{"value": {"messages", "contacts"}}]}]}).
+
+    Returns:
+        (itens, é_lote) - itens ainda não validados
+    """
+    if isinstance(payload, list):
+        return payload, True
+    if not isinstance(payload, dict):
+        return [payload], False
+    if isinstance(payload.get('messages'), list):
+        return payload['messages'], True
+    if isinstance(payload.get('entry'), list):
+        items = []
+        for entry in payload['entry']:
+            for change in (entry or {}).get('changes') or []:
+                value = (change or {}).get('value') or {}
+                names = {
+                    contact.get('wa_id'): (contact.get('profile') or {}).get('name')
+                    for contact in value.get('contacts') or [] if isinstance(contact, dict)
+                }
+                for message in value.get('messages') or []:
+                    if not isinstance(message, dict):
+                        items.append(message)
+                        continue
+                    # Texto, ou a legenda de mídias; outros tipos ficam sem conteúdo e são rejeitados
+                    body = message.get(message.get('type') or 'text')
+                    body = (body.get('body') or body.get('caption')) if isinstance(body, dict) else None
+                    items.append({
+                        'id': message.get('id'),
+                        'sender': names.get(message.get('from')) or message.get('from'),
+                        'content': body,
+                        'timestamp': message.get('timestamp'),
+                    })
+        return items, True
+    return [payload], False
+
+def whatsapp_message_key(item: Dict[str, Any]) -> Optional[str]:
+    """
+    Chave de idempotência de uma mensagem: o id do provedor ou, sem id, um hash
+    de remetente + conteúdo + timestamp. Mensagens sem id e sem timestamp não
+    têm chave (um reenvio não se distingue de uma mensagem repetida).
+    """
+    message_id = item.get('id') or item.get('message_id')
+    if message_id:
+        return f"id:{message_id}"
+    timestamp = item.get('timestamp')
+    if timestamp is None or timestamp == "":
+        return None
+    raw = json.dumps([item.get('sender'), item.get('content'), timestamp], ensure_ascii=False, default=str)
+    return "h:" + hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+def build_whatsapp_records(items: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Valida e normaliza um lote de mensagens de uma só vez.
+
+    Timestamps passam por format_timestamps e conteúdos por sanitize_contents,
+    cada um numa única passada sobre o lote.
+
+    Returns:
+        (registros válidos para whatsapp_messages, status por item na ordem recebida)
+    """
+    statuses: List[Dict[str, Any]] = []
+    valid: List[Dict[str, Any]] = []
+    for index, item in enumerate(items):
+        if not item or not isinstance(item, dict):
+            statuses.append({"index": index, "status": "error", "message": "Dados vazios"})
+            continue
+        content = item.get('content', '')
+        if not content or not isinstance(content, str):
+            statuses.append({"index": index, "status": "error", "message": "Conteúdo inválido"})
+            continue
+        statuses.append({"index": index, "status": "queued"})
+        valid.append(item)
+
+    if len(statuses) > len(valid):
+        logger.warning(f"{len(statuses) - len(valid)} de {len(statuses)} mensagens do WhatsApp rejeitadas")
+    if not valid:
+        return [], statuses
+
+    contents = sanitize_contents([item['content'] for item in valid])
+    timestamps = format_timestamps([item.get('timestamp') for item in valid])
+    processed_at = datetime.datetime.now().isoformat()
+    records = [
+        {
+            "sender_name": item.get('sender') or 'Desconhecido',
+            "content": content,
+            "timestamp": timestamp,
+            "processed_at": processed_at,
+            "message_key": whatsapp_message_key(item)
+        }
+        for item, content, timestamp in zip(valid, contents, timestamps)
+    ]
+    return records, statuses
+
+def build_whatsapp_record(message_data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Valida uma mensagem recebida do WhatsApp e monta a linha de whatsapp_messages.
+
+    Returns:
+        (registro, None) se a mensagem for válida, ou (None, motivo do erro)
+    """
+    records, statuses = build_whatsapp_records([message_data])
+    if not records:
+        return None, statuses[0]["message"]
+    return records[0], None
+
+# Erros do upsert quando scripts/sql/006_whatsapp_message_key.sql não foi aplicado:
+# coluna inexistente (Postgres / cache de schema do PostgREST) ou sem índice único
+MESSAGE_KEY_MISSING = {'42703', 'PGRST204', '42P10'}
+_message_key_available = True
+
+def store_whatsapp_records(records: List[Dict[str, Any]]) -> None:
+    """Grava um lote de mensagens em whatsapp_messages com um único insert.
+
+    Chaves já gravadas são ignoradas (scripts/sql/006_whatsapp_message_key.sql).
+    Sem a migração, o processo passa a gravar com insert simples, sem a
+    coluna message_key (e sem a garantia de idempotência no banco).
+    """
+    global _message_key_available
+    result = None
+    if _message_key_available:
+        try:
+            result = supabase.table('whatsapp_messages').upsert(
+                records, on_conflict='message_key', ignore_duplicates=True
+            ).execute()
+        except APIError as e:
+            if e.code not in MESSAGE_KEY_MISSING:
+                raise
+            _message_key_available = False
+            logger.error("whatsapp_messages.message_key ou seu índice único não existe: aplique "
+                         "scripts/sql/006_whatsapp_message_key.sql. Gravando sem deduplicação no banco")
+    if result is None:
+        result = supabase.table('whatsapp_messages').insert(
+            [{k: v for k, v in record.items() if k != 'message_key'} for record in records]
+        ).execute()
+    # Invalida os resultados em cache de query_whatsapp_messages
+    watermarks.bump(*WHATSAPP_MESSAGES_VERSION)
+    # Só as linhas de fato inseridas voltam (duplicadas são ignoradas)
+    index_whatsapp_messages(result.data or [])
+    logger.info(f"{len(records)} mensagens do WhatsApp gravadas")
+
+def index_whatsapp_messages(rows: List[Dict[str, Any]]) -> None:
+    """Acrescenta mensagens gravadas ao índice semântico local, se ele estiver ativo.
+
+    Falhas só são registradas: o índice é auxiliar e não deve travar a ingestão.
+    """
+    try:
+        index = get_semantic_index()
+        if index is not None and rows:
+            index.add_many(rows)
+    except Exception as e:
+        logger.error(f"Erro ao indexar mensagens do WhatsApp: {str(e)}", exc_info=True)
+
+if os.path.abspath(Config.WHATSAPP_QUEUE_PATH).startswith(os.path.abspath(tempfile.gettempdir()) + os.sep):
+    logger.warning(f"WHATSAPP_QUEUE_PATH está no diretório temporário ({Config.WHATSAPP_QUEUE_PATH}): "
+                   "mensagens ainda não gravadas se perdem se a máquina for trocada")
+
+# Fila local durável: o webhook só grava aqui, o consumidor em segundo plano grava no Supabase
+whatsapp_queue = IngestQueue(
+    Config.WHATSAPP_QUEUE_PATH,
+    store_whatsapp_records,
+    batch_size=Config.WHATSAPP_QUEUE_BATCH_SIZE,
+    interval=Config.WHATSAPP_QUEUE_FLUSH_INTERVAL,
+    retry_backoff=Config.WHATSAPP_QUEUE_RETRY_BACKOFF,
+    max_backoff=Config.WHATSAPP_QUEUE_MAX_BACKOFF,
+    max_age=Config.WHATSAPP_QUEUE_MAX_AGE or None,
+    name="whatsapp-ingest",
+    dedupe_ttl=Config.WHATSAPP_DEDUPE_TTL,
+    dedupe_capacity=Config.WHATSAPP_DEDUPE_CAPACITY
+)
+
+def whatsapp_retention_engine() -> RetentionEngine:
+    """Motor de retenção de whatsapp_messages configurado a partir de Config."""
+    archive_fn = None
+    if Config.WHATSAPP_ARCHIVE_TABLE:
+        archive_fn = table_archiver(supabase, Config.WHATSAPP_ARCHIVE_TABLE)
+    elif Config.WHATSAPP_ARCHIVE_DIR:
+        archive_fn = jsonl_archiver(Config.WHATSAPP_ARCHIVE_DIR)
+    return RetentionEngine(
+        supabase,
+        'whatsapp_messages',
+        window=datetime.timedelta(hours=Config.WHATSAPP_RETENTION_HOURS),
+        time_column='processed_at',
+        chunk_size=Config.WHATSAPP_RETENTION_CHUNK_SIZE,
+        pause=Config.WHATSAPP_RETENTION_PAUSE,
+        max_duration=Config.WHATSAPP_RETENTION_MAX_SECONDS,
+        archive_fn=archive_fn,
+        cache=get_shared_cache()
+    )
+
+def retention_progress() -> Optional[Dict[str, Any]]:
+    """Progresso da execução atual/última da retenção, publicado por qualquer worker."""
+    return get_shared_cache().get('retention:whatsapp_messages')
+
+def enqueue_whatsapp_payload(payload: Any) -> Dict[str, Any]:
+    """
+    Valida as mensagens de um payload do webhook e as coloca na fila local, sem acessar o banco.
+
+    Um payload com uma única mensagem devolve o resultado dessa mensagem; lotes
+    devolvem o status de cada item. Reenvios (mesma chave de idempotência) são
+    respondidos com "duplicate" e não entram de novo na fila. Todas as mensagens válidas entram na fila
+    numa só transação e são gravadas em whatsapp_messages depois, em lote.
+    """
+    items, is_batch = extract_whatsapp_items(payload)
+    if len(items) > Config.WHATSAPP_MAX_BATCH_ITEMS:
+        raise PayloadTooLarge(f"Lote com {len(items)} mensagens excede o limite de {Config.WHATSAPP_MAX_BATCH_ITEMS}")
+    records, statuses = build_whatsapp_records(items)
+    duplicates = 0
+    if records:
+        accepted = whatsapp_queue.put_many(records, [record["message_key"] for record in records])
+        # Reenvios já recebidos: confirmados ao provedor, mas não gravados de novo
+        valid_statuses = [status for status in statuses if status["status"] == "queued"]
+        for status, ok in zip(valid_statuses, accepted):
+            if not ok:
+                status["status"] = "duplicate"
+                duplicates += 1
+    logger.debug(f"{len(records) - duplicates} mensagens do WhatsApp enfileiradas, {duplicates} duplicadas")
+
+    if not is_batch:
+        status = statuses[0]
+        if status["status"] == "error":
+            return {"status": "error", "message": status["message"]}
+        if status["status"] == "duplicate":
+            return {"status": "duplicate", "message": "Mensagem já recebida"}
+        return {"status": "queued", "message": "Mensagem recebida"}
+
+    rejected = len(statuses) - len(records)
+    return {
+        "status": "queued" if not rejected else ("partial" if records else "error"),
+        "accepted": len(records) - duplicates,
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "items": statuses
+    }
+
 def process_whatsapp_message(message_data: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Processa uma mensagem recebida do WhatsApp e armazena no banco de dados.
-    
+    Processa uma mensagem recebida do WhatsApp e armazena no banco de dados imediatamente.
+
+    O webhook usa enqueue_whatsapp_payload; esta função grava de forma síncrona.
+
     Args:
         message_data: Dicionário contendo os dados da mensagem
-        
+
     Returns:
         Dicionário com o resultado do processamento
     """
     try:
-        logger.info(f"Processando mensagem do WhatsApp: {message_data}")
-        
-        # Validar dados da mensagem
-        if not message_data:
-            logger.warning("Dados de mensagem vazios")
-            return {"status": "error", "message": "Dados vazios"}
-        
-        # Extrair informações relevantes
-        sender = message_data.get('sender', 'Desconhecido')
-        content = message_data.get('content', '')
-        timestamp = message_data.get('timestamp', datetime.datetime.now().isoformat())
-        
-        # Validar conteúdo
-        if not content or not isinstance(content, str):
-            logger.warning(f"Conteúdo de mensagem inválido: {content}")
-            return {"status": "error", "message": "Conteúdo inválido"}
-        
-        # Limitar tamanho do conteúdo
-        if len(content) > 10000:
-            content = content[:10000] + "... (truncado)"
-            logger.warning("Conteúdo da mensagem truncado por exceder 10000 caracteres")
-        
-        # Preparar dados para armazenamento
-        message_record = {
-            "sender_name": sender,
-            "content": content,
-            "timestamp": timestamp,
-            "processed_at": datetime.datetime.now().isoformat()
-        }
-        
+        record, error = build_whatsapp_record(message_data)
+        if error:
+            return {"status": "error", "message": error}
+
         # Armazenar no banco de dados
-        result = supabase.table('whatsapp_messages').insert(message_record).execute()
-        
+        result = supabase.table('whatsapp_messages').insert(record).execute()
+
         if not result.data:
             logger.error("Falha ao inserir mensagem no banco de dados")
             return {"status": "error", "message": "Falha ao armazenar mensagem"}
-        
+        watermarks.bump(*WHATSAPP_MESSAGES_VERSION)
+        index_whatsapp_messages(result.data)
+
         logger.info(f"Mensagem do WhatsApp processada com sucesso: ID {result.data[0].get('id')}")
-        
+
         return {
             "status": "success",
             "message": "Mensagem processada com sucesso",
             "record_id": result.data[0].get('id')
         }
-        
+
     except Exception as e:
         logger.error(f"Erro ao processar mensagem do WhatsApp: {str(e)}", exc_info=True)
-        return {"status": "error", "message": f"Erro interno: {str(e)}"}
\ No newline at end of file
+        return {"status": "error", "message": f"Erro interno: {str(e)}"}
@@ -3,6 +3,7 @@ import os
 from dotenv import load_dotenv
 import sys
 import logging
+import tempfile
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -34,6 +35,10 @@ class Config:
     # Configurações do WhatsApp
     WHATSAPP_WEBHOOK_TOKEN = os.getenv('WHATSAPP_WEBHOOK_TOKEN')
     
+    # Token do monitoramento para /metrics (cabeçalho "Authorization: Bearer <token>");
+    # sem ele, /metrics só responde a usuários logados
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    
     # Configurações do banco de dados
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -41,6 +46,82 @@ class Config:
     # Configurações de cache
     CACHE_TYPE = "SimpleCache"
     CACHE_DEFAULT_TIMEOUT = 300
+    # Cache compartilhado entre os workers do mesmo host (arquivo SQLite local)
+    SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'vendedor_smart_cache.sqlite3'))
+    SHARED_CACHE_MAX_ENTRIES = int(os.getenv('SHARED_CACHE_MAX_ENTRIES', '50000'))
+    USER_PROFILE_CACHE_TTL = int(os.getenv('USER_PROFILE_CACHE_TTL', '60'))
+    # Validade (segundos) dos nomes extraídos pelos chatbots no cache compartilhado
+    NAME_CACHE_TTL = int(os.getenv('NAME_CACHE_TTL', '86400'))
+    # Validade (segundos) dos contadores de pontuação de conversas no cache compartilhado
+    CONVERSATION_STATS_TTL = int(os.getenv('CONVERSATION_STATS_TTL', '3600'))
+    # Tempo máximo (segundos) de uma gravação de mensagens; depois disso uma
+    # gravação que não terminou (worker morto) deixa de bloquear o cache dos contadores
+    CONVERSATION_STATS_WRITE_TIMEOUT = int(os.getenv('CONVERSATION_STATS_WRITE_TIMEOUT', '60'))
+    # Validade (segundos) das avaliações de conversas feitas pelo modelo, por hash do conteúdo
+    CONVERSATION_GRADE_TTL = int(os.getenv('CONVERSATION_GRADE_TTL', str(30 * 86400)))
+    # Validade (segundos) dos resultados de query_whatsapp_messages; novas mensagens invalidam antes
+    MESSAGE_SEARCH_CACHE_TTL = int(os.getenv('MESSAGE_SEARCH_CACHE_TTL', '300'))
+    # Índice semântico local das mensagens do WhatsApp (requer numpy). Desligado
+    # por padrão: informe um diretório (de preferência persistente) para ligar
+    SEMANTIC_INDEX_DIR = os.getenv('SEMANTIC_INDEX_DIR', '')
+    SEMANTIC_INDEX_DIM = int(os.getenv('SEMANTIC_INDEX_DIM', '256'))
+    # Pré-recuperação no VendasChatbot: mensagens do índice semântico vão junto com a pergunta
+    VENDAS_PRERETRIEVAL = os.getenv('VENDAS_PRERETRIEVAL', 'false').lower() in ('1', 'true', 'yes')
+    VENDAS_PRERETRIEVAL_K = int(os.getenv('VENDAS_PRERETRIEVAL_K', '5'))
+    VENDAS_PRERETRIEVAL_MIN_SCORE = float(os.getenv('VENDAS_PRERETRIEVAL_MIN_SCORE', '0.2'))
+    # Léxicos em JSON ({"categoria": ["termo", ...]}) que substituem os padrões de app/services/lexicon.py
+    CONVERSATION_LEXICON_PATH = os.getenv('CONVERSATION_LEXICON_PATH')
+    ENTITY_LEXICON_PATH = os.getenv('ENTITY_LEXICON_PATH')
+    # Intervalo (segundos) entre gravações em lote de last_interaction
+    LAST_INTERACTION_FLUSH_INTERVAL = float(os.getenv('LAST_INTERACTION_FLUSH_INTERVAL', '60'))
+    # Fila local (SQLite) das mensagens recebidas pelo webhook do WhatsApp. O padrão
+    # fica no diretório temporário, que é efêmero em deploys como o do Procfile:
+    # mensagens ainda não gravadas se perdem quando a máquina é trocada. Em
+    # produção, aponte para um volume persistente.
+    WHATSAPP_QUEUE_PATH = os.getenv('WHATSAPP_QUEUE_PATH', os.path.join(tempfile.gettempdir(), 'vendedor_smart_whatsapp_queue.sqlite3'))
+    WHATSAPP_QUEUE_BATCH_SIZE = int(os.getenv('WHATSAPP_QUEUE_BATCH_SIZE', '500'))
+    # Intervalo (segundos) entre gravações em lote da fila do WhatsApp
+    WHATSAPP_QUEUE_FLUSH_INTERVAL = float(os.getenv('WHATSAPP_QUEUE_FLUSH_INTERVAL', '1'))
+    # Backoff (segundos) entre tentativas de um lote que falhou: dobra a cada
+    # falha até o máximo. Mensagens que continuam falhando depois de
+    # WHATSAPP_QUEUE_MAX_AGE segundos na fila são marcadas como mortas
+    # (scripts/whatsapp_queue.py --requeue-dead as recoloca); 0 = tentar para sempre
+    WHATSAPP_QUEUE_RETRY_BACKOFF = float(os.getenv('WHATSAPP_QUEUE_RETRY_BACKOFF', '2'))
+    WHATSAPP_QUEUE_MAX_BACKOFF = float(os.getenv('WHATSAPP_QUEUE_MAX_BACKOFF', '300'))
+    WHATSAPP_QUEUE_MAX_AGE = float(os.getenv('WHATSAPP_QUEUE_MAX_AGE', str(7 * 86400)))
+    # Máximo de mensagens aceitas em um único POST do webhook
+    WHATSAPP_MAX_BATCH_ITEMS = int(os.getenv('WHATSAPP_MAX_BATCH_ITEMS', '5000'))
+    # Por quanto tempo (segundos) reenvios da mesma mensagem são descartados, e
+    # quantas chaves o filtro de Bloom de cada processo guarda antes de ser reiniciado
+    WHATSAPP_DEDUPE_TTL = int(os.getenv('WHATSAPP_DEDUPE_TTL', str(7 * 86400)))
+    WHATSAPP_DEDUPE_CAPACITY = int(os.getenv('WHATSAPP_DEDUPE_CAPACITY', '1000000'))
+    # Controle de admissão (por worker): requisições simultâneas que o worker
+    # atende (threads do gunicorn, ver gunicorn.conf.py), quantas ficam reservadas para /send_message,
+    # limite de webhooks simultâneos e profundidade da fila a partir da qual o
+    # webhook responde 429
+    WORKER_CAPACITY = int(os.getenv('WORKER_CAPACITY', os.getenv('GUNICORN_THREADS', '8')))
+    INTERACTIVE_RESERVED_SLOTS = int(os.getenv('INTERACTIVE_RESERVED_SLOTS', '2'))
+    WEBHOOK_MAX_IN_FLIGHT = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', '4'))
+    WEBHOOK_MAX_QUEUE_DEPTH = int(os.getenv('WEBHOOK_MAX_QUEUE_DEPTH', '50000'))
+    # Retenção de whatsapp_messages: janela (horas), tamanho do lote de remoção,
+    # pausa (segundos) entre lotes, tempo máximo por execução e intervalo (minutos)
+    # entre execuções. Arquivamento opcional em uma tabela ou em arquivos .jsonl.gz
+    WHATSAPP_RETENTION_HOURS = float(os.getenv('WHATSAPP_RETENTION_HOURS', '24'))
+    WHATSAPP_RETENTION_CHUNK_SIZE = int(os.getenv('WHATSAPP_RETENTION_CHUNK_SIZE', '1000'))
+    WHATSAPP_RETENTION_PAUSE = float(os.getenv('WHATSAPP_RETENTION_PAUSE', '0.2'))
+    WHATSAPP_RETENTION_MAX_SECONDS = float(os.getenv('WHATSAPP_RETENTION_MAX_SECONDS', '600'))
+    WHATSAPP_RETENTION_INTERVAL_MINUTES = float(os.getenv('WHATSAPP_RETENTION_INTERVAL_MINUTES', '15'))
+    WHATSAPP_ARCHIVE_TABLE = os.getenv('WHATSAPP_ARCHIVE_TABLE')
+    WHATSAPP_ARCHIVE_DIR = os.getenv('WHATSAPP_ARCHIVE_DIR')
+    # Agendador (app/jobs.py): trava de arquivo que elege o worker líder no host e,
+    # opcionalmente, DSN do Postgres para a trava consultiva que elege um líder por implantação
+    SCHEDULER_LOCK_PATH = os.getenv('SCHEDULER_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'vendedor_smart_scheduler.lock'))
+    SCHEDULER_PG_LOCK_DSN = os.getenv('SCHEDULER_PG_LOCK_DSN')
+    # Tarefas sobre arquivos locais (caches, índice semântico) rodam em todo host: só a trava de arquivo
+    SCHEDULER_HOST_LOCK_PATH = os.getenv('SCHEDULER_HOST_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'vendedor_smart_scheduler_host.lock'))
+    SCHEDULER_PG_LOCK_KEY = int(os.getenv('SCHEDULER_PG_LOCK_KEY', '72031'))
+    SCORE_ROLLUP_INTERVAL_MINUTES = float(os.getenv('SCORE_ROLLUP_INTERVAL_MINUTES', '30'))
+    CACHE_SWEEP_INTERVAL_MINUTES = float(os.getenv('CACHE_SWEEP_INTERVAL_MINUTES', '60'))
     
     # Configurações de logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -51,6 +132,17 @@ class Config:
     # Configurações de limite de histórico
     MAX_HISTORY_MESSAGES = 10
     CLEAR_HISTORY_ON_RESTART = True
+
+    # Configurações de paginação do histórico de chat
+    CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', '50'))
+    CHAT_HISTORY_MAX_PAGE_SIZE = 200
+
+    # Configurações de orçamento de tokens para análises do dashboard
+    POSITIONING_TOKEN_BUDGET = int(os.getenv('POSITIONING_TOKEN_BUDGET', '3000'))
+    FEEDBACK_TOKEN_BUDGET = int(os.getenv('FEEDBACK_TOKEN_BUDGET', '1500'))
+    ANALYSIS_CANDIDATE_POOL = int(os.getenv('ANALYSIS_CANDIDATE_POOL', '2000'))
+    # Faixas de tempo em que o histórico é dividido para amostrar os candidatos
+    ANALYSIS_TIME_STRATA = int(os.getenv('ANALYSIS_TIME_STRATA', '8'))
     
     @classmethod
     def validate_config(cls):
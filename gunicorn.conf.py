@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Configuração do gunicorn usada pelo Procfile. Workers gthread atendem
+# GUNICORN_THREADS requisições simultâneas cada; o controle de admissão
+# (app/services/admission.py) usa o mesmo número como capacidade do worker
+# (Config.WORKER_CAPACITY). Com workers sync (1 requisição por vez) os limites
+# de admissão nunca seriam atingidos.
+import logging
+import os
+
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Sem WEB_CONCURRENCY, o gunicorn usa 1 worker
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Os workers herdam o ambiente: a capacidade de admissão acompanha as threads
+os.environ.setdefault("WORKER_CAPACITY", str(threads))
+if int(os.environ["WORKER_CAPACITY"]) != threads:
+    logging.getLogger("gunicorn.error").warning(
+        f"WORKER_CAPACITY={os.environ['WORKER_CAPACITY']} diferente de GUNICORN_THREADS={threads}: "
+        "o controle de admissão não corresponde às threads do worker"
+    )
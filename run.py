@@ -1,9 +1,9 @@
 # run.py (refatorado)
 from app import create_app
-from app.models import supabase
+from app.models import supabase, last_interaction_coalescer
+from app.whatsapp_handler import whatsapp_queue
+from app.jobs import build_scheduler
 import sys
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
 import logging
 import os
 import atexit
@@ -30,19 +30,6 @@ def test_database_connection():
         logger.error(f"Erro ao conectar com Supabase: {str(e)}")
         return False
 
-def delete_whatsapp_messages():
-    """Deleta todas as mensagens da tabela whatsapp_messages."""
-    try:
-        result = supabase.table('whatsapp_messages').delete().execute()
-        
-        if result.data is not None:
-            logger.info(f"Todas as mensagens do WhatsApp foram deletadas com sucesso.")
-        else:
-            logger.warning("Nenhuma mensagem do WhatsApp foi deletada ou ocorreu um erro.")
-        
-    except Exception as e:
-        logger.error(f"Erro ao deletar mensagens do WhatsApp: {e}", exc_info=True)
-
 def cleanup_resources():
     """Limpa recursos antes de encerrar a aplicação."""
     logger.info("Limpando recursos...")
@@ -50,6 +37,12 @@ def cleanup_resources():
     # Limpar cache de chatbots
     ChatbotFactory.clear_cache()
     
+    # Gravar as últimas interações ainda pendentes
+    last_interaction_coalescer.stop()
+    
+    # Gravar as mensagens do WhatsApp ainda na fila local
+    whatsapp_queue.stop()
+    
     # Encerrar scheduler
     if scheduler:
         scheduler.shutdown()
@@ -63,15 +56,12 @@ if not test_database_connection():
 # Criar aplicação Flask
 app = create_app()
 
-# Configurar o agendador
-scheduler = BackgroundScheduler()
-scheduler.add_job(
-    func=delete_whatsapp_messages,
-    trigger=CronTrigger(hour=23, minute=59, second=59),
-    id='delete_whatsapp_messages_job',
-    name='Delete WhatsApp messages daily at 23:59:59',
-    replace_existing=True
-)
+# Gravar mensagens do WhatsApp que ficaram na fila local antes de reiniciar
+whatsapp_queue.start()
+
+# Configurar o agendador: todos os workers o iniciam, mas as tarefas
+# (app/jobs.py) só rodam no worker líder
+scheduler = build_scheduler()
 
 # Iniciar o scheduler
 try:
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the local conversation scorer
+(app/services/conversation_scoring.py).
+
+Measures the cost of folding one message into the running counters (done
+on every message write), of turning counters into scores (done on every
+dashboard read) and of scoring a whole conversation from scratch.
+
+Usage:
+    python scripts/benchmark_conversation_scoring.py [--conversations 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.conversation_scoring import ConversationScorer
+
+TURNS = {
+    'assistant': [
+        "Olá, quanto custa o plano anual?", "Achei caro, vou pensar", "O pedido ainda não chegou",
+        "Perfeito, obrigado!", "Tem garantia?", "Não funcionou, quero cancelar", "Fechado, paguei agora",
+    ],
+    'user': [
+        "Entendo sua dúvida, posso oferecer desconto no Pix", "O benefício principal é a economia",
+        "Vou verificar e te retorno", "Podemos parcelar em 10x sem juros", "Ótimo, qualquer coisa estou à disposição",
+    ],
+}
+
+def make_conversation(rng, length):
+    return [
+        {'role': role, 'content': rng.choice(TURNS[role])}
+        for role in (('assistant', 'user')[i % 2] for i in range(length))
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local conversation scorer")
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--length', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    conversations = [make_conversation(rng, args.length) for _ in range(args.conversations)]
+    scorer = ConversationScorer()
+    scorer.score_messages(conversations[0])  # carrega o léxico
+
+    stats = scorer.new_stats()
+    messages = [m for conversation in conversations for m in conversation]
+    start = time.perf_counter()
+    for message in messages:
+        scorer.add(stats, message['role'], message['content'])
+    add_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(len(messages)):
+        scorer.score(stats)
+    score_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    start = time.perf_counter()
+    for conversation in conversations:
+        scorer.score_messages(conversation)
+    full_us = (time.perf_counter() - start) / len(conversations) * 1e6
+
+    print(f"acrescentar uma mensagem (escrita):       {add_us:8.2f} µs")
+    print(f"pontuar a partir dos contadores (leitura): {score_us:8.2f} µs")
+    print(f"pontuar conversa de {args.length} mensagens do zero: {full_us:8.2f} µs")
+    print(f"pontuações de exemplo: {scorer.score(stats)}")
+
+if __name__ == '__main__':
+    main()
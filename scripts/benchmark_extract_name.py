@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of VendasChatbot.extract_name's rule matching.
+
+Compares the old implementation (seven re.search calls with pattern
+strings and a list of common words) with match_name_rules (precompiled
+rules behind a keyword pre-check, frozenset stopwords) on the labelled
+messages plus long messages without names, and checks that both return
+the same names.
+
+Usage:
+    python scripts/benchmark_extract_name.py [--number 2000]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.name_extractor import match_name_rules
+
+LABELS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'name_extraction_labels.jsonl')
+
+def legacy_extract_name(message):
+    """VendasChatbot.extract_name before the compiled engine."""
+    if not message:
+        return ""
+    patterns = [
+        r"meu nome[^\w]* (?:é|eh)[^\w]* ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",
+        r"me chamo[^\w]* ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",
+        r"(?:pode[^\w]* )?me chamar de[^\w]* ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",
+        r"meu nome é ([A-Za-zÀ-ÿ]+)",
+        r"sou o ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",
+        r"sou a ([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?)",
+        r"([A-Za-zÀ-ÿ]+(?:\s[A-Za-zÀ-ÿ]+)?) é meu nome",
+    ]
+    common_words = [
+        "sim", "não", "nao", "ok", "oi", "olá", "ola", "bom", "boa", "dia", "tarde", "noite",
+        "obrigado", "obrigada", "ajuda", "claro", "todos", "todas", "porque", "como",
+        "quero", "queria", "vamos", "agora", "hoje", "amanhã", "amanha", "ontem",
+        "vendedor", "cliente", "pessoa", "gente", "pessoal", "equipe", "empresa"
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, message, re.IGNORECASE)
+        if match:
+            name = re.sub(r'[.,;:!?"]$', '', match.group(1).strip())
+            if name.lower() in common_words:
+                continue
+            if 2 <= len(name) <= 30:
+                return name
+    return ""
+
+def load_messages():
+    with open(LABELS_PATH, encoding='utf-8') as f:
+        messages = [json.loads(line)['text'] for line in f if line.strip()]
+    long_message = " ".join(["Gostaria de saber o prazo de entrega e as formas de pagamento."] * 20)
+    # Várias regras na mesma mensagem: a prioridade das regras vale, não a posição
+    overlapping = ["sou o João meu nome é Pedro", "sou o cliente meu nome é Rui", "sou o cliente, sou o Lucas"]
+    return messages + overlapping + [long_message] * 10
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark extract_name")
+    parser.add_argument('--number', type=int, default=2000, help="Passes over the message set")
+    args = parser.parse_args()
+
+    messages = load_messages()
+    mismatches = [m for m in messages if legacy_extract_name(m) != match_name_rules(m)]
+
+    with_keyword = [m for m in messages if any(k in m.lower() for k in ("nome", "chamo", "chamar", "sou "))]
+    for title, sample in (("todas as mensagens", messages), ("só mensagens com palavra-chave", with_keyword)):
+        print(f"{title} ({len(sample)})")
+        results = []
+        for label, fn in (("antes (7x re.search)", legacy_extract_name), ("depois (regras compiladas)", match_name_rules)):
+            passes = max(1, args.number // 10)
+            elapsed = min(timeit.repeat(lambda: [fn(m) for m in sample], number=passes, repeat=3))
+            per_call = elapsed / (passes * len(sample))
+            results.append(per_call)
+            print(f"  {label:<28} {per_call * 1e6:8.2f} µs/mensagem   {1 / per_call:>12,.0f} mensagens/s")
+        print(f"  ganho: {results[0] / results[1]:.1f}x")
+
+    print(f"divergências: {len(mismatches)}")
+    for message in mismatches:
+        print(f"  {message!r}: {legacy_extract_name(message)!r} -> {match_name_rules(message)!r}")
+
+if __name__ == '__main__':
+    main()
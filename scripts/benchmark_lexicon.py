@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the conversation lexicon matcher (app/services/lexicon.py)
+against the previous approach of calculate_conversation_scores: lowercasing
+each message again for every category and running `any(word in content)`.
+
+Runs on synthetic WhatsApp-style messages, once with the default lexicon
+and once with a large one (many categories and terms), which is where a
+single-pass automaton pays off.
+
+Usage:
+    python scripts/benchmark_lexicon.py [--messages 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.lexicon import CONVERSATION_LEXICON, Lexicon
+
+VOCABULARY = (
+    "olá bom dia tudo bem gostaria de saber o preço do produto entendo sua dúvida "
+    "o benefício principal é a economia a vantagem é o prazo posso ajudar com o pedido "
+    "qual o valor do frete para Belém não consegui pagar o boleto vou verificar "
+    "obrigado pela paciência compreendo perfeitamente a melhor opção é o plano anual"
+).split()
+
+LEGACY_LEXICON = {
+    "persuasao": ['benefício', 'vantagem', 'melhor', 'ideal'],
+    "empatia": ['entendo', 'compreendo', 'ajudar', 'apoiar'],
+}
+
+def make_messages(count, seed=42):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(4, 40))) for _ in range(count)]
+
+def make_large_lexicon(categories=20, terms=60, seed=7):
+    rng = random.Random(seed)
+    words = sorted(set(VOCABULARY))
+    lexicon = {}
+    for c in range(categories):
+        entries = [f"termo{c}x{t}" for t in range(terms - 4)]
+        entries += [" ".join(rng.sample(words, 2)) for _ in range(2)] + rng.sample(words, 2)
+        lexicon[f"categoria{c}"] = entries
+    return lexicon
+
+def legacy_count(messages, lexicon):
+    hits = dict.fromkeys(lexicon, 0)
+    for content in messages:
+        for category, terms in lexicon.items():
+            if any(word in content.lower() for word in terms):
+                hits[category] += 1
+    return hits
+
+def lexicon_count(messages, lexicon):
+    hits = dict.fromkeys(lexicon.categories, 0)
+    for content in messages:
+        for category, count in lexicon.count(content).items():
+            if count:
+                hits[category] += 1
+    return hits
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversation lexicon matcher")
+    parser.add_argument('--messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    large = make_large_lexicon()
+    cases = (
+        ("léxico padrão", LEGACY_LEXICON, CONVERSATION_LEXICON),
+        (f"léxico grande ({len(large)} categorias, {sum(map(len, large.values()))} termos)", large, large),
+    )
+    for title, legacy_terms, terms in cases:
+        lexicon = Lexicon(terms)
+        before, legacy_hits = _timed(legacy_count, messages, legacy_terms)
+        after, hits = _timed(lexicon_count, messages, lexicon)
+        print(title)
+        print(f"  antes  (lower + any por categoria) {args.messages / before:>12,.0f} mensagens/s")
+        print(f"  depois (Aho-Corasick, uma passada) {args.messages / after:>12,.0f} mensagens/s   {before / after:.1f}x")
+        print(f"  mensagens com termo: antes {sum(legacy_hits.values())}, depois {sum(hits.values())}")
+
+if __name__ == '__main__':
+    main()
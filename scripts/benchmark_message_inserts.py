@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark of mensagens_chatbot writes: inserts per second of the old
+Message.create (existence SELECT + name SELECT + INSERT), the current
+Message.create (one INSERT) and Message.create_many (one INSERT per batch).
+
+The Supabase client is replaced by an in-memory fake that sleeps --rtt-ms
+per round-trip, so the numbers reflect round-trips rather than server work.
+
+Usage:
+    python scripts/benchmark_message_inserts.py --messages 200 --rtt-ms 5
+"""
+
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models import Message, User
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+        self.count = None
+
+class _Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.payload = None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    def insert(self, payload):
+        self.payload = payload
+        return self
+
+    def execute(self):
+        self.client.round_trips += 1
+        time.sleep(self.client.rtt)
+        if self.payload is None:
+            return _Response([{'id': 'bench-user', 'name': 'Maria'}])
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        return _Response([dict(row, id=i) for i, row in enumerate(rows)])
+
+class FakeSupabase:
+    """Counts round-trips and simulates network latency."""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.round_trips = 0
+
+    def table(self, name):
+        return _Query(self, name)
+
+def legacy_create(client, thread_id, role, content, user_id=None, chatbot_type=None, user_name=None):
+    """Write path of Message.create before the FK: two SELECTs before every INSERT."""
+    if user_id:
+        if not client.table('usuarios_chatbot').select('id').eq('id', user_id).execute().data:
+            return None
+    if role == "user" and user_id and not (user_name or "").strip():
+        client.table('usuarios_chatbot').select('name').eq('id', user_id).execute()
+    return client.table('mensagens_chatbot').insert({
+        'thread_id': thread_id, 'role': role, 'content': content,
+        'chatbot_type': chatbot_type, 'user_name': user_name, 'user_id': user_id
+    }).execute().data[0]
+
+def _messages(count):
+    return [
+        {'thread_id': 'bench-thread', 'role': 'user' if i % 2 == 0 else 'assistant',
+         'content': f'mensagem {i}', 'user_id': 'bench-user', 'chatbot_type': 'vendas', 'user_name': ''}
+        for i in range(count)
+    ]
+
+def _run(label, client, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count / elapsed:>10.1f} inserts/s   {client.round_trips:>5} round-trips")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mensagens_chatbot inserts")
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=5.0)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    rtt = args.rtt_ms / 1000.0
+    messages = _messages(args.messages)
+    print(f"{args.messages} mensagens, {args.rtt_ms} ms por ida ao banco")
+
+    client = FakeSupabase(rtt)
+    _run("antes: Message.create", client,
+         lambda: [legacy_create(client, **msg) for msg in messages], args.messages)
+
+    client = FakeSupabase(rtt)
+    with patch('app.models.supabase', client), patch('app.models.watermarks'):
+        User.remember('bench-user')
+        _run("depois: Message.create", client,
+             lambda: [Message.create(**msg) for msg in messages], args.messages)
+
+    client = FakeSupabase(rtt)
+    with patch('app.models.supabase', client), patch('app.models.watermarks'):
+        batches = [messages[i:i + args.batch_size] for i in range(0, len(messages), args.batch_size)]
+        _run(f"depois: create_many ({args.batch_size})", client,
+             lambda: [Message.create_many(batch) for batch in batches], args.messages)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark of query_whatsapp_messages searches: the old substring scan
+(``LIKE '%termo%'`` on content, ordered by timestamp) against the indexed
+search (SQLiteMessageSearch, FTS5 with bm25 ranking), both on a local SQLite
+table with the same synthetic messages.
+
+SQLite stands in for Postgres here; the indexed path mirrors the GIN/tsvector
+function of scripts/sql/008_whatsapp_message_search.sql.
+
+Selective queries (rare terms, the usual case for a product, order or name)
+are where the index pays off: LIKE has to scan the whole table. Queries made
+of very common words match a large share of rows; LIKE can stop after the
+first ``limit`` recent hits, while the ranked search scores every match.
+
+Usage:
+    python scripts/benchmark_message_search.py --rows 200000 --queries 50
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.search_service import SQLiteMessageSearch
+
+WORDS = (
+    "ola bom dia quero saber preco plano anual mensal desconto boleto pix cartao parcela "
+    "entrega prazo obrigado ajuda suporte cancelar contrato proposta reuniao amanha hoje "
+    "cliente produto servico valor pagamento beneficio garantia duvida retorno ligacao"
+).split()
+NAMES = ["João Silva", "Maria Souza", "Ana Lima", "Carlos Pereira", "Fernanda Alves", "Pedro Santos"]
+PRODUCTS = [f"produto{i}" for i in range(2000)]
+# Termos comuns casam com boa parte da tabela; produtos raros, com poucas linhas
+COMMON_QUERIES = ["preco plano", "boleto", "cancelar contrato", "garantia", "desconto pix", "reuniao amanha"]
+RARE_QUERIES = ["produto17", "produto1234 boleto", "produto42", "produto999 garantia", "produto1500"]
+
+def _rows(count, seed=7):
+    rng = random.Random(seed)
+    base = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        yield {
+            "id": i + 1,
+            "sender_name": rng.choice(NAMES),
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+                       + (f" {rng.choice(PRODUCTS)}" if rng.random() < 0.2 else ""),
+            "timestamp": (base + datetime.timedelta(seconds=i * 30)).isoformat(),
+        }
+
+def like_search(db, content, limit):
+    """Search before this change: one LIKE per call, full scan, newest first."""
+    return db.execute(
+        "SELECT id, sender_name, content, timestamp FROM whatsapp_messages "
+        "WHERE content LIKE ? ORDER BY timestamp DESC LIMIT ?",
+        (f"%{content}%", limit)
+    ).fetchall()
+
+def _run(label, fn, queries):
+    start = time.perf_counter()
+    hits = sum(len(fn(q)) for q in queries)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed / len(queries) * 1000:>9.2f} ms/consulta   {hits:>6} resultados")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark whatsapp_messages search")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "search_bench.sqlite3")
+    search = SQLiteMessageSearch(path)
+    start = time.perf_counter()
+    batch = []
+    for row in _rows(args.rows):
+        batch.append(row)
+        if len(batch) == 10000:
+            search.add_many(batch)
+            batch = []
+    if batch:
+        search.add_many(batch)
+    print(f"{args.rows} mensagens indexadas em {time.perf_counter() - start:.1f}s")
+
+    # O LIKE antigo procura a frase inteira; a busca indexada combina os termos com AND
+    for title, pool in (("termos raros", RARE_QUERIES), ("termos comuns", COMMON_QUERIES)):
+        queries = [pool[i % len(pool)] for i in range(args.queries)]
+        print(f"-- {title}")
+        _run("antes: LIKE '%termo%'", lambda q: like_search(search._db, q, args.limit), queries)
+        _run("depois: FTS5 + bm25", lambda q: search.search(content=q, limit=args.limit), queries)
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the tiered name extractor (app/services/name_extractor.py)
+against a labelled set of WhatsApp-style messages.
+
+Reports throughput of the local tiers, precision/recall (a prediction is
+correct when its first name matches the label) and the share of messages
+that needed the LLM tier.
+
+By default the LLM tier is a stub that answers "no name" without any
+network call; pass --openai to use the real batched resolver.
+
+Usage:
+    python scripts/benchmark_name_extraction.py [--openai] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.name_extractor import NameExtractor, OpenAINameResolver
+
+LABELS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'name_extraction_labels.jsonl')
+
+def load_labels(path=LABELS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _first_name(name):
+    return name.split()[0].lower() if name else None
+
+def score(labels, predictions):
+    true_positive = sum(
+        1 for item, predicted in zip(labels, predictions)
+        if predicted and item['name'] and _first_name(predicted) == _first_name(item['name'])
+    )
+    predicted = sum(1 for p in predictions if p)
+    expected = sum(1 for item in labels if item['name'])
+    precision = true_positive / predicted if predicted else 1.0
+    recall = true_positive / expected if expected else 1.0
+    return precision, recall
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tiered name extractor")
+    parser.add_argument('--openai', action='store_true', help="Resolve ambiguous messages with the OpenAI API")
+    parser.add_argument('--repeat', type=int, default=200, help="Repetitions for the throughput measurement")
+    args = parser.parse_args()
+
+    labels = load_labels()
+    texts = [item['text'] for item in labels]
+
+    if args.openai:
+        from openai import OpenAI
+        from config import Config
+        client = OpenAI(api_key=Config.OPENAI_API_KEY)
+        resolver = OpenAINameResolver(lambda: client)
+    else:
+        resolver = lambda batch: [None] * len(batch)
+
+    # Throughput of the local tiers (rules + heuristic classifier)
+    local = NameExtractor()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in texts:
+            local.classify(text)
+    elapsed = time.perf_counter() - start
+    throughput = args.repeat * len(texts) / elapsed
+
+    extractor = NameExtractor(llm_resolver=resolver)
+    start = time.perf_counter()
+    predictions = extractor.extract_many(texts)
+    pipeline_elapsed = time.perf_counter() - start
+    precision, recall = score(labels, predictions)
+    stats = extractor.stats
+
+    print(f"{len(texts)} mensagens rotuladas ({sum(1 for i in labels if i['name'])} com nome)")
+    print(f"camadas locais:   {throughput:,.0f} mensagens/s")
+    print(f"pipeline:         {pipeline_elapsed * 1000:.1f} ms ({'openai' if args.openai else 'stub'})")
+    print(f"precisão:         {precision:.2%}")
+    print(f"recall:           {recall:.2%}")
+    print(f"regras:           {stats['rule_hits']}  descartadas localmente: {stats['local_rejects']}")
+    print(f"fração no LLM:    {stats['llm_messages'] / stats['messages']:.2%} "
+          f"({stats['llm_messages']} mensagens em {stats['llm_requests']} requisição(ões))")
+    for item, predicted in zip(labels, predictions):
+        if _first_name(predicted) != _first_name(item['name']):
+            print(f"  erro: {item['text']!r} -> {predicted!r} (esperado {item['name']!r})")
+
+if __name__ == '__main__':
+    main()
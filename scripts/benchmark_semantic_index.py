@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the local semantic index (app/services/semantic_index.py):
+indexing throughput and top-k cosine search latency over synthetic WhatsApp
+messages, 1M by default.
+
+The index is built in a temporary directory (about rows x dim x 4 bytes of
+vectors plus the SQLite metadata) and removed at the end. Needs numpy.
+
+Usage:
+    python scripts/benchmark_semantic_index.py --rows 1000000 --queries 50 --k 10
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.semantic_index import SemanticIndex
+
+TOPICS = [
+    "quero reclamar do atendimento demorado ninguem responde",
+    "o boleto venceu preciso de uma segunda via",
+    "qual o preco do plano anual tem desconto no pix",
+    "a entrega atrasou e o produto chegou com defeito",
+    "gostaria de cancelar meu contrato e pedir reembolso",
+    "obrigado pela ajuda excelente atendimento",
+    "podemos marcar uma reuniao amanha para falar da proposta",
+    "nao consigo acessar a plataforma esqueci a senha",
+]
+FILLER = "ola bom dia pessoal entao tudo certo beleza hoje agora ainda sobre isso aquilo".split()
+QUERIES = ["reclamações de atendimento", "problemas com entrega", "cancelamento e reembolso",
+           "dúvidas sobre preço", "acesso à plataforma"]
+
+def _rows(count, start, seed):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(start, start + count):
+        words = rng.choice(TOPICS).split()
+        words = rng.sample(words, k=max(3, len(words) - 2)) + rng.sample(FILLER, k=rng.randint(1, 5))
+        rows.append({
+            "id": i + 1,
+            "sender_name": f"Cliente {i % 500}",
+            "content": " ".join(words) + f" pedido{rng.randint(1, 100000)}",
+            "timestamp": f"2024-01-01T00:00:{i % 60:02d}",
+            "processed_at": f"2024-01-01T00:00:{i % 60:02d}",
+        })
+    return rows
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local semantic index")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--dim', type=int, default=256)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="semantic_bench_")
+    try:
+        index = SemanticIndex(directory, dim=args.dim)
+        start = time.perf_counter()
+        for offset in range(0, args.rows, args.batch_size):
+            index.add_many(_rows(min(args.batch_size, args.rows - offset), offset, seed=offset))
+        elapsed = time.perf_counter() - start
+        metrics = index.metrics()
+        print(f"{args.rows} mensagens indexadas em {elapsed:.1f}s ({args.rows / elapsed:.0f} msg/s), "
+              f"vetores: {metrics['file_bytes'] / 2 ** 20:.0f} MiB")
+
+        # Incremento típico do webhook: um lote pequeno sobre o índice cheio
+        start = time.perf_counter()
+        index.add_many(_rows(100, args.rows, seed=-1))
+        print(f"lote incremental de 100 mensagens: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        index.search(QUERIES[0], k=args.k)  # aquece o page cache
+        latencies = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            hits = index.search(QUERIES[i % len(QUERIES)], k=args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"busca top-{args.k}: p50 {_percentile(latencies, 50):.1f} ms, "
+              f"p95 {_percentile(latencies, 95):.1f} ms, max {max(latencies):.1f} ms")
+        print(f"exemplo ({QUERIES[(args.queries - 1) % len(QUERIES)]}): "
+              + "; ".join(f"{hit['score']:.2f} {hit['content'][:40]}" for hit in hits[:3]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark of WhatsApp webhook ingestion: messages per second of one POST per
+message versus one POST carrying the whole batch, through the Flask test
+client, plus the cost of draining the local queue into whatsapp_messages.
+
+The queue lives in a temporary directory and the Supabase client is replaced
+by a fake that sleeps --rtt-ms per round-trip.
+
+Usage:
+    python scripts/benchmark_webhook_batch.py --messages 5000 --batch-size 500
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.services.ingest_queue import IngestQueue
+from app import whatsapp_handler
+
+class FakeSupabase:
+    """Counts round-trips and simulates network latency."""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.round_trips = 0
+        self.rows = 0
+        # Nenhuma linha devolvida pelo upsert (nada a indexar)
+        self.data = []
+
+    def table(self, name):
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.rows += len(payload) if isinstance(payload, list) else 1
+        return self
+
+    def execute(self):
+        self.round_trips += 1
+        time.sleep(self.rtt)
+        return self
+
+def _messages(count):
+    return [
+        {'sender': f'Cliente {i % 50}', 'content': f'Olá, quero saber o preço do plano {i}',
+         'timestamp': str(1700000000 + i // 10)}
+        for i in range(count)
+    ]
+
+def _queue(directory, name, batch_size):
+    # Intervalo longo: o consumidor só grava quando o benchmark chama drain
+    return IngestQueue(os.path.join(directory, f'{name}.sqlite3'), whatsapp_handler.store_whatsapp_records,
+                       batch_size=batch_size, interval=3600, name=name)
+
+def _report(label, count, elapsed, extra=""):
+    print(f"{label:<34} {count / elapsed:>10.0f} mensagens/s  {extra}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WhatsApp webhook batches")
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--rtt-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    app = create_app()
+    logging.disable(logging.INFO)
+    client = app.test_client()
+    messages = _messages(args.messages)
+    print(f"{args.messages} mensagens, lotes de {args.batch_size}, {args.rtt_ms} ms por ida ao banco")
+
+    fake = FakeSupabase(args.rtt_ms / 1000.0)
+    with tempfile.TemporaryDirectory() as directory, patch.object(whatsapp_handler, 'supabase', fake):
+        queue = _queue(directory, 'single', args.batch_size)
+        with patch.object(whatsapp_handler, 'whatsapp_queue', queue):
+            start = time.perf_counter()
+            for message in messages:
+                client.post('/whatsapp-webhook', json=message)
+            _report("um POST por mensagem", args.messages, time.perf_counter() - start)
+
+        queue = _queue(directory, 'batch', args.batch_size)
+        with patch.object(whatsapp_handler, 'whatsapp_queue', queue):
+            start = time.perf_counter()
+            for i in range(0, len(messages), args.batch_size):
+                body = client.post('/whatsapp-webhook', json=messages[i:i + args.batch_size]).get_json()
+                assert body['accepted'] == len(messages[i:i + args.batch_size])
+            _report(f"um POST por lote ({args.batch_size})", args.messages, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        records, _ = whatsapp_handler.build_whatsapp_records(messages)
+        _report("só validação/normalização", args.messages, time.perf_counter() - start)
+
+        # O lote pode já ter sido gravado pelo consumidor em segundo plano; grava o resto e mede tudo
+        queue.stop()
+        fake.round_trips = fake.rows = 0
+        single = _queue(directory, 'single', args.batch_size)
+        start = time.perf_counter()
+        written = single.drain()
+        _report("consumidor: fila -> whatsapp_messages", written, time.perf_counter() - start,
+                f"{fake.round_trips} inserts de {args.batch_size}")
+
+if __name__ == '__main__':
+    main()
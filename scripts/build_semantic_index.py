@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Fills the local semantic index (app/services/semantic_index.py) with the
+messages already stored in whatsapp_messages. New messages are indexed by the
+webhook ingest as they arrive; this covers the backlog and rebuilds.
+
+Messages already in the index are skipped, so the script can be re-run.
+--rebuild starts from an empty index, which also refreshes the TF-IDF
+weights; run it with the application stopped, since every worker maps the
+index files.
+
+Usage:
+    python scripts/build_semantic_index.py [--rebuild] [--page-size 1000]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local semantic index of WhatsApp messages")
+    parser.add_argument('--rebuild', action='store_true', help="apaga o índice antes de indexar")
+    parser.add_argument('--page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    if not Config.SEMANTIC_INDEX_DIR:
+        logger.error("SEMANTIC_INDEX_DIR vazio: índice semântico desligado")
+        return 1
+    if args.rebuild and os.path.isdir(Config.SEMANTIC_INDEX_DIR):
+        shutil.rmtree(Config.SEMANTIC_INDEX_DIR)
+        logger.info(f"Índice apagado: {Config.SEMANTIC_INDEX_DIR}")
+
+    from app.models import supabase
+    from app.services.semantic_index import SemanticIndex
+    index = SemanticIndex(Config.SEMANTIC_INDEX_DIR, dim=Config.SEMANTIC_INDEX_DIM)
+
+    last_id, seen, added = None, 0, 0
+    while True:
+        query = supabase.table('whatsapp_messages').select('id,sender_name,content,timestamp,processed_at')
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(args.page_size).execute().data or []
+        if not rows:
+            break
+        added += index.add_many(rows)
+        seen += len(rows)
+        last_id = rows[-1]['id']
+        logger.info(f"{seen} mensagens lidas, {added} indexadas")
+    logger.info(f"Concluído: {index.metrics()}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Grades conversations from mensagens_chatbot with the model, many conversations
+per request (see app/services/conversation_grader.py).
+
+Conversations whose content did not change since the last run are answered
+from the shared cache. Modes:
+    (default)                       grade online and print the grades
+    --write-batch FILE              write an OpenAI Batch API requests file
+    --read-results OUT --requests FILE
+                                    load a Batch API output file into the cache
+    --stub FILE OUT                 produce OUT from FILE locally, without the API
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_conversations(client, user_id: Optional[str] = None, page_size: int = 1000) -> Dict[str, List[Dict]]:
+    """Return {thread_id: [{'role', 'content'}, ...]} in chronological order, keyset-paginated by id."""
+    conversations: Dict[str, List[Dict]] = defaultdict(list)
+    last_id = None
+    while True:
+        query = client.table('mensagens_chatbot').select('id,thread_id,role,content')
+        if user_id:
+            query = query.eq('user_id', user_id)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(page_size).execute().data or []
+        if not rows:
+            break
+        for row in rows:
+            if row.get('thread_id'):
+                conversations[row['thread_id']].append({'role': row.get('role'), 'content': row.get('content')})
+        last_id = rows[-1]['id']
+    return dict(conversations)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-id', help="Only conversations of this user")
+    parser.add_argument('--batch-size', type=int, default=10, help="Conversations per request")
+    parser.add_argument('--model', default='gpt-4o')
+    parser.add_argument('--write-batch', metavar='FILE')
+    parser.add_argument('--read-results', metavar='OUT')
+    parser.add_argument('--requests', metavar='FILE', help="Requests file given to --write-batch")
+    parser.add_argument('--stub', nargs=2, metavar=('FILE', 'OUT'))
+    args = parser.parse_args()
+
+    from app.services.cache_service import get_shared_cache
+    from app.services.conversation_grader import ConversationGrader, process_batch_file_locally
+
+    if args.stub:
+        count = process_batch_file_locally(*args.stub)
+        logger.info(f"Local batch processed: {count} requests written to {args.stub[1]}")
+        return
+
+    def client_getter():
+        from app.chatbot.base import client
+        return client
+
+    grader = ConversationGrader(client_getter, cache=get_shared_cache(), model=args.model,
+                                batch_size=args.batch_size, ttl=Config.CONVERSATION_GRADE_TTL)
+
+    if args.read_results:
+        if not args.requests:
+            parser.error("--read-results requires --requests")
+        grades = grader.read_batch_results(args.read_results, args.requests)
+        logger.info(f"{len(grades)} grades loaded into the cache")
+        return
+
+    from supabase import create_client
+    client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+    conversations = load_conversations(client, args.user_id)
+    logger.info(f"{len(conversations)} conversations loaded")
+
+    if args.write_batch:
+        requests = grader.write_batch_file(conversations, args.write_batch)
+        logger.info(f"{requests} requests written to {args.write_batch} "
+                    f"({grader.stats['cache_hits']} conversations already graded)")
+        return
+
+    grades = grader.grade(conversations)
+    print(json.dumps(grades, ensure_ascii=False, indent=2))
+    logger.info(f"Stats: {grader.stats}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Collapses the user_name copies stored on every mensagens_chatbot row into
+one row per thread in thread_display_names (see scripts/sql/003_thread_display_names.sql).
+
+The most recent valid name of each thread wins. Existing rows in
+thread_display_names are only overwritten with --overwrite.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from supabase import create_client
+from config import Config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_NAMES = ("", "Usuário Anônimo", "Nenhum nome encontrado")
+
+class DisplayNameMigration:
+    """Reads user messages in keyset-paginated batches and upserts one name per thread."""
+
+    def __init__(self, client, batch_size: int = 1000):
+        self.client = client
+        self.batch_size = batch_size
+
+    def collect_names(self) -> Dict[str, Tuple[str, str, str]]:
+        """Return {thread_id: (timestamp, display_name, user_id)} with the latest valid name."""
+        latest: Dict[str, Tuple[str, str, str]] = {}
+        last_id = None
+        scanned = 0
+        while True:
+            query = self.client.table('mensagens_chatbot')\
+                .select('id,thread_id,user_id,user_name,timestamp')\
+                .eq('role', 'user')
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.order('id').limit(self.batch_size).execute().data or []
+            if not rows:
+                break
+            for row in rows:
+                name = (row.get('user_name') or '').strip()
+                if not row.get('thread_id') or name in PLACEHOLDER_NAMES:
+                    continue
+                timestamp = row.get('timestamp') or ''
+                current = latest.get(row['thread_id'])
+                if current is None or timestamp >= current[0]:
+                    latest[row['thread_id']] = (timestamp, name, row.get('user_id'))
+            scanned += len(rows)
+            last_id = rows[-1]['id']
+            logger.info(f"Scanned {scanned} messages, {len(latest)} threads with a name")
+        return latest
+
+    def write_names(self, names: Dict[str, Tuple[str, str, str]], overwrite: bool = False) -> int:
+        """Upsert the collected names in batches; return the number of rows sent."""
+        records = [
+            {'thread_id': thread_id, 'display_name': name, 'user_id': user_id, 'updated_at': timestamp or None}
+            for thread_id, (timestamp, name, user_id) in names.items()
+        ]
+        for start in range(0, len(records), self.batch_size):
+            chunk = records[start:start + self.batch_size]
+            self.client.table('thread_display_names').upsert(
+                chunk,
+                on_conflict='thread_id',
+                ignore_duplicates=not overwrite
+            ).execute()
+            logger.info(f"Upserted {start + len(chunk)}/{len(records)} display names")
+        return len(records)
+
+def main():
+    """Main migration function."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be written")
+    parser.add_argument('--overwrite', action='store_true', help="Replace names already in thread_display_names")
+    args = parser.parse_args()
+
+    client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+    migration = DisplayNameMigration(client, batch_size=args.batch_size)
+
+    names = migration.collect_names()
+    if args.dry_run:
+        logger.info(f"Dry run: {len(names)} threads would receive a display name")
+        return
+
+    written = migration.write_names(names, overwrite=args.overwrite)
+    logger.info(f"Migration completed successfully! {written} display names written")
+
+if __name__ == '__main__':
+    main()
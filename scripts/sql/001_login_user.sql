@@ -0,0 +1,35 @@
+-- Login em uma única ida ao banco: verifica as credenciais, cria ou atualiza
+-- o usuário e incrementa login_count de forma atômica.
+-- Chamado por SupabaseLoginService via supabase.rpc('login_user', ...).
+
+create unique index if not exists usuarios_chatbot_email_key
+    on public.usuarios_chatbot (email);
+
+create or replace function public.login_user(p_email text, p_password text)
+returns setof public.usuarios_chatbot
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if not exists (
+        select 1 from usuarios_autorizados
+        where email = p_email and password = p_password
+    ) then
+        return;
+    end if;
+
+    return query
+    insert into usuarios_chatbot as u (id, name, email, last_interaction, login_count)
+    values (gen_random_uuid(), 'Usuário Anônimo', p_email, now(), 1)
+    on conflict (email) do update
+        set login_count = coalesce(u.login_count, 0) + 1,
+            last_interaction = now()
+    returning u.*;
+end;
+$$;
+
+-- security definer: só o backend (SUPABASE_KEY com a chave service_role) pode chamar;
+-- com anon, qualquer um com a chave pública testaria senhas e criaria usuários
+revoke all on function public.login_user(text, text) from public, anon, authenticated;
+grant execute on function public.login_user(text, text) to service_role;
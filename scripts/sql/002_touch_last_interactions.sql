@@ -0,0 +1,23 @@
+-- Atualiza last_interaction de vários usuários em uma única instrução.
+-- Chamado pelo ActivityCoalescer (app/services/activity_coalescer.py) com
+-- p_rows = [{"id": "...", "last_interaction": "2024-01-01T12:00:00+00:00"}, ...].
+
+create or replace function public.touch_last_interactions(p_rows jsonb)
+returns integer
+language sql
+security definer
+set search_path = public
+as $$
+    with updated as (
+        update usuarios_chatbot as u
+           set last_interaction = greatest(u.last_interaction, r.last_interaction)
+          from jsonb_to_recordset(p_rows) as r(id text, last_interaction timestamptz)
+         where u.id::text = r.id
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
+
+-- security definer: só o backend (chave service_role) pode chamar
+revoke all on function public.touch_last_interactions(jsonb) from public, anon, authenticated;
+grant execute on function public.touch_last_interactions(jsonb) to service_role;
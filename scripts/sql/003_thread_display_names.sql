@@ -0,0 +1,35 @@
+-- Nome de exibição armazenado uma única vez por thread, em vez de repetido
+-- em cada linha de mensagens_chatbot. As mensagens recebem o nome na leitura
+-- (view mensagens_chatbot_nomes, lida por ThreadDisplayName.fetch em app/models.py).
+
+create table if not exists public.thread_display_names (
+    thread_id    text primary key,
+    user_id      text,
+    display_name text not null,
+    updated_at   timestamptz not null default now()
+);
+
+create index if not exists thread_display_names_user_id_idx
+    on public.thread_display_names (user_id);
+
+-- Carga inicial a partir dos dados denormalizados: último nome válido de cada thread.
+-- scripts/migrate_display_names.py faz o mesmo pela API, em lotes.
+insert into public.thread_display_names (thread_id, user_id, display_name, updated_at)
+select distinct on (thread_id) thread_id, user_id, btrim(user_name), timestamp
+  from public.mensagens_chatbot
+ where role = 'user'
+   and user_name is not null
+   and btrim(user_name) <> ''
+   and btrim(user_name) not in ('Usuário Anônimo', 'Nenhum nome encontrado')
+ order by thread_id, timestamp desc
+on conflict (thread_id) do nothing;
+
+-- Histórico já com o nome de exibição da thread, numa única consulta: o
+-- PostgREST lê a view com os mesmos filtros da tabela. m.* é expandido na
+-- criação; reexecute este arquivo se mensagens_chatbot ganhar colunas.
+drop view if exists public.mensagens_chatbot_nomes;
+create view public.mensagens_chatbot_nomes
+with (security_invoker = true) as
+select m.*, d.display_name
+  from public.mensagens_chatbot m
+  left join public.thread_display_names d on d.thread_id = m.thread_id;
@@ -0,0 +1,24 @@
+-- A existência do usuário de cada mensagem passa a ser garantida pelo banco,
+-- e não por um SELECT em usuarios_chatbot antes de cada insert (Message.create).
+
+-- Mensagens antigas de usuários removidos perdem apenas o vínculo.
+update public.mensagens_chatbot m
+   set user_id = null
+ where m.user_id is not null
+   and not exists (select 1 from public.usuarios_chatbot u where u.id = m.user_id);
+
+alter table public.mensagens_chatbot
+    drop constraint if exists mensagens_chatbot_user_id_fkey;
+
+-- "not valid" evita bloquear a tabela durante a checagem; a validação é feita em seguida.
+alter table public.mensagens_chatbot
+    add constraint mensagens_chatbot_user_id_fkey
+    foreign key (user_id) references public.usuarios_chatbot (id)
+    on delete set null
+    not valid;
+
+alter table public.mensagens_chatbot
+    validate constraint mensagens_chatbot_user_id_fkey;
+
+create index if not exists mensagens_chatbot_user_id_idx
+    on public.mensagens_chatbot (user_id);
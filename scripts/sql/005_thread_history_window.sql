@@ -0,0 +1,36 @@
+-- Janela de histórico limitada por thread (WhatsAppChatbot): leitura das N
+-- mensagens mais recentes pelo índice e remoção das mais antigas com um único
+-- delete por faixa, sem apagar e reinserir a janela.
+
+create index if not exists mensagens_chatbot_thread_timestamp_idx
+    on public.mensagens_chatbot (thread_id, timestamp desc, id desc);
+
+-- Devolve uma linha por autor das mensagens removidas (user_id, deleted), para
+-- o backend invalidar os contadores de pontuação em cache desses usuários.
+drop function if exists public.trim_thread_history(text, integer);
+
+create function public.trim_thread_history(p_thread_id text, p_keep integer)
+returns table (user_id text, deleted integer)
+language sql
+security definer
+set search_path = public
+as $$
+    with deleted as (
+        delete from mensagens_chatbot m
+         where m.thread_id = p_thread_id
+           and (m.timestamp, m.id) < (
+               select w.timestamp, w.id
+                 from mensagens_chatbot w
+                where w.thread_id = p_thread_id
+                order by w.timestamp desc, w.id desc
+                offset greatest(p_keep, 1) - 1
+                limit 1
+           )
+        returning m.user_id
+    )
+    select d.user_id::text, count(*)::integer from deleted d group by d.user_id;
+$$;
+
+-- security definer: só o backend (chave service_role) pode chamar
+revoke all on function public.trim_thread_history(text, integer) from public, anon, authenticated;
+grant execute on function public.trim_thread_history(text, integer) to service_role;
@@ -0,0 +1,11 @@
+-- Chave de idempotência das mensagens do WhatsApp: id da mensagem no provedor
+-- ou hash de remetente + conteúdo + timestamp (app/whatsapp_handler.py). A
+-- fila local já descarta reenvios; o índice único é a garantia final caso a
+-- mesma mensagem chegue a dois hosts ou o arquivo da fila seja perdido.
+-- Linhas antigas ficam com message_key nulo (nulos não conflitam).
+
+alter table public.whatsapp_messages
+    add column if not exists message_key text;
+
+create unique index if not exists whatsapp_messages_message_key_idx
+    on public.whatsapp_messages (message_key);
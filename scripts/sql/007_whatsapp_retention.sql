@@ -0,0 +1,10 @@
+-- Retenção contínua de whatsapp_messages (app/services/retention.py): os
+-- lotes são escolhidos por processed_at e removidos por id, então os dois
+-- acessos usam índices e cada delete toca no máximo um lote de linhas.
+
+create index if not exists whatsapp_messages_processed_at_idx
+    on public.whatsapp_messages (processed_at, id);
+
+-- Opcional: destino do arquivamento quando WHATSAPP_ARCHIVE_TABLE=whatsapp_messages_archive
+create table if not exists public.whatsapp_messages_archive
+    (like public.whatsapp_messages including all);
@@ -0,0 +1,79 @@
+-- Busca indexada em whatsapp_messages para a função query_whatsapp_messages
+-- (app/services/search_service.py). Antes a busca usava ilike '%termo%' em
+-- content e sender_name, o que obriga uma varredura sequencial da tabela.
+--
+-- * content: coluna tsvector gerada (dicionário portuguese, sem acentos) com
+--   índice GIN; os termos da busca viram prefixos combinados com AND e o
+--   resultado é ordenado por ts_rank_cd e depois pela data.
+-- * sender_name: índice de trigramas sobre o nome sem acentos e minúsculo,
+--   usado pelo filtro de substring (like '%nome%').
+-- * Só as colunas necessárias voltam: id, sender_name, content, timestamp, rank.
+
+create extension if not exists pg_trgm;
+create extension if not exists unaccent;
+
+-- unaccent() é apenas stable; índices e colunas geradas exigem uma função immutable
+create or replace function public.f_unaccent(text)
+returns text
+language sql
+immutable
+parallel safe
+strict
+as $$
+    select public.unaccent('public.unaccent'::regdictionary, $1)
+$$;
+
+alter table public.whatsapp_messages
+    add column if not exists content_tsv tsvector
+    generated always as (to_tsvector('portuguese'::regconfig, public.f_unaccent(coalesce(content, '')))) stored;
+
+create index if not exists whatsapp_messages_content_tsv_idx
+    on public.whatsapp_messages using gin (content_tsv);
+
+create index if not exists whatsapp_messages_sender_trgm_idx
+    on public.whatsapp_messages using gin (public.f_unaccent(lower(sender_name)) gin_trgm_ops);
+
+create index if not exists whatsapp_messages_timestamp_idx
+    on public.whatsapp_messages (timestamp desc);
+
+-- p_terms já chega sem acentos, em minúsculas e só com [a-z0-9] (query_terms).
+-- Se todos os termos forem stopwords do dicionário portuguese, a consulta fica
+-- vazia; nesse caso as palavras são procuradas com o dicionário simple (sem
+-- índice), como no SQLiteMessageSearch, em vez de ignorar o filtro.
+create or replace function public.search_whatsapp_messages(
+    p_terms text[] default '{}',
+    p_sender text default null,
+    p_start timestamptz default null,
+    p_end timestamptz default null,
+    p_limit integer default 10
+)
+returns table (id bigint, sender_name text, content text, "timestamp" timestamptz, rank real)
+language sql
+stable
+as $$
+    with terms as (
+        select case when coalesce(cardinality(p_terms), 0) = 0 then null
+                    else array_to_string(array(select t || ':*' from unnest(p_terms) as t), ' & ')
+               end as expr
+    ), q as (
+        select to_tsquery('portuguese', expr) as query,
+               case when numnode(to_tsquery('portuguese', expr)) = 0
+                    then to_tsquery('simple', expr) end as stopword_query
+          from terms
+    )
+    select m.id::bigint, m.sender_name::text, m.content::text, m.timestamp::timestamptz,
+           coalesce(case when q.stopword_query is null then ts_rank_cd(m.content_tsv, q.query)
+                         else ts_rank_cd(to_tsvector('simple', public.f_unaccent(coalesce(m.content, ''))),
+                                         q.stopword_query)
+                    end, 0)::real as rank
+      from public.whatsapp_messages m, q
+     where (q.query is null
+            or (q.stopword_query is null and m.content_tsv @@ q.query)
+            or to_tsvector('simple', public.f_unaccent(coalesce(m.content, ''))) @@ q.stopword_query)
+       and (p_sender is null
+            or public.f_unaccent(lower(m.sender_name)) like '%' || public.f_unaccent(lower(p_sender)) || '%')
+       and (p_start is null or m.timestamp >= p_start)
+       and (p_end is null or m.timestamp <= p_end)
+     order by rank desc, m.timestamp desc
+     limit greatest(1, least(coalesce(p_limit, 10), 500))
+$$;
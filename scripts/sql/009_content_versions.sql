@@ -0,0 +1,97 @@
+-- Versões por thread e por usuário usadas nos ETags de /get_chat_history e
+-- /get_dashboard_data (VersionWatermarks em app/services/version_service.py).
+-- Antes elas ficavam só no cache local de cada host: com mais de um host, uma
+-- mensagem gravada pelo host A não mudava a versão vista pelo host B, que
+-- seguia respondendo 304 com dados antigos. Aqui os gatilhos incrementam a
+-- versão no próprio banco a cada escrita, venha ela de onde vier.
+
+create table if not exists public.content_versions (
+    scope   text not null,
+    key     text not null,
+    version bigint not null default 1,
+    primary key (scope, key)
+);
+
+-- Lido e escrito só pelo backend (chave service_role) e pelos gatilhos
+alter table public.content_versions enable row level security;
+revoke all on table public.content_versions from public, anon, authenticated;
+grant select on table public.content_versions to service_role;
+
+-- Um incremento por thread/usuário afetado em cada instrução (o trim apaga
+-- muitas linhas do mesmo thread de uma vez). "changed" é a tabela de transição
+-- declarada em cada gatilho abaixo.
+create or replace function public.bump_message_versions()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into content_versions as v (scope, key)
+    select 'thread', thread_id::text from changed where thread_id is not null
+    union
+    select 'user', user_id::text from changed where user_id is not null
+    on conflict (scope, key) do update set version = v.version + 1;
+    return null;
+end;
+$$;
+
+drop trigger if exists mensagens_chatbot_versions_insert on public.mensagens_chatbot;
+create trigger mensagens_chatbot_versions_insert
+    after insert on public.mensagens_chatbot
+    referencing new table as changed
+    for each statement execute function public.bump_message_versions();
+
+drop trigger if exists mensagens_chatbot_versions_update on public.mensagens_chatbot;
+create trigger mensagens_chatbot_versions_update
+    after update on public.mensagens_chatbot
+    referencing new table as changed
+    for each statement execute function public.bump_message_versions();
+
+drop trigger if exists mensagens_chatbot_versions_delete on public.mensagens_chatbot;
+create trigger mensagens_chatbot_versions_delete
+    after delete on public.mensagens_chatbot
+    referencing old table as changed
+    for each statement execute function public.bump_message_versions();
+
+-- Renomear a thread muda o histórico exibido
+create or replace function public.bump_thread_name_version()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into content_versions as v (scope, key)
+    values ('thread', new.thread_id)
+    on conflict (scope, key) do update set version = v.version + 1;
+    return null;
+end;
+$$;
+
+drop trigger if exists thread_display_names_version on public.thread_display_names;
+create trigger thread_display_names_version
+    after insert or update on public.thread_display_names
+    for each row execute function public.bump_thread_name_version();
+
+-- login_count e os demais dados do usuário aparecem no dashboard
+create or replace function public.bump_user_version()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into content_versions as v (scope, key)
+    values ('user', new.id::text)
+    on conflict (scope, key) do update set version = v.version + 1;
+    return null;
+end;
+$$;
+
+drop trigger if exists usuarios_chatbot_version on public.usuarios_chatbot;
+create trigger usuarios_chatbot_version
+    after update on public.usuarios_chatbot
+    for each row
+    when (old.login_count is distinct from new.login_count or old.name is distinct from new.name)
+    execute function public.bump_user_version();
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Pushes the instructions and tools defined in code to the existing OpenAI
+assistants (ASSISTANT_ID_VENDAS, ASSISTANT_ID_TREINAMENTO, ASSISTANT_ID_WHATSAPP).
+
+The application never does this on start: it would overwrite changes made in
+the OpenAI dashboard, and the vendas tool list depends on the host
+(semantic_search_whatsapp_messages is only offered when SEMANTIC_INDEX_DIR is
+set). Run it once per release, from a host configured like production.
+
+Usage:
+    python scripts/sync_assistants.py            # show what would change
+    python scripts/sync_assistants.py --apply    # update the assistants
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+CHATBOTS = {
+    'atual': 'ASSISTANT_ID_VENDAS',
+    'treinamento': 'ASSISTANT_ID_TREINAMENTO',
+    'whatsapp': 'ASSISTANT_ID_WHATSAPP',
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the OpenAI assistants with the code")
+    parser.add_argument('--apply', action='store_true', help="atualiza os assistentes (sem ele, só compara)")
+    args = parser.parse_args()
+
+    if not Config.SEMANTIC_INDEX_DIR:
+        logger.warning("SEMANTIC_INDEX_DIR vazio: o assistente de vendas fica sem a busca semântica")
+
+    from app.chatbot import ChatbotFactory
+    for chatbot_type, setting in CHATBOTS.items():
+        if not getattr(Config, setting):
+            logger.info(f"{setting} não configurado, ignorando {chatbot_type}")
+            continue
+        chatbot = ChatbotFactory.create_chatbot(chatbot_type)
+        if chatbot is None:
+            logger.error(f"Não foi possível carregar o chatbot {chatbot_type}")
+            continue
+        changes = chatbot.sync_assistant(apply=args.apply)
+        if not changes:
+            logger.info(f"{chatbot.name}: em dia")
+        else:
+            logger.info(f"{chatbot.name}: {', '.join(changes)} {'atualizado(s)' if args.apply else 'diferente(s)'}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Inspects the host-local WhatsApp ingest queue (app/services/ingest_queue.py).
+
+Records that kept failing for longer than WHATSAPP_QUEUE_MAX_AGE are marked
+dead and stay in the queue file; this script shows, exports or requeues them.
+Run it on the host that owns the file (WHATSAPP_QUEUE_PATH).
+
+Usage:
+    python scripts/whatsapp_queue.py                      # queue metrics
+    python scripts/whatsapp_queue.py --export-dead FILE   # dead records as JSON lines
+    python scripts/whatsapp_queue.py --requeue-dead       # retry the dead records
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the WhatsApp ingest queue")
+    parser.add_argument('--export-dead', metavar='FILE', help="grava as mensagens mortas em JSON lines")
+    parser.add_argument('--requeue-dead', action='store_true', help="recoloca as mensagens mortas na fila")
+    args = parser.parse_args()
+
+    from app.whatsapp_handler import whatsapp_queue
+
+    if args.export_dead:
+        records = whatsapp_queue.dead_records(limit=-1)
+        with open(args.export_dead, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        logger.info(f"{len(records)} mensagens mortas exportadas para {args.export_dead}")
+    if args.requeue_dead:
+        # O consumidor de cada worker as pega na próxima passada
+        logger.info(f"{whatsapp_queue.requeue_dead()} mensagens mortas recolocadas na fila")
+    print(json.dumps(whatsapp_queue.metrics(), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# tests/test_activity_coalescer.py
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from app.services.activity_coalescer import ActivityCoalescer
+
+class TestActivityCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.coalescer = ActivityCoalescer(self.batches.append, interval=3600)
+
+    def tearDown(self):
+        self.coalescer._stop.set()
+
+    def test_coalesces_per_user(self):
+        for i in range(1000):
+            self.coalescer.record('u1', 'atual', f'2024-01-01T10:{i % 60:02d}:00+00:00')
+        self.coalescer.record('u1', 'novo', '2024-01-01T11:00:00+00:00')
+        self.coalescer.record('u2', 'atual', '2024-01-01T09:00:00+00:00')
+        self.assertEqual(self.coalescer.flush(), 2)
+        self.assertEqual(len(self.batches), 1)
+        rows = {row['id']: row['last_interaction'] for row in self.batches[0]}
+        self.assertEqual(rows, {'u1': '2024-01-01T11:00:00+00:00', 'u2': '2024-01-01T09:00:00+00:00'})
+        self.assertEqual(self.coalescer.flush(), 0)
+
+    def test_failed_flush_is_retried(self):
+        def failing(rows):
+            raise RuntimeError('indisponível')
+        self.coalescer.flush_fn = failing
+        self.coalescer.record('u1', 'atual', '2024-01-01T10:00:00+00:00')
+        self.assertEqual(self.coalescer.flush(), 0)
+        self.assertEqual(self.coalescer.pending(), 1)
+        self.coalescer.flush_fn = self.batches.append
+        self.assertEqual(self.coalescer.flush(), 1)
+
+    def test_failed_flush_at_max_pending_does_not_deadlock(self):
+        def failing(rows):
+            raise RuntimeError('indisponível')
+        self.coalescer.flush_fn = failing
+        self.coalescer.max_pending = 3
+        worker = threading.Thread(target=lambda: [self.coalescer.record(f'u{i}', 'atual') for i in range(6)])
+        worker.start()
+        worker.join(timeout=5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(self.coalescer.pending(), 6)
+
+    def test_overflow_triggers_flush(self):
+        self.coalescer.max_pending = 10
+        for i in range(10):
+            self.coalescer.record(f'u{i}', 'atual')
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(len(self.batches[0]), 10)
+
+class TestWriteLastInteractions(unittest.TestCase):
+    def test_per_row_updates_without_touch_function(self):
+        from postgrest.exceptions import APIError
+        from app import models
+        client = MagicMock()
+        client.rpc.return_value.execute.side_effect = APIError({'code': 'PGRST202', 'message': 'not found'})
+        rows = [{'id': 'u1', 'last_interaction': '2024-01-01T10:00:00+00:00'},
+                {'id': 'u2', 'last_interaction': '2024-01-01T11:00:00+00:00'}]
+        with patch('app.models.supabase', client), patch('app.models._touch_rpc_available', True):
+            models._write_last_interactions(rows)
+            models._write_last_interactions(rows[:1])
+            self.assertFalse(models._touch_rpc_available)
+        # A RPC ausente é tentada uma vez; depois, um update por usuário
+        client.rpc.assert_called_once()
+        update = client.table.return_value.update
+        self.assertEqual(update.call_count, 3)
+        update.assert_any_call({'last_interaction': '2024-01-01T11:00:00+00:00'})
+        update.return_value.eq.assert_any_call('id', 'u2')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# tests/test_admission.py
+import os
+import runpy
+import unittest
+from unittest.mock import patch, MagicMock
+from app.services.admission import AdmissionController
+from config import Config
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.depth = 0
+        self.controller = AdmissionController(
+            capacity=4, reserved_interactive=1, max_webhook_in_flight=2, max_queue_depth=100,
+            depth_fn=lambda: self.depth, drain_rate=10, depth_ttl=0
+        )
+
+    def test_webhook_in_flight_limit(self):
+        self.assertTrue(self.controller.try_admit('webhook')[0])
+        self.assertTrue(self.controller.try_admit('webhook')[0])
+        self.assertEqual(self.controller.try_admit('webhook'), (False, 503, 1))
+        self.controller.release('webhook')
+        self.assertTrue(self.controller.try_admit('webhook')[0])
+
+    def test_reserved_slots_stay_free_for_interactive(self):
+        self.controller.try_admit('other')
+        self.controller.try_admit('webhook')
+        self.controller.try_admit('interactive')
+        # 3 de 4 em uso: o último é reservado para o chat
+        self.assertEqual(self.controller.try_admit('webhook')[1], 503)
+        self.assertTrue(self.controller.try_admit('interactive')[0])
+
+    def test_deep_queue_returns_429_with_estimate(self):
+        self.depth = 350
+        self.assertEqual(self.controller.try_admit('webhook'), (False, 429, 25))
+        self.assertTrue(self.controller.try_admit('interactive')[0])
+        self.assertEqual(self.controller.metrics()['shed'], {'429': 1, '503': 0})
+
+    def test_depth_is_sampled(self):
+        depth_fn = MagicMock(return_value=0)
+        controller = AdmissionController(8, 2, 4, 100, depth_fn=depth_fn, depth_ttl=60)
+        for _ in range(5):
+            controller.try_admit('webhook')
+        depth_fn.assert_called_once()
+
+class TestWebhookShedding(unittest.TestCase):
+    def setUp(self):
+        from app import create_app
+        self.app = create_app()
+        self.app.config['SECRET_KEY'] = 'test'
+        self.client = self.app.test_client()
+        self.controller = AdmissionController(capacity=3, reserved_interactive=1, max_webhook_in_flight=1,
+                                              max_queue_depth=10, depth_fn=lambda: 0, depth_ttl=0)
+        patcher = patch('app.routes.admission', self.controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_saturated_webhook_gets_503_with_retry_after(self):
+        self.controller.try_admit('webhook')
+        with patch('app.whatsapp_handler.whatsapp_queue') as queue:
+            response = self.client.post('/whatsapp-webhook', json={'sender': 'Ana', 'content': 'Oi'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        queue.put_many.assert_not_called()
+
+    def test_deep_queue_gets_429(self):
+        self.controller.depth_fn = lambda: 1000
+        response = self.client.post('/whatsapp-webhook', json={'sender': 'Ana', 'content': 'Oi'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        # A verificação GET do provedor nunca é recusada
+        self.assertEqual(self.client.get('/whatsapp-webhook').status_code, 200)
+
+    def test_in_flight_is_released_after_request(self):
+        with patch('app.whatsapp_handler.whatsapp_queue'):
+            for _ in range(3):
+                self.assertEqual(self.client.post('/whatsapp-webhook', json={'content': 'Oi'}).status_code, 200)
+        self.assertEqual(self.controller.metrics()['in_flight'], {'webhook': 0, 'interactive': 0, 'other': 0})
+
+    def test_send_message_uses_reserved_capacity(self):
+        self.controller.try_admit('other')
+        self.controller.try_admit('other')
+        self.assertEqual(self.client.post('/whatsapp-webhook', json={'content': 'Oi'}).status_code, 503)
+        # Sem sessão o chat redireciona para o login, mas não é recusado pelo controle de admissão
+        self.assertEqual(self.client.post('/send_message', json={'message': 'Oi'}).status_code, 302)
+
+class TestDeployedConfiguration(unittest.TestCase):
+    ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+    def _gunicorn_conf(self, env):
+        with patch.dict(os.environ, env, clear=False):
+            for name in ('GUNICORN_THREADS', 'WORKER_CAPACITY'):
+                if name not in env:
+                    os.environ.pop(name, None)
+            conf = runpy.run_path(os.path.join(self.ROOT, 'gunicorn.conf.py'))
+            return conf, os.environ.get('WORKER_CAPACITY')
+
+    def test_procfile_uses_gunicorn_conf(self):
+        with open(os.path.join(self.ROOT, 'Procfile')) as f:
+            self.assertIn('-c gunicorn.conf.py', f.read())
+
+    def test_threads_match_admission_capacity(self):
+        conf, capacity = self._gunicorn_conf({})
+        self.assertEqual(conf['worker_class'], 'gthread')
+        self.assertEqual(int(capacity), conf['threads'])
+        # Com a capacidade padrão os limites de admissão podem de fato ser atingidos
+        self.assertGreater(conf['threads'], Config.INTERACTIVE_RESERVED_SLOTS)
+        self.assertLess(Config.WEBHOOK_MAX_IN_FLIGHT, conf['threads'])
+        conf, capacity = self._gunicorn_conf({'GUNICORN_THREADS': '16'})
+        self.assertEqual((conf['threads'], capacity), (16, '16'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# tests/test_cache_service.py
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from app.services.cache_service import SQLiteCacheService, hashed_key
+from app.services.version_service import VersionWatermarks
+
+class TestSQLiteCacheService(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.sqlite3')
+        self.cache = SQLiteCacheService(self.path, max_entries=150)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_set_get_delete(self):
+        self.assertTrue(self.cache.set('k', {'a': [1, 2]}))
+        self.assertEqual(self.cache.get('k'), {'a': [1, 2]})
+        self.cache.delete('k')
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_ttl_expiry(self):
+        self.cache.set('k', 'v', ttl=-1)
+        self.assertIsNone(self.cache.get('k'))
+        self.assertEqual(self.cache.cleanup_expired(), 1)
+
+    def test_shared_between_instances(self):
+        other = SQLiteCacheService(self.path)
+        self.cache.set('k', 'v')
+        self.assertEqual(other.get('k'), 'v')
+        self.assertEqual(other.epoch, self.cache.epoch)
+
+    def test_hashed_key_is_compact(self):
+        key = hashed_key('name:message', 'Olá, meu nome é Maria ' * 200)
+        self.assertTrue(key.startswith('name:message:'))
+        self.assertEqual(len(key), len('name:message:') + 32)
+        self.assertEqual(key, hashed_key('name:message', 'Olá, meu nome é Maria ' * 200))
+        self.assertNotEqual(key, hashed_key('name:thread', 'Olá, meu nome é Maria ' * 200))
+
+    def test_incr(self):
+        self.assertEqual(self.cache.incr('counter'), 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.counter('counter'), 6)
+        self.assertEqual(self.cache.counter('missing'), 0)
+
+    def test_counters_survive_eviction_and_clear(self):
+        self.cache.incr('version:thread:t1', 3)
+        for i in range(400):
+            self.cache.set(f'k{i}', i)
+        self.cache.clear()
+        self.assertEqual(self.cache.counter('version:thread:t1'), 3)
+
+    def test_bounded(self):
+        for i in range(400):
+            self.cache.set(f'k{i}', i, ttl=600)
+        count = self.cache._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.assertLessEqual(count, 150 + SQLiteCacheService._EVICTION_INTERVAL)
+        self.assertEqual(self.cache.get('k399'), 399)
+
+class TestVersionWatermarks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.watermarks = VersionWatermarks(SQLiteCacheService(os.path.join(self.tmpdir.name, 'v.sqlite3')))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_etag_changes_on_bump(self):
+        etag = self.watermarks.etag('thread', 't1', 'atual', None)
+        self.assertEqual(etag, self.watermarks.etag('thread', 't1', 'atual', None))
+        self.assertNotEqual(etag, self.watermarks.etag('thread', 't1', 'atual', 'cursor'))
+        self.watermarks.bump_thread('t1')
+        self.assertNotEqual(etag, self.watermarks.etag('thread', 't1', 'atual', None))
+        self.assertEqual(self.watermarks.get('thread', 't1'), 1)
+        self.assertEqual(self.watermarks.get('thread', 't2'), 0)
+
+    def _database(self, rows):
+        client = MagicMock()
+        query = client.table.return_value.select.return_value.eq.return_value.eq.return_value.limit.return_value
+        query.execute.return_value.data = rows
+        return client, query
+
+    def test_thread_versions_come_from_the_database(self):
+        client, query = self._database([{'version': 4}])
+        self.watermarks.attach(lambda: client)
+        etag = self.watermarks.etag('thread', 't1', 'atual')
+        # Um bump local (de outro host, para o banco) não muda a versão: só o banco conta
+        self.watermarks.bump_thread('t1')
+        self.assertEqual(etag, self.watermarks.etag('thread', 't1', 'atual'))
+        query.execute.return_value.data = [{'version': 5}]
+        self.assertNotEqual(etag, self.watermarks.etag('thread', 't1', 'atual'))
+        client.table.assert_called_with('content_versions')
+
+    def test_unreadable_database_version_never_matches(self):
+        from postgrest.exceptions import APIError
+        client, query = self._database([])
+        query.execute.side_effect = APIError({'code': 'PGRST205', 'message': 'missing'})
+        self.watermarks.attach(lambda: client)
+        self.assertNotEqual(self.watermarks.etag('user', 'u1'), self.watermarks.etag('user', 'u1'))
+        self.assertEqual(query.execute.call_count, 1)
+        # Escopos locais continuam nos contadores do cache
+        self.assertEqual(self.watermarks.etag('table', 'x'), self.watermarks.etag('table', 'x'))
+
+class TestDashboardETag(unittest.TestCase):
+    def setUp(self):
+        from app import create_app
+        self.app = create_app()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 'u1'
+
+    def _get(self, feedback):
+        from app.models import Message, User
+        with patch.object(User, 'get_login_count', return_value=3), \
+                patch.object(Message, 'calculate_conversation_scores', return_value={'clareza': 70}), \
+                patch.object(Message, 'get_ia_feedback', return_value=feedback), \
+                patch.object(Message, 'analyze_positioning', return_value='Bom posicionamento'), \
+                patch('app.routes.watermarks.etag', return_value='abc'):
+            return self.client.get('/get_dashboard_data')
+
+    def test_fallback_section_is_not_etagged(self):
+        from app.models import Message
+        response = self._get(Message.FEEDBACK_FAILED)
+        self.assertIsNone(response.headers.get('ETag'))
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+        response = self._get('Continue assim')
+        self.assertEqual(response.headers['ETag'], '"abc"')
+
+if __name__ == '__main__':
+    unittest.main()
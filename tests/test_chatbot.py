@@ -1,10 +1,27 @@
 # tests/test_chatbot.py
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from app.chatbot.vendas import VendasChatbot
 from app.chatbot.whatsapp import WhatsAppChatbot
+from app.services.cache_service import SQLiteCacheService
+from app.services.name_extractor import NameExtractor
+from app.services.search_service import SupabaseMessageSearch
 
-class TestVendasChatbot(unittest.TestCase):
+class TempCacheTestCase(unittest.TestCase):
+    """Cache compartilhado num arquivo temporário, para não gravar em Config.SHARED_CACHE_PATH."""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCacheService(os.path.join(self.tmpdir.name, 'cache.sqlite3'))
+        self.cache_patch = patch('app.chatbot.base.get_shared_cache', return_value=self.cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.tmpdir.cleanup()
+
+class TestVendasChatbot(TempCacheTestCase):
     @patch('app.chatbot.vendas.client')
     def test_query_whatsapp_data(self, mock_client):
         # Configurar mock
@@ -14,9 +31,11 @@ class TestVendasChatbot(unittest.TestCase):
             {"sender_name": "Test User", "content": "Hello", "timestamp": "2023-01-01T12:00:00"}
         ]
         mock_supabase.table.return_value.select.return_value = mock_query
-        
+        mock_supabase.rpc.return_value.execute.return_value.data = mock_query.execute.return_value.data
+
         # Injetar mock
-        with patch('app.chatbot.vendas.supabase', mock_supabase):
+        with patch('app.chatbot.vendas.supabase', mock_supabase), \
+                patch('app.chatbot.vendas.message_search', SupabaseMessageSearch(mock_supabase)):
             chatbot = VendasChatbot()
             result = chatbot._query_whatsapp_data({"sender_name": "Test"})
             
@@ -24,12 +43,12 @@ class TestVendasChatbot(unittest.TestCase):
             self.assertIn("success", result)
             self.assertIn("data", result)
 
-class TestWhatsAppChatbot(unittest.TestCase):
+class TestWhatsAppChatbot(TempCacheTestCase):
     @patch('app.chatbot.whatsapp.client')
     def test_extract_name(self, mock_client):
         # Configurar mock
         mock_response = MagicMock()
-        mock_response.choices[0].message.content = "John"
+        mock_response.choices[0].message.content = '{"names": [{"i": 0, "name": "John"}]}'
         mock_client.chat.completions.create.return_value = mock_response
         
         # Testar extração de nome
@@ -39,9 +58,26 @@ class TestWhatsAppChatbot(unittest.TestCase):
         self.assertEqual(name, "John")
         
         # Testar cache
-        chatbot._name_cache = {"Hello": "Jane"}
+        chatbot._cache_name('message', "Hello", "Jane")
         name = chatbot.extract_name("Hello")
         self.assertEqual(name, "Jane")
 
+class TestWhatsAppNameCache(TempCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        # Sem __init__: não cria o assistente na OpenAI
+        self.chatbot = WhatsAppChatbot.__new__(WhatsAppChatbot)
+        self.resolver = MagicMock(side_effect=RuntimeError("timeout"))
+        self.chatbot.name_extractor = NameExtractor(llm_resolver=self.resolver)
+
+    def test_llm_failure_is_not_cached_as_no_name(self):
+        self.assertIsNone(self.chatbot.extract_name("Bruno"))
+        self.assertEqual(self.chatbot.extract_names(["Bruno", "Me chamo Ana"]), [None, "Ana"])
+        self.assertEqual(self.chatbot._get_cached_name('message', "Bruno"), (False, None))
+        self.resolver.side_effect = None
+        self.resolver.return_value = ["Bruno"]
+        self.assertEqual(self.chatbot.extract_name("Bruno"), "Bruno")
+        self.assertEqual(self.resolver.call_count, 3)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,101 @@
+# tests/test_conversation_grader.py
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from app.services.cache_service import SQLiteCacheService
+from app.services.conversation_grader import (
+    ConversationGrader, conversation_hash, process_batch_file_locally
+)
+
+CONVERSATIONS = {
+    't1': [{'role': 'assistant', 'content': 'Achei caro'}, {'role': 'user', 'content': 'Posso oferecer desconto'}],
+    't2': [{'role': 'assistant', 'content': 'Paguei, deu certo'}, {'role': 'user', 'content': 'Obrigado!'}],
+    't3': [{'role': 'assistant', 'content': 'Não funcionou'}],
+}
+
+def _grades_response(ids):
+    content = json.dumps({'grades': [
+        {'id': i, 'clareza': 70, 'persuasao': 60, 'conhecimento': 50, 'empatia': 140, 'resolucao': 80,
+         'comentario': 'ok'} for i in ids
+    ]})
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    return response
+
+class TestConversationGrader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCacheService(os.path.join(self.tmpdir.name, 'cache.sqlite3'))
+        self.client = MagicMock()
+        self.client.chat.completions.create.side_effect = \
+            lambda **body: _grades_response([i for i in CONVERSATIONS if f"id={i}\n" in body['messages'][-1]['content']])
+        self.grader = ConversationGrader(lambda: self.client, cache=self.cache)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_many_conversations_in_one_request(self):
+        grades = self.grader.grade(CONVERSATIONS)
+        self.assertEqual(self.client.chat.completions.create.call_count, 1)
+        self.assertEqual(set(grades), set(CONVERSATIONS))
+        self.assertEqual(grades['t1']['empatia'], 100)  # clamped
+        body = self.client.chat.completions.create.call_args.kwargs
+        self.assertEqual(body['response_format']['type'], 'json_schema')
+
+    def test_unchanged_conversations_come_from_cache(self):
+        self.grader.grade(CONVERSATIONS)
+        changed = dict(CONVERSATIONS, t3=CONVERSATIONS['t3'] + [{'role': 'user', 'content': 'Vou verificar'}])
+        grades = self.grader.grade(changed)
+        self.assertEqual(set(grades), set(CONVERSATIONS))
+        self.assertEqual(self.grader.stats['cache_hits'], 2)
+        self.assertEqual(self.client.chat.completions.create.call_count, 2)
+        self.assertIn('id=t3\n', self.client.chat.completions.create.call_args.kwargs['messages'][-1]['content'])
+        self.assertNotIn('id=t1\n', self.client.chat.completions.create.call_args.kwargs['messages'][-1]['content'])
+
+    def test_batch_size_splits_requests(self):
+        grader = ConversationGrader(lambda: self.client, batch_size=2)
+        grader.grade(CONVERSATIONS)
+        self.assertEqual(grader.stats['requests'], 2)
+
+    def test_batch_file_round_trip(self):
+        requests_path = os.path.join(self.tmpdir.name, 'requests.jsonl')
+        output_path = os.path.join(self.tmpdir.name, 'output.jsonl')
+        self.assertEqual(ConversationGrader(batch_size=2, cache=self.cache).write_batch_file(CONVERSATIONS, requests_path), 2)
+        with open(requests_path) as f:
+            first = json.loads(f.readline())
+        self.assertEqual(first['url'], '/v1/chat/completions')
+
+        self.assertEqual(process_batch_file_locally(requests_path, output_path), 2)
+        grades = self.grader.read_batch_results(output_path, requests_path)
+        self.assertEqual(set(grades), set(CONVERSATIONS))
+        self.assertGreater(grades['t2']['resolucao'], grades['t3']['resolucao'])
+        # Everything is cached now: nothing left to send
+        self.assertIsNotNone(self.cache.get(f"conversation_grade:{conversation_hash(CONVERSATIONS['t1'])}"))
+        self.assertEqual(self.grader.write_batch_file(CONVERSATIONS, requests_path), 0)
+        self.client.chat.completions.create.assert_not_called()
+
+    def test_invalid_scores_skip_only_their_item_or_line(self):
+        requests_path = os.path.join(self.tmpdir.name, 'requests.jsonl')
+        output_path = os.path.join(self.tmpdir.name, 'output.jsonl')
+        ConversationGrader(batch_size=1).write_batch_file(CONVERSATIONS, requests_path)
+        with open(ConversationGrader.mapping_path(requests_path)) as f:
+            custom_ids = {next(iter(hashes)): custom_id for custom_id, hashes in json.load(f).items()}
+
+        def line(conversation_id, **scores):
+            grade = dict({'id': conversation_id, 'clareza': 70, 'persuasao': 60, 'conhecimento': 50,
+                          'empatia': 40, 'resolucao': 80, 'comentario': 'ok'}, **scores)
+            content = json.dumps({'grades': [grade]})
+            return json.dumps({'custom_id': custom_ids[conversation_id], 'response': {
+                'status_code': 200, 'body': {'choices': [{'message': {'content': content}}]}}})
+
+        with open(output_path, 'w') as f:
+            f.write('\n'.join([line('t1', empatia=None), '{"custom_id": ', line('t2', clareza='alta'), line('t3')]))
+        grades = self.grader.read_batch_results(output_path, requests_path)
+        # Null score, truncated JSON and non-numeric score are skipped; the valid line is read
+        self.assertEqual(set(grades), {'t3'})
+
+if __name__ == '__main__':
+    unittest.main()
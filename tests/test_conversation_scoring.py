@@ -0,0 +1,153 @@
+# tests/test_conversation_scoring.py
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from app.models import Message
+from app.services.cache_service import SQLiteCacheService
+from app.services.conversation_scoring import ConversationScorer
+
+class TestConversationScorer(unittest.TestCase):
+    def setUp(self):
+        self.scorer = ConversationScorer()
+
+    def test_empty(self):
+        self.assertEqual(self.scorer.score_messages([])['resolucao'], 0)
+
+    def test_resolved_conversation_scores_higher(self):
+        resolved = self.scorer.score_messages([
+            {'role': 'assistant', 'content': 'Achei caro, vou pensar'},
+            {'role': 'user', 'content': 'Entendo! Posso oferecer desconto no Pix e parcelar'},
+            {'role': 'assistant', 'content': 'Fechado, paguei. Obrigado, ótimo atendimento'},
+        ])
+        pending = self.scorer.score_messages([
+            {'role': 'assistant', 'content': 'Muito caro. O pedido ainda não chegou?'},
+            {'role': 'user', 'content': 'Vou verificar'},
+            {'role': 'assistant', 'content': 'Não funcionou, péssimo. Quero cancelar'},
+        ])
+        self.assertGreater(resolved['resolucao'], 80)
+        self.assertLess(pending['resolucao'], 30)
+
+    def test_turn_features(self):
+        stats = self.scorer.build_stats([
+            {'role': 'assistant', 'content': 'Qual o prazo?'},
+            {'role': 'user', 'content': 'Dois dias'},
+            {'role': 'assistant', 'content': 'Tem garantia?'},
+        ])
+        self.assertEqual((stats['questions'], stats['answered_questions']), (2, 1))
+        self.assertEqual(self.scorer.features(stats)['answer_rate'], 0.0)
+
+    def test_incremental_matches_batch(self):
+        messages = [
+            {'role': 'user', 'content': 'Entendo, o benefício é claro'},
+            {'role': 'assistant', 'content': 'Está caro'},
+            {'role': 'user', 'content': 'Posso parcelar sem juros'},
+        ]
+        stats = self.scorer.build_stats(messages[:2])
+        self.scorer.add(stats, messages[2]['role'], messages[2]['content'])
+        self.assertEqual(stats, self.scorer.build_stats(messages))
+
+class TestCalculateConversationScores(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = cache = SQLiteCacheService(os.path.join(self.tmpdir.name, 'cache.sqlite3'))
+        self.mock_supabase = MagicMock()
+        self.query = self.mock_supabase.table.return_value.select.return_value.eq.return_value.order.return_value
+        self.query.execute.return_value.data = [
+            {'role': 'user', 'content': 'Entendo, o benefício é claro'},
+            {'role': 'user', 'content': 'Qual o prazo?'},
+            {'role': 'assistant', 'content': 'Entendo'},
+            {'role': 'user', 'content': 'Posso ajudar com a melhor opção'},
+        ]
+        patches = [
+            patch('app.models.supabase', self.mock_supabase),
+            patch('app.models.get_shared_cache', return_value=cache),
+            patch('app.models.watermarks'),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+        # Sem a migração 009: só o controle local
+        from app.models import watermarks
+        self.db_version = watermarks.database_version
+        self.db_version.return_value = None
+
+    def test_scores_are_cached_and_updated_on_write(self):
+        scores = Message.calculate_conversation_scores('u1')
+        self.mock_supabase.table.return_value.select.assert_called_once_with('role,content')
+        self.assertEqual(scores['persuasao'], 50)
+        self.assertEqual(scores['empatia'], 50)
+
+        self.mock_supabase.table.return_value.insert.return_value.execute.return_value.data = [{'id': 9}]
+        Message.create_many([{'thread_id': 't1', 'role': 'user', 'content': 'Ótimo, ajudar é comigo', 'user_id': 'u1'}])
+        scores = Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 1)
+        self.assertEqual(scores['empatia'], 60)
+
+    def test_write_during_build_is_not_lost(self):
+        rows = self.query.execute.return_value.data
+        def insert_while_reading():
+            # Outro worker grava uma mensagem enquanto os contadores são montados do banco
+            self.mock_supabase.table.return_value.insert.return_value.execute.return_value.data = [{'id': 9}]
+            Message.create_many([{'thread_id': 't1', 'role': 'user', 'content': 'Ótimo, ajudar é comigo', 'user_id': 'u1'}])
+            return MagicMock(data=rows)
+        self.query.execute.side_effect = insert_while_reading
+        Message.calculate_conversation_scores('u1')
+        self.query.execute.side_effect = None
+        self.query.execute.return_value.data = rows + [{'role': 'user', 'content': 'Ótimo, ajudar é comigo'}]
+        # O resultado montado durante a gravação não foi guardado: a próxima leitura vê a mensagem nova
+        self.assertEqual(Message.calculate_conversation_scores('u1')['empatia'], 60)
+        self.assertEqual(self.query.execute.call_count, 2)
+        self.assertEqual(Message.calculate_conversation_scores('u1')['empatia'], 60)
+        self.assertEqual(self.query.execute.call_count, 2)
+
+    def test_deletes_invalidate(self):
+        Message.calculate_conversation_scores('u1')
+        delete = self.mock_supabase.table.return_value.delete.return_value.eq.return_value
+        delete.execute.return_value = MagicMock(data=[{'id': 1, 'user_id': 'u1'}], error=None)
+        self.assertTrue(Message.clear_thread_history('t1'))
+        Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 2)
+
+        self.mock_supabase.rpc.return_value.execute.return_value.data = [{'user_id': 'u1', 'deleted': 2}]
+        Message.trim_thread_history('t1', 10)
+        Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 3)
+
+    def test_writes_from_other_hosts_are_seen(self):
+        self.db_version.return_value = 5
+        Message.calculate_conversation_scores('u1')
+        Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 1)
+        # Mensagem gravada por outro host: o cache local não sabe, mas a versão no banco avançou
+        self.db_version.return_value = 6
+        Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 2)
+
+        # Insert deste host: a versão avança um passo e a entrada segue em dia
+        self.db_version.return_value = 7
+        self.mock_supabase.table.return_value.insert.return_value.execute.return_value.data = [{'id': 9}]
+        Message.create_many([{'thread_id': 't1', 'role': 'user', 'content': 'Ótimo, ajudar é comigo', 'user_id': 'u1'}])
+        self.assertEqual(Message.calculate_conversation_scores('u1')['empatia'], 60)
+        self.assertEqual(self.query.execute.call_count, 2)
+
+        # Outro host gravou junto com este insert: a entrada é descartada
+        self.db_version.return_value = 9
+        Message.create_many([{'thread_id': 't1', 'role': 'user', 'content': 'Qual o prazo?', 'user_id': 'u1'}])
+        Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 3)
+
+    def test_unfinished_write_stops_blocking_after_timeout(self):
+        Message._begin_stats_write(['u1'])
+        Message.calculate_conversation_scores('u1')
+        Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 2)
+        # Worker morto no meio da gravação: a marca expira e o cache volta a ser usado
+        self.cache.delete('conversation_stats:writing:u1')
+        Message.calculate_conversation_scores('u1')
+        Message.calculate_conversation_scores('u1')
+        self.assertEqual(self.query.execute.call_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
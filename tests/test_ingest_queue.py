@@ -0,0 +1,308 @@
+# tests/test_ingest_queue.py
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+from app.services.ingest_queue import IngestQueue
+
+class TestIngestQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'queue.sqlite3')
+        self.flush_fn = MagicMock()
+        # Intervalo longo: o consumidor só roda quando o teste chama drain
+        self.queue = IngestQueue(self.path, self.flush_fn, batch_size=3, interval=3600,
+                                 retry_backoff=10, max_backoff=40, max_age=3600)
+
+    def tearDown(self):
+        self.queue._stop.set()
+        self.queue._wakeup.set()
+        self.tmpdir.cleanup()
+
+    def test_batches_and_deletes_after_flush(self):
+        self.queue.put_many([{'n': 1}, {'n': 2}])
+        self.queue.put({'n': 3})
+        self.queue.put({'n': 4})
+        self.assertEqual(self.queue.depth(), 4)
+        self.assertEqual(self.queue.drain(), 4)
+        self.assertEqual([c.args[0] for c in self.flush_fn.call_args_list],
+                         [[{'n': 1}, {'n': 2}, {'n': 3}], [{'n': 4}]])
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_failed_batch_backs_off_exponentially(self):
+        self.queue.put({'n': 1})
+        self.flush_fn.side_effect = Exception("db down")
+        now = time.time()
+        with patch('app.services.ingest_queue.time.time', return_value=now):
+            self.assertEqual(self.queue.drain_once(), 0)
+            # Em backoff: nada a reivindicar, mas a linha continua na fila
+            self.assertEqual(self.queue.drain_once(), 0)
+        self.assertEqual(self.flush_fn.call_count, 1)
+        delays = []
+        for attempt in range(4):
+            claimed_until = self.queue._db.execute("SELECT claimed_until FROM queue").fetchone()[0]
+            delays.append(round(claimed_until - now))
+            now = claimed_until
+            with patch('app.services.ingest_queue.time.time', return_value=now):
+                self.queue.drain_once()
+        self.assertEqual(delays, [10, 20, 40, 40])
+        metrics = self.queue.metrics()
+        self.assertEqual((metrics['depth'], metrics['retrying'], metrics['dead']), (1, 1, 0))
+
+    def test_outage_longer_than_max_age_marks_dead_and_requeue(self):
+        self.queue.put({'n': 1})
+        self.flush_fn.side_effect = Exception("db down")
+        with patch('app.services.ingest_queue.time.time', return_value=time.time() + 7200):
+            self.assertEqual(self.queue.drain_once(), 0)
+        metrics = self.queue.metrics()
+        self.assertEqual((metrics['depth'], metrics['dead']), (0, 1))
+        self.assertEqual(self.queue.dead_records(), [{'n': 1}])
+        # requeue_dead acorda o consumidor; parado, quem drena é o teste
+        self.queue._stop.set()
+        self.assertEqual(self.queue.requeue_dead(), 1)
+        self.flush_fn.side_effect = None
+        self.assertEqual(self.queue.drain(), 1)
+        self.assertEqual(self.queue.metrics()['dead'], 0)
+
+    def test_claims_are_exclusive_across_consumers(self):
+        other_flush = MagicMock()
+        other = IngestQueue(self.path, other_flush, batch_size=3, interval=3600)
+        self.queue.put_many([{'n': 1}, {'n': 2}])
+        claimed = self.queue._claim()
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(other.drain_once(), 0)
+        # Lease expirada: outro worker assume as linhas
+        with patch('app.services.ingest_queue.time.time', return_value=time.time() + 120):
+            self.assertEqual(other.drain_once(), 2)
+        other_flush.assert_called_once()
+
+    def test_survives_restart(self):
+        self.queue.put({'n': 1})
+        reopened = IngestQueue(self.path, self.flush_fn)
+        self.assertEqual(reopened.drain(), 1)
+        self.flush_fn.assert_called_once_with([{'n': 1}])
+
+    def test_metrics_age(self):
+        self.queue.put({'n': 1})
+        metrics = self.queue.metrics()
+        self.assertEqual(metrics['depth'], 1)
+        self.assertGreaterEqual(metrics['oldest_age_seconds'], 0)
+        self.assertEqual(metrics['enqueued'], 1)
+
+    def test_duplicate_keys_are_dropped(self):
+        self.assertEqual(self.queue.put_many([{'n': 1}, {'n': 1}, {'n': 2}], ['a', 'a', None]), [True, False, True])
+        # Reenvio: filtro de Bloom positivo, confirmado pela tabela exata
+        with patch.object(self.queue._db, 'immediate', wraps=self.queue._db.immediate) as immediate:
+            self.assertFalse(self.queue.put({'n': 1}, 'a'))
+        immediate.assert_called_once()
+        self.assertEqual(self.queue.depth(), 2)
+        self.assertEqual(self.queue.metrics()['duplicates'], 2)
+
+    def test_duplicates_seen_by_another_worker(self):
+        other = IngestQueue(self.path, MagicMock(), interval=3600)
+        self.assertTrue(other.put({'n': 1}, 'a'))
+        # Este processo nunca viu a chave: a verificação exata no insert a rejeita
+        self.assertFalse(self.queue.put({'n': 1}, 'a'))
+        other._stop.set()
+        other._wakeup.set()
+
+    def test_keys_expire_after_ttl(self):
+        self.queue.put({'n': 1}, 'a')
+        with patch('app.services.ingest_queue.time.time', return_value=time.time() + 8 * 86400):
+            self.assertEqual(self.queue.prune_seen(), 1)
+            self.assertTrue(self.queue.put({'n': 1}, 'a'))
+
+    def test_keys_of_dead_rows_are_forgotten(self):
+        self.assertTrue(self.queue.put({'n': 1}, 'a'))
+        self.assertFalse(self.queue.put({'n': 1}, 'a'))
+        self.flush_fn.side_effect = Exception("db down")
+        with patch('app.services.ingest_queue.time.time', return_value=time.time() + 7200):
+            self.queue.drain_once()
+        self.assertEqual(self.queue.metrics()['dead'], 1)
+        # A mensagem nunca foi gravada: o reenvio do remetente volta para a fila
+        self.assertTrue(self.queue.put({'n': 1}, 'a'))
+        self.assertEqual(self.queue.depth(), 1)
+
+    def test_requeued_dead_rows_record_their_keys_again(self):
+        self.queue.put({'n': 1}, 'a')
+        self.flush_fn.side_effect = Exception("db down")
+        with patch('app.services.ingest_queue.time.time', return_value=time.time() + 7200):
+            self.queue.drain_once()
+        self.queue._stop.set()
+        self.queue.requeue_dead()
+        self.assertFalse(self.queue.put({'n': 1}, 'a'))
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        from app.services.bloom_filter import BloomFilter
+        bloom = BloomFilter(capacity=10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add(f"k{i}")
+        self.assertTrue(all(f"k{i}" in bloom for i in range(10000)))
+        false_positives = sum(f"x{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertLess(bloom.size_bytes, 13000)
+
+    def test_resets_when_full(self):
+        from app.services.bloom_filter import BloomFilter
+        bloom = BloomFilter(capacity=10)
+        for i in range(11):
+            bloom.add(f"k{i}")
+        self.assertEqual((bloom.count, bloom.resets), (1, 1))
+        self.assertIn("k10", bloom)
+
+class TestWhatsAppWebhook(unittest.TestCase):
+    def setUp(self):
+        from app import create_app
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_post_only_enqueues(self):
+        with patch('app.whatsapp_handler.whatsapp_queue') as queue, \
+             patch('app.whatsapp_handler.supabase') as supabase:
+            response = self.client.post('/whatsapp-webhook', json={'sender': 'Ana', 'content': 'Oi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'queued')
+        record = queue.put_many.call_args.args[0][0]
+        self.assertEqual((record['sender_name'], record['content']), ('Ana', 'Oi'))
+        supabase.table.assert_not_called()
+
+    def test_invalid_payload_is_not_enqueued(self):
+        with patch('app.whatsapp_handler.whatsapp_queue') as queue:
+            response = self.client.post('/whatsapp-webhook', json={'sender': 'Ana'})
+        self.assertEqual(response.get_json()['status'], 'error')
+        queue.put_many.assert_not_called()
+
+    def test_queue_failure_returns_503(self):
+        with patch('app.whatsapp_handler.whatsapp_queue') as queue:
+            queue.put_many.side_effect = Exception("disk full")
+            response = self.client.post('/whatsapp-webhook', json={'sender': 'Ana', 'content': 'Oi'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_array_reports_per_item_status(self):
+        payload = [{'sender': 'Ana', 'content': 'Oi'}, {'sender': 'Bia'}, 'x', {'sender': 'Caio', 'content': 'Olá'}]
+        with patch('app.whatsapp_handler.whatsapp_queue') as queue:
+            response = self.client.post('/whatsapp-webhook', json=payload)
+        body = response.get_json()
+        self.assertEqual((body['status'], body['accepted'], body['rejected']), ('partial', 2, 2))
+        self.assertEqual([item['status'] for item in body['items']], ['queued', 'error', 'error', 'queued'])
+        # Uma única gravação na fila para o lote inteiro
+        queue.put_many.assert_called_once()
+        self.assertEqual([r['sender_name'] for r in queue.put_many.call_args.args[0]], ['Ana', 'Caio'])
+
+    def test_cloud_api_envelope(self):
+        payload = {'entry': [{'changes': [{'value': {
+            'contacts': [{'wa_id': '5511999', 'profile': {'name': 'Ana'}}],
+            'messages': [
+                {'from': '5511999', 'id': 'wamid.1', 'timestamp': '1700000000', 'type': 'text', 'text': {'body': 'Oi'}},
+                {'from': '5511999', 'id': 'wamid.2', 'timestamp': '1700000001', 'type': 'image', 'image': {'caption': 'Foto'}},
+                {'from': '5511888', 'id': 'wamid.3', 'timestamp': '1700000002', 'type': 'sticker', 'sticker': {}},
+            ]}}]}]}
+        with patch('app.whatsapp_handler.whatsapp_queue') as queue:
+            body = self.client.post('/whatsapp-webhook', json=payload).get_json()
+        self.assertEqual((body['accepted'], body['rejected']), (2, 1))
+        records = queue.put_many.call_args.args[0]
+        self.assertEqual([(r['sender_name'], r['content']) for r in records], [('Ana', 'Oi'), ('Ana', 'Foto')])
+        self.assertTrue(records[0]['timestamp'].startswith('2023-11-1'))
+
+    def test_oversized_batch_is_rejected(self):
+        with patch('app.whatsapp_handler.Config.WHATSAPP_MAX_BATCH_ITEMS', 2), \
+             patch('app.whatsapp_handler.whatsapp_queue') as queue:
+            response = self.client.post('/whatsapp-webhook', json={'messages': [{'content': 'a'}] * 3})
+        self.assertEqual(response.status_code, 413)
+        queue.put_many.assert_not_called()
+
+    def test_retries_are_acknowledged_but_not_requeued(self):
+        queue = IngestQueue(os.path.join(self.tmpdir.name, 'queue.sqlite3'), MagicMock(), interval=3600)
+        payload = {'messages': [
+            {'id': 'wamid.1', 'sender': 'Ana', 'content': 'Oi'},
+            {'sender': 'Bia', 'content': 'Olá', 'timestamp': '1700000000'},
+        ]}
+        with patch('app.whatsapp_handler.whatsapp_queue', queue):
+            first = self.client.post('/whatsapp-webhook', json=payload).get_json()
+            retry = self.client.post('/whatsapp-webhook', json=payload).get_json()
+            single = self.client.post('/whatsapp-webhook', json=payload['messages'][1]).get_json()
+        self.assertEqual((first['accepted'], first['duplicates']), (2, 0))
+        self.assertEqual((retry['accepted'], retry['duplicates']), (0, 2))
+        self.assertEqual([item['status'] for item in retry['items']], ['duplicate', 'duplicate'])
+        self.assertEqual(single['status'], 'duplicate')
+        self.assertEqual(queue.depth(), 2)
+        queue._stop.set()
+        queue._wakeup.set()
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        from app import create_app
+        self.app = create_app()
+        self.client = self.app.test_client()
+
+    @patch('app.routes.get_semantic_index', return_value=None)
+    @patch('app.routes.whatsapp_queue')
+    def test_requires_login_or_token(self, queue, _index):
+        queue.metrics.return_value = {'depth': 0}
+        with patch('app.routes.Config.METRICS_TOKEN', 'segredo'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            wrong = self.client.get('/metrics', headers={'Authorization': 'Bearer outro'})
+            self.assertEqual(wrong.status_code, 401)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer segredo'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['whatsapp_queue'], {'depth': 0})
+        with patch('app.routes.Config.METRICS_TOKEN', None):
+            # Sem token configurado, um cabeçalho vazio não autoriza
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer None'}).status_code, 401)
+            with self.client.session_transaction() as sess:
+                sess['user_id'] = 'u1'
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+class TestStoreWhatsAppRecords(unittest.TestCase):
+    @patch('app.whatsapp_handler.index_whatsapp_messages')
+    @patch('app.whatsapp_handler.watermarks')
+    @patch('app.whatsapp_handler.supabase')
+    def test_falls_back_to_insert_without_message_key_migration(self, supabase, watermarks, index):
+        from postgrest.exceptions import APIError
+        from app import whatsapp_handler
+        table = supabase.table.return_value
+        table.upsert.return_value.execute.side_effect = APIError({
+            'code': '42P10', 'message': 'there is no unique or exclusion constraint matching the ON CONFLICT specification'
+        })
+        table.insert.return_value.execute.return_value.data = [{'id': 1}]
+        records = [{'sender_name': 'Ana', 'content': 'Oi', 'message_key': 'wamid.1'}]
+        with patch.object(whatsapp_handler, '_message_key_available', True):
+            whatsapp_handler.store_whatsapp_records(records)
+            whatsapp_handler.store_whatsapp_records(records)
+        # O upsert só é tentado uma vez; depois, insert simples sem a coluna
+        table.upsert.assert_called_once()
+        self.assertEqual(table.insert.call_args[0][0], [{'sender_name': 'Ana', 'content': 'Oi'}])
+        self.assertEqual(table.insert.call_count, 2)
+        index.assert_called_with([{'id': 1}])
+
+    @patch('app.whatsapp_handler.supabase')
+    def test_other_errors_are_raised(self, supabase):
+        from postgrest.exceptions import APIError
+        from app import whatsapp_handler
+        supabase.table.return_value.upsert.return_value.execute.side_effect = APIError({'code': '57014'})
+        with patch.object(whatsapp_handler, '_message_key_available', True):
+            with self.assertRaises(APIError):
+                whatsapp_handler.store_whatsapp_records([{'content': 'Oi', 'message_key': 'k'}])
+        supabase.table.return_value.insert.assert_not_called()
+
+class TestBatchNormalization(unittest.TestCase):
+    def test_format_timestamps_matches_single(self):
+        from app.chatbot.utils import format_timestamp, format_timestamps
+        values = ['1700000000', 1700000000, '2024-05-01T10:00:00', '2024-05-01T10:00:00']
+        self.assertEqual(format_timestamps(values), [format_timestamp(v) for v in values])
+        missing = format_timestamps([None, '', ['x']])
+        self.assertEqual(missing[0], missing[1])
+
+    def test_sanitize_contents_matches_single(self):
+        from app.chatbot.utils import sanitize_content, sanitize_contents
+        values = ['ok', 'a\0b', 'x' * 10001, '', None]
+        self.assertEqual(sanitize_contents(values), [sanitize_content(v) for v in values])
+
+if __name__ == '__main__':
+    unittest.main()
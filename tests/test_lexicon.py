@@ -0,0 +1,38 @@
+# tests/test_lexicon.py
+import unittest
+from app.services.lexicon import Lexicon, fold, tokenize
+from app.chatbot.utils import extract_entities
+
+class TestLexicon(unittest.TestCase):
+    def setUp(self):
+        self.lexicon = Lexicon({
+            'persuasao': ['benefici*', 'vantagem'],
+            'problema': ['não consegui', 'consegui resolver', 'erro'],
+        })
+
+    def test_fold(self):
+        self.assertEqual(fold('Benefício À Vista'), 'beneficio a vista')
+        self.assertEqual(tokenize('Não, CONSEGUI!'), ['nao', 'consegui'])
+
+    def test_counts_all_categories_in_one_pass(self):
+        counts = self.lexicon.count('BENEFICIOS e vantagem... mas não consegui resolver o erro')
+        self.assertEqual(counts, {'persuasao': 2, 'problema': 3})
+        self.assertEqual(self.lexicon.count(''), {'persuasao': 0, 'problema': 0})
+
+    def test_whole_words_only(self):
+        self.assertEqual(self.lexicon.count('vantagens erros')['problema'], 0)
+        self.assertEqual(self.lexicon.count('vantagens erros')['persuasao'], 0)
+
+    def test_overlapping_multiword_terms(self):
+        self.assertEqual(
+            self.lexicon.find('não consegui resolver'),
+            [('problema', 'não consegui'), ('problema', 'consegui resolver')]
+        )
+
+    def test_extract_entities_uses_lexicon(self):
+        entities = extract_entities('Entrega na terça ou no SÁBADO? #Loja', Lexicon({'datas': ['terca', 'sabado']}))
+        self.assertEqual(entities['datas'], ['terca', 'sabado'])
+        self.assertEqual(entities['organizações'], ['Loja'])
+
+if __name__ == '__main__':
+    unittest.main()
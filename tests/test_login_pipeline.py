@@ -0,0 +1,95 @@
+# tests/test_login_pipeline.py
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from app.models import Auth
+from app.services.cache_service import SQLiteCacheService
+from app.services.login_service import SQLiteLoginService, SupabaseLoginService
+from app.services.version_service import watermarks
+
+class TestSQLiteLoginService(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.service = SQLiteLoginService(os.path.join(self.tmpdir.name, 'login.sqlite3'))
+        self.service.authorize('vendedor@empresa.com', 'segredo123')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_creates_then_increments(self):
+        first = self.service.login('vendedor@empresa.com', 'segredo123')
+        second = self.service.login('vendedor@empresa.com', 'segredo123')
+        self.assertEqual(first['login_count'], 1)
+        self.assertEqual(first['name'], 'Usuário Anônimo')
+        self.assertEqual(second['login_count'], 2)
+        self.assertEqual(first['id'], second['id'])
+
+    def test_invalid_credentials(self):
+        self.assertIsNone(self.service.login('vendedor@empresa.com', 'errada123'))
+        self.assertIsNone(self.service.login('outro@empresa.com', 'segredo123'))
+
+    def test_concurrent_logins_do_not_lose_updates(self):
+        self.service.login('vendedor@empresa.com', 'segredo123')
+        threads = [
+            threading.Thread(target=self.service.login, args=('vendedor@empresa.com', 'segredo123'))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        user = self.service.login('vendedor@empresa.com', 'segredo123')
+        self.assertEqual(user['login_count'], 22)
+
+class TestAuthLogin(unittest.TestCase):
+    def setUp(self):
+        # Cache e versões num arquivo temporário, não em Config.SHARED_CACHE_PATH
+        self.tmpdir = tempfile.TemporaryDirectory()
+        cache = SQLiteCacheService(os.path.join(self.tmpdir.name, 'cache.sqlite3'))
+        for p in (patch('app.models.get_shared_cache', return_value=cache), patch.object(watermarks, '_cache', cache)):
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_single_rpc_call(self):
+        mock_client = MagicMock()
+        mock_client.rpc.return_value.execute.return_value.data = [{'id': 'u1', 'login_count': 5}]
+        with patch.object(Auth, 'login_service', SupabaseLoginService(mock_client)), \
+             patch('app.models.User.cache_profile') as cache_profile:
+            user = Auth.login('vendedor@empresa.com', 'segredo123')
+        self.assertEqual(user['id'], 'u1')
+        mock_client.rpc.assert_called_once_with(
+            'login_user', {'p_email': 'vendedor@empresa.com', 'p_password': 'segredo123'}
+        )
+        mock_client.table.assert_not_called()
+        cache_profile.assert_called_once_with(user)
+
+    def test_rejects_malformed_input_without_round_trip(self):
+        service = MagicMock()
+        with patch.object(Auth, 'login_service', service):
+            self.assertIsNone(Auth.login('sem-arroba', 'segredo123'))
+            self.assertIsNone(Auth.login('a@b.com', '123'))
+        service.login.assert_not_called()
+
+    def test_falls_back_without_login_user_function(self):
+        from postgrest.exceptions import APIError
+        service = MagicMock()
+        service.login.side_effect = APIError({'code': 'PGRST202', 'message': 'not found'})
+        user = {'id': 'u1', 'login_count': 2}
+        with patch.object(Auth, 'login_service', service), \
+                patch.object(Auth, 'login_rpc_available', True), \
+                patch.object(Auth, 'verify_credentials', return_value=True) as verify, \
+                patch('app.models.User.get_or_create_by_email', return_value=user) as get_or_create:
+            self.assertEqual(Auth.login('vendedor@empresa.com', 'segredo123'), user)
+            self.assertFalse(Auth.login_rpc_available)
+            # A RPC ausente não é tentada de novo
+            self.assertEqual(Auth.login('vendedor@empresa.com', 'segredo123'), user)
+            verify.return_value = False
+            self.assertIsNone(Auth.login('vendedor@empresa.com', 'errada123'))
+        service.login.assert_called_once()
+        self.assertEqual(get_or_create.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
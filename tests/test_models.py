@@ -0,0 +1,330 @@
+# tests/test_models.py
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from flask import Flask
+from app.models import User, Message, ThreadDisplayName, encode_history_cursor, decode_history_cursor
+from app.services.cache_service import SQLiteCacheService
+
+class TestHistoryPagination(unittest.TestCase):
+    def _mock_supabase(self, rows):
+        mock_supabase = MagicMock()
+        query = mock_supabase.table.return_value.select.return_value
+        # Todos os filtros retornam a mesma query encadeável
+        for method in ('eq', 'or_', 'gt', 'order', 'limit'):
+            getattr(query, method).return_value = query
+        query.execute.return_value.data = rows
+        return mock_supabase, query
+
+    def test_cursor_round_trip(self):
+        cursor = encode_history_cursor({'id': 42, 'timestamp': '2024-01-01T10:00:00-03:00'})
+        self.assertEqual(decode_history_cursor(cursor), ('2024-01-01T10:00:00-03:00', 42))
+        with self.assertRaises(ValueError):
+            decode_history_cursor('not-a-cursor')
+
+    def test_rejects_injected_cursor_values(self):
+        import base64, json
+        def raw_cursor(timestamp, message_id):
+            raw = json.dumps([timestamp, message_id]).encode('utf-8')
+            return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+        for timestamp, message_id in (('2024-01-01T10:00:00', '1),id.gt.(0'),
+                                      ('2024-01-01T10:00:00",user_id.neq."x', 1),
+                                      ('2024-01-01T10:00:00', True)):
+            cursor = raw_cursor(timestamp, message_id)
+            with self.assertRaises(ValueError):
+                decode_history_cursor(cursor)
+            mock_supabase, query = self._mock_supabase([])
+            with patch('app.models.supabase', mock_supabase):
+                for mode in ('before', 'after', 'since'):
+                    with self.assertRaises(ValueError):
+                        Message.get_messages_page('thread_1', **{mode: cursor})
+            query.or_.assert_not_called()
+
+    def test_latest_page_is_chronological(self):
+        rows = [{'id': i, 'timestamp': f'2024-01-01T10:00:{i:02d}', 'role': 'user', 'content': str(i)} for i in (3, 2, 1)]
+        mock_supabase, query = self._mock_supabase(rows)
+        with patch('app.models.supabase', mock_supabase):
+            page = Message.get_messages_page('thread_1', limit=2)
+        self.assertTrue(page['has_more'])
+        self.assertEqual([m['id'] for m in page['messages']], [2, 3])
+        self.assertEqual(decode_history_cursor(page['prev_cursor'])[1], 2)
+        self.assertEqual(decode_history_cursor(page['next_cursor'])[1], 3)
+        mock_supabase.table.assert_called_once_with('mensagens_chatbot_nomes')
+        mock_supabase.table.return_value.select.assert_any_call('id,role,content,timestamp,user_name,display_name')
+
+    def test_before_cursor_uses_keyset_filter(self):
+        mock_supabase, query = self._mock_supabase([])
+        cursor = encode_history_cursor({'id': 7, 'timestamp': '2024-01-01T10:00:00'})
+        with patch('app.models.supabase', mock_supabase):
+            page = Message.get_messages_page('thread_1', before=cursor)
+        query.or_.assert_called_once_with(
+            'timestamp.lt."2024-01-01T10:00:00",and(timestamp.eq."2024-01-01T10:00:00",id.lt.7)'
+        )
+        self.assertFalse(page['has_more'])
+        self.assertEqual(page['prev_cursor'], cursor)
+
+    def test_rejects_multiple_modes(self):
+        with self.assertRaises(ValueError):
+            Message.get_messages_page('thread_1', before='a', since='b')
+
+class TestUserProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        cache = SQLiteCacheService(os.path.join(self.tmpdir.name, 'cache.sqlite3'))
+        self.cache_patch = patch('app.models.get_shared_cache', return_value=cache)
+        self.cache_patch.start()
+        self.mock_supabase = MagicMock()
+        self.select = self.mock_supabase.table.return_value.select.return_value.eq.return_value
+        self.select.execute.return_value.data = [{
+            'id': 'u1', 'name': 'Maria', 'login_count': 3,
+            'thread_id_atual': 'thread_a', 'thread_id_novo': None
+        }]
+        self.supabase_patch = patch('app.models.supabase', self.mock_supabase)
+        self.supabase_patch.start()
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        self.supabase_patch.stop()
+        self.cache_patch.stop()
+        self.tmpdir.cleanup()
+
+    def test_one_read_per_request(self):
+        with self.app.app_context():
+            self.assertEqual(User.get_by_id('u1')['name'], 'Maria')
+            self.assertEqual(User.get_thread_id('u1', 'atual'), 'thread_a')
+            self.assertEqual(User.get_name('u1'), 'Maria')
+            self.assertEqual(User.get_login_count('u1'), 3)
+        self.assertEqual(self.select.execute.call_count, 1)
+
+    def test_shared_ttl_layer_between_requests(self):
+        with self.app.app_context():
+            User.get_name('u1')
+        with self.app.app_context():
+            User.get_login_count('u1')
+        self.assertEqual(self.select.execute.call_count, 1)
+
+    def test_update_invalidates(self):
+        with self.app.app_context():
+            User.get_name('u1')
+            User.update_name('u1', 'Ana')
+            User.get_name('u1')
+        self.assertEqual(self.select.execute.call_count, 2)
+
+class TestThreadDisplayName(unittest.TestCase):
+    def test_rename_is_single_upsert(self):
+        mock_supabase = MagicMock()
+        with patch('app.models.supabase', mock_supabase), patch('app.models.watermarks'):
+            self.assertTrue(Message.update_user_name('thread_1', 'u1', 'Carlos'))
+        mock_supabase.table.assert_called_once_with('thread_display_names')
+        record = mock_supabase.table.return_value.upsert.call_args[0][0]
+        self.assertEqual((record['thread_id'], record['display_name'], record['user_id']), ('thread_1', 'Carlos', 'u1'))
+        mock_supabase.table.return_value.update.assert_not_called()
+
+    def test_placeholder_is_not_stored(self):
+        mock_supabase = MagicMock()
+        with patch('app.models.supabase', mock_supabase):
+            self.assertFalse(ThreadDisplayName.set('thread_1', 'Usuário Anônimo'))
+        mock_supabase.table.assert_not_called()
+
+    def test_apply_overrides_user_messages_only(self):
+        messages = [{'role': 'user', 'user_name': 'antigo'}, {'role': 'assistant', 'user_name': None}]
+        with patch.object(ThreadDisplayName, 'get', return_value='Carlos'):
+            ThreadDisplayName.apply('thread_1', messages)
+        self.assertEqual([m['user_name'] for m in messages], ['Carlos', None])
+
+    def test_history_reads_name_in_the_same_query(self):
+        mock_supabase = MagicMock()
+        query = mock_supabase.table.return_value.select.return_value
+        for method in ('eq', 'order', 'limit'):
+            getattr(query, method).return_value = query
+        query.execute.return_value.data = [
+            {'id': 2, 'role': 'assistant', 'user_name': 'IA', 'display_name': 'Carlos'},
+            {'id': 1, 'role': 'user', 'user_name': 'antigo', 'display_name': 'Carlos'},
+        ]
+        with patch('app.models.supabase', mock_supabase):
+            window = Message.get_window('thread_1', 2)
+        self.assertEqual(window, [{'id': 1, 'role': 'user', 'user_name': 'Carlos'},
+                                  {'id': 2, 'role': 'assistant', 'user_name': 'IA'}])
+        # Uma única consulta, na view
+        mock_supabase.table.assert_called_once_with('mensagens_chatbot_nomes')
+        query.execute.assert_called_once()
+
+    def test_falls_back_to_second_query_without_view(self):
+        from postgrest.exceptions import APIError
+        mock_supabase = MagicMock()
+        view, table = MagicMock(), MagicMock()
+        mock_supabase.table.side_effect = lambda name: view if name == 'mensagens_chatbot_nomes' else table
+        view.select.return_value.eq.return_value.order.return_value.execute.side_effect = \
+            APIError({'code': 'PGRST205', 'message': 'not found'})
+        table.select.return_value.eq.return_value.order.return_value.execute.return_value.data = [
+            {'id': 1, 'role': 'user', 'user_name': 'antigo'}
+        ]
+        with patch('app.models.supabase', mock_supabase), \
+                patch.object(ThreadDisplayName, 'view_available', True), \
+                patch.object(ThreadDisplayName, 'get', return_value='Carlos'):
+            self.assertEqual(Message.get_messages('thread_1')[0]['user_name'], 'Carlos')
+            self.assertFalse(ThreadDisplayName.view_available)
+            view.select.reset_mock()
+            Message.get_messages('thread_1')
+        view.select.assert_not_called()
+
+class TestAnalysisCandidates(unittest.TestCase):
+    def _mock_supabase(self, newest, oldest, strata_rows):
+        mock_supabase = MagicMock()
+        query = mock_supabase.table.return_value.select.return_value
+        for method in ('eq', 'gte', 'lt', 'lte', 'order', 'limit'):
+            getattr(query, method).return_value = query
+        query.execute.side_effect = [MagicMock(data=newest), MagicMock(data=oldest)] + \
+            [MagicMock(data=rows) for rows in strata_rows]
+        return mock_supabase, query
+
+    @patch('app.models.Config')
+    def test_samples_every_time_stratum(self, config):
+        config.ANALYSIS_TIME_STRATA, config.ANALYSIS_CANDIDATE_POOL = 4, 8
+        newest = [{'timestamp': '2024-12-31T00:00:00'}, {'timestamp': '2024-12-30T00:00:00'}]
+        strata_rows = [[{'timestamp': f'2024-0{i + 1}-01T00:00:00'}] for i in range(4)]
+        mock_supabase, query = self._mock_supabase(newest, [{'timestamp': '2024-01-01T00:00:00'}], strata_rows)
+        with patch('app.models.supabase', mock_supabase):
+            rows = Message._analysis_candidates('u1', 'content,timestamp', role='user')
+        self.assertEqual(rows, [row for rows in strata_rows for row in rows])
+        # Faixas de tempo contíguas do início ao fim do histórico, cada uma limitada
+        self.assertEqual(query.gte.call_args_list[0].args, ('timestamp', '2024-01-01T00:00:00'))
+        self.assertEqual(query.lte.call_args.args, ('timestamp', '2024-12-31T00:00:00'))
+        self.assertEqual(query.lt.call_count, 3)
+        query.limit.assert_called_with(2)
+        query.eq.assert_any_call('role', 'user')
+
+    @patch('app.models.Config')
+    def test_short_history_is_one_query(self, config):
+        config.ANALYSIS_TIME_STRATA, config.ANALYSIS_CANDIDATE_POOL = 4, 8
+        newest = [{'timestamp': '2024-12-31T00:00:00'}]
+        mock_supabase, query = self._mock_supabase(newest, [], [])
+        with patch('app.models.supabase', mock_supabase):
+            self.assertEqual(Message._analysis_candidates('u1', 'content,timestamp'), newest)
+        self.assertEqual(query.execute.call_count, 1)
+
+class TestMessageInserts(unittest.TestCase):
+    def setUp(self):
+        self.mock_supabase = MagicMock()
+        self.insert = self.mock_supabase.table.return_value.insert
+        self.insert.return_value.execute.return_value.data = [{'id': 1}]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        cache = SQLiteCacheService(os.path.join(self.tmpdir.name, 'cache.sqlite3'))
+        patches = [patch('app.models.supabase', self.mock_supabase), patch('app.models.watermarks'),
+                   patch('app.models.get_shared_cache', return_value=cache)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_known_user_costs_one_round_trip(self):
+        User.remember('u1')
+        self.assertEqual(Message.create('thread_1', 'user', 'oi', user_id='u1', user_name=''), {'id': 1})
+        self.mock_supabase.table.assert_called_once_with('mensagens_chatbot')
+        self.assertEqual(self.insert.call_args[0][0]['user_name'], 'Usuário Anônimo')
+
+    def test_foreign_key_violation_returns_none(self):
+        from postgrest.exceptions import APIError
+        User.remember('u_removido')
+        self.insert.return_value.execute.side_effect = APIError({'code': '23503', 'message': 'fk'})
+        self.assertIsNone(Message.create('thread_1', 'user', 'oi', user_id='u_removido'))
+        with patch('app.models.User.get_profile', return_value=None):
+            self.assertFalse(User.is_known('u_removido'))
+
+    def test_create_many_single_insert(self):
+        rows = Message.create_many([
+            {'thread_id': 'thread_1', 'role': 'user', 'content': 'oi', 'user_name': 'Ana'},
+            {'thread_id': 'thread_1', 'role': 'assistant', 'content': 'olá', 'chatbot_type': 'vendas'},
+        ])
+        self.assertEqual(rows, [{'id': 1}])
+        self.insert.assert_called_once()
+        payload = self.insert.call_args[0][0]
+        self.assertEqual([r['user_name'] for r in payload], ['Ana', 'IA Especialista em Vendas'])
+
+class TestSendMessageRoute(unittest.TestCase):
+    def setUp(self):
+        from app import create_app
+        self.client = create_app().test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 'u1'
+        patches = [
+            patch('app.routes.User.get_by_id', return_value={'id': 'u1', 'name': 'Ana'}),
+            patch('app.routes.User.get_thread_id', return_value='thread_1'),
+            patch('app.routes.User.update_last_interaction'),
+            patch('app.routes.ChatbotFactory.create_chatbot'),
+            patch('app.routes.Message.create_many'),
+        ]
+        mocks = [p.start() for p in patches]
+        for p in patches:
+            self.addCleanup(p.stop)
+        self.chatbot = mocks[3].return_value
+        self.create_many = mocks[4]
+
+    def test_question_and_answer_in_one_insert(self):
+        self.chatbot.send_message.return_value = {'response': 'Olá, Ana'}
+        self.create_many.return_value = [{'id': 1}, {'id': 2, 'timestamp': '2024-01-01T10:00:00'}]
+        response = self.client.post('/send_message', json={'message': 'Oi'})
+        self.assertEqual(response.get_json()['response'], 'Olá, Ana')
+        self.assertIsNotNone(response.get_json()['cursor'])
+        self.create_many.assert_called_once()
+        rows = self.create_many.call_args[0][0]
+        self.assertEqual([(r['role'], r['content']) for r in rows], [('user', 'Oi'), ('assistant', 'Olá, Ana')])
+        self.assertEqual(rows[0]['user_name'], 'Ana')
+
+    def test_question_is_kept_when_the_chatbot_fails(self):
+        self.chatbot.send_message.side_effect = RuntimeError('openai fora do ar')
+        self.assertEqual(self.client.post('/send_message', json={'message': 'Oi'}).status_code, 500)
+        rows = self.create_many.call_args[0][0]
+        self.assertEqual([r['role'] for r in rows], ['user'])
+
+class TestHistoryWindow(unittest.TestCase):
+    def test_window_is_limited_and_chronological(self):
+        mock_supabase = MagicMock()
+        query = mock_supabase.table.return_value.select.return_value
+        for method in ('eq', 'order', 'limit'):
+            getattr(query, method).return_value = query
+        query.execute.return_value.data = [{'id': 3, 'role': 'assistant'}, {'id': 2, 'role': 'assistant'}]
+        with patch('app.models.supabase', mock_supabase):
+            window = Message.get_window('thread_1', 2)
+        self.assertEqual([m['id'] for m in window], [2, 3])
+        query.limit.assert_called_once_with(2)
+
+    def test_trim_is_one_ranged_delete(self):
+        mock_supabase = MagicMock()
+        mock_supabase.rpc.return_value.execute.return_value.data = [
+            {'user_id': 'u1', 'deleted': 3}, {'user_id': None, 'deleted': 1}
+        ]
+        with patch('app.models.supabase', mock_supabase), patch('app.models.watermarks') as marks, \
+                patch.object(Message, '_invalidate_conversation_stats') as invalidate:
+            self.assertEqual(Message.trim_thread_history('thread_1', 10), 4)
+        mock_supabase.rpc.assert_called_once_with('trim_thread_history', {'p_thread_id': 'thread_1', 'p_keep': 10})
+        mock_supabase.table.assert_not_called()
+        marks.bump_thread.assert_called_once_with('thread_1')
+        self.assertEqual(list(invalidate.call_args[0][0]), ['u1', None])
+
+    def test_trim_without_function_deletes_by_id(self):
+        from postgrest.exceptions import APIError
+        mock_supabase = MagicMock()
+        mock_supabase.rpc.return_value.execute.side_effect = APIError({'code': 'PGRST202', 'message': 'not found'})
+        query = mock_supabase.table.return_value.select.return_value
+        for method in ('eq', 'or_', 'order', 'limit', 'range'):
+            getattr(query, method).return_value = query
+        query.execute.side_effect = [
+            MagicMock(data=[{'id': 9, 'timestamp': '2024-01-01T10:00:00'}]),
+            MagicMock(data=[{'id': 1, 'user_id': 'u1'}, {'id': 2, 'user_id': 'u1'}, {'id': 3, 'user_id': None}]),
+        ]
+        with patch('app.models.supabase', mock_supabase), patch('app.models.watermarks'), \
+                patch.object(Message, '_trim_rpc_available', True), \
+                patch.object(Message, '_invalidate_conversation_stats') as invalidate:
+            self.assertEqual(Message.trim_thread_history('thread_1', 10), 3)
+            self.assertFalse(Message._trim_rpc_available)
+        query.range.assert_called_once_with(9, 9)
+        query.or_.assert_called_once_with(
+            'timestamp.lt."2024-01-01T10:00:00",and(timestamp.eq."2024-01-01T10:00:00",id.lt.9)'
+        )
+        mock_supabase.table.return_value.delete.return_value.in_.assert_called_once_with('id', [1, 2, 3])
+        self.assertEqual(list(invalidate.call_args[0][0]), ['u1', None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# tests/test_name_extractor.py
+import unittest
+from unittest.mock import MagicMock
+from app.services.name_extractor import UNRESOLVED, NameExtractor, OpenAINameResolver, match_name_rules
+
+class TestNameRules(unittest.TestCase):
+    def test_rules(self):
+        self.assertEqual(match_name_rules("Olá, meu nome é João Silva"), "João Silva")
+        self.assertEqual(match_name_rules("pode me chamar de Beto"), "Beto")
+        self.assertEqual(match_name_rules("Ricardo é meu nome"), "Ricardo")
+        self.assertEqual(match_name_rules("Quanto custa o plano?"), "")
+
+    def test_common_word_is_not_a_name(self):
+        self.assertEqual(match_name_rules("sou o cliente"), "")
+
+    def test_rule_priority_over_position(self):
+        # "sou a" aparece antes, mas "meu nome é" tem prioridade, como no laço original
+        self.assertEqual(match_name_rules("sou a gerente, meu nome é Paula"), "Paula")
+        self.assertEqual(match_name_rules("sou o Dono. Me chamo Caio"), "Caio")
+
+    def test_lower_priority_match_does_not_consume_text(self):
+        self.assertEqual(match_name_rules("sou o João meu nome é Pedro"), "Pedro")
+        self.assertEqual(match_name_rules("sou o cliente meu nome é Rui"), "Rui")
+        # Só a primeira ocorrência de cada regra conta, como no laço de re.search original
+        self.assertEqual(match_name_rules("sou o cliente, sou o Lucas"), "")
+
+class TestNameExtractor(unittest.TestCase):
+    def test_tiers(self):
+        extractor = NameExtractor()
+        self.assertEqual(extractor.classify("Me chamo Fernanda"), ('rule', 'Fernanda'))
+        self.assertEqual(extractor.classify("Qual o valor do frete?")[0], 'none')
+        self.assertEqual(extractor.classify("Aqui é o Pedro, tudo bem?")[0], 'ambiguous')
+        self.assertEqual(extractor.classify("Bruno")[0], 'ambiguous')
+
+    def test_ambiguous_messages_share_one_llm_request(self):
+        resolver = MagicMock(return_value=["Pedro", "Nenhum"])
+        extractor = NameExtractor(llm_resolver=resolver)
+        names = extractor.extract_many([
+            "Me chamo Fernanda", "Aqui é o Pedro, tudo bem?", "Qual o valor do frete?", "Prazer, ok"
+        ])
+        self.assertEqual(names, ["Fernanda", "Pedro", None, None])
+        resolver.assert_called_once_with(["Aqui é o Pedro, tudo bem?", "Prazer, ok"])
+        self.assertEqual(extractor.stats['llm_requests'], 1)
+        self.assertEqual(extractor.stats['llm_messages'], 2)
+
+    def test_llm_failure_yields_none(self):
+        extractor = NameExtractor(llm_resolver=MagicMock(side_effect=RuntimeError("timeout")))
+        self.assertIsNone(extractor.extract("Bruno"))
+        self.assertIs(extractor.extract("Bruno", on_failure=UNRESOLVED), UNRESOLVED)
+        # Mensagens resolvidas pelas regras não dependem do LLM
+        self.assertEqual(extractor.extract_many(["Me chamo Ana", "Bruno"], on_failure=UNRESOLVED),
+                         ["Ana", UNRESOLVED])
+
+class TestOpenAINameResolver(unittest.TestCase):
+    def test_parses_json_answer(self):
+        client = MagicMock()
+        client.chat.completions.create.return_value.choices[0].message.content = (
+            '{"names": [{"i": 1, "name": "Ana"}, {"i": 0, "name": null}]}'
+        )
+        resolver = OpenAINameResolver(lambda: client)
+        self.assertEqual(resolver(["oi", "Ana aqui"]), [None, "Ana"])
+        kwargs = client.chat.completions.create.call_args.kwargs
+        self.assertEqual(kwargs['response_format'], {"type": "json_object"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# tests/test_preretrieval.py
+import unittest
+from unittest.mock import MagicMock, patch
+from app.chatbot.base import BaseChatbot
+from app.chatbot.vendas import VendasChatbot
+
+HITS = [
+    {"id": 3, "sender_name": "Ana", "content": "Estou muito insatisfeito,   vou fazer uma reclamação",
+     "timestamp": "2024-05-01T10:00:00", "score": 0.61},
+    {"id": 5, "sender_name": None, "content": "x" * 400, "timestamp": None, "score": 0.3},
+]
+
+def _vendas(index):
+    # Sem __init__: não cria o assistente na OpenAI
+    chatbot = VendasChatbot.__new__(VendasChatbot)
+    chatbot.semantic_index = index
+    return chatbot
+
+class TestVendasPreRetrieval(unittest.TestCase):
+    @patch('app.chatbot.vendas.Config')
+    def test_attaches_hits_as_additional_instructions(self, config):
+        config.VENDAS_PRERETRIEVAL, config.VENDAS_PRERETRIEVAL_K, config.VENDAS_PRERETRIEVAL_MIN_SCORE = True, 5, 0.2
+        index = MagicMock()
+        index.search.return_value = HITS
+        options = _vendas(index)._run_options("thread", "Do que os clientes reclamaram?")
+        index.search.assert_called_once_with("Do que os clientes reclamaram?", k=5, min_score=0.2)
+        text = options["additional_instructions"]
+        self.assertIn("- [2024-05-01T10:00:00] Ana: Estou muito insatisfeito, vou fazer uma reclamação", text)
+        self.assertIn("- [s/ data] Desconhecido: " + "x" * 300 + "…", text)
+
+    @patch('app.chatbot.vendas.Config')
+    def test_no_options_when_disabled_unavailable_or_empty(self, config):
+        config.VENDAS_PRERETRIEVAL, config.VENDAS_PRERETRIEVAL_K, config.VENDAS_PRERETRIEVAL_MIN_SCORE = True, 5, 0.2
+        index = MagicMock()
+        index.search.return_value = []
+        self.assertEqual(_vendas(index)._run_options("thread", "reclamações"), {})
+        self.assertEqual(_vendas(index)._run_options("thread", "é o que"), {})
+        self.assertEqual(_vendas(None)._run_options("thread", "reclamações"), {})
+        index.search.side_effect = RuntimeError("boom")
+        self.assertEqual(_vendas(index)._run_options("thread", "reclamações"), {})
+        config.VENDAS_PRERETRIEVAL = False
+        index.search.reset_mock()
+        self.assertEqual(_vendas(index)._run_options("thread", "reclamações"), {})
+        index.search.assert_not_called()
+
+class TestRunOptionsHook(unittest.TestCase):
+    @patch('app.chatbot.base.client')
+    def test_send_message_passes_run_options(self, client):
+        chatbot = BaseChatbot.__new__(BaseChatbot)
+        chatbot.name, chatbot.assistant_id = "Teste", "asst_1"
+        chatbot._get_active_run = MagicMock(return_value=None)
+        chatbot._log_interaction = MagicMock()
+        chatbot._process_run = MagicMock(return_value={"response": "ok", "thread_id": "thread"})
+        chatbot._run_options = MagicMock(return_value={"additional_instructions": "contexto"})
+        client.beta.threads.runs.create.return_value.id = "run_1"
+
+        self.assertEqual(chatbot.send_message("thread", "olá")["response"], "ok")
+        client.beta.threads.runs.create.assert_called_once_with(
+            thread_id="thread", assistant_id="asst_1", additional_instructions="contexto"
+        )
+        chatbot._run_options.assert_called_once_with("thread", "olá")
+
+class TestAssistantSync(unittest.TestCase):
+    TOOLS = [{"type": "function", "function": {"name": "f", "description": "d", "parameters": {"type": "object"}}}]
+
+    def _chatbot(self, instructions, tools):
+        chatbot = _vendas(None)
+        chatbot.name, chatbot.assistant_id = "Vendas", "asst_1"
+        chatbot.assistant = MagicMock(instructions=instructions)
+        chatbot.assistant.tools = [MagicMock(**{"model_dump.return_value": tool}) for tool in tools]
+        chatbot.get_instructions = MagicMock(return_value="novas instruções")
+        chatbot.get_tools = MagicMock(return_value=self.TOOLS)
+        return chatbot
+
+    @patch('app.chatbot.base.client')
+    def test_updates_existing_assistant_when_code_changed(self, client):
+        changes = self._chatbot("instruções antigas", []).sync_assistant(apply=False)
+        self.assertEqual(set(changes), {"instructions", "tools"})
+        client.beta.assistants.update.assert_not_called()
+        self._chatbot("instruções antigas", []).sync_assistant()
+        client.beta.assistants.update.assert_called_once_with(
+            "asst_1", instructions="novas instruções", tools=self.TOOLS
+        )
+
+    @patch('app.chatbot.base.client')
+    def test_no_update_when_in_sync(self, client):
+        tool = dict(self.TOOLS[0], function=dict(self.TOOLS[0]["function"], strict=None))
+        self.assertEqual(self._chatbot("novas instruções", [tool]).sync_assistant(), {})
+        client.beta.assistants.update.assert_not_called()
+
+    @patch('app.chatbot.base.client')
+    def test_startup_does_not_touch_existing_assistant(self, client):
+        chatbot = self._chatbot("instruções antigas", [])
+        chatbot._initialize_assistant()
+        client.beta.assistants.retrieve.assert_called_once_with("asst_1")
+        client.beta.assistants.update.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
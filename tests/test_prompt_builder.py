@@ -0,0 +1,44 @@
+# tests/test_prompt_builder.py
+import unittest
+from app.services.prompt_builder import PromptBudgetBuilder, estimate_tokens, simhash
+
+class TestPromptBudgetBuilder(unittest.TestCase):
+    def setUp(self):
+        self.messages = [
+            {"content": f"Mensagem {i}: o cliente pediu desconto no plano {i % 7} e prazo {i % 11}",
+             "timestamp": f"2024-01-01T{i // 60 % 24:02d}:{i % 60:02d}:00"}
+            for i in range(3000)
+        ]
+
+    def test_stays_within_budget(self):
+        builder = PromptBudgetBuilder(500)
+        prompt = builder.build(self.messages, render=lambda m: f"Vendedor: {m['content']}", header="Analise:\n\n")
+        self.assertLessEqual(estimate_tokens(prompt), 500)
+        self.assertTrue(prompt.startswith("Analise:\n\n"))
+
+    def test_samples_across_time(self):
+        builder = PromptBudgetBuilder(400, strata=4)
+        selected = builder.select(self.messages)
+        timestamps = [m["timestamp"] for m in selected]
+        self.assertEqual(timestamps, sorted(timestamps))
+        # Cada quarto do histórico deve estar representado
+        ordered = sorted(m["timestamp"] for m in self.messages)
+        quarters = [ordered[i * 750] for i in range(1, 4)]
+        self.assertTrue(any(t < quarters[0] for t in timestamps))
+        self.assertTrue(any(t >= quarters[2] for t in timestamps))
+
+    def test_removes_near_duplicates(self):
+        messages = [{"content": "Olá, tudo bem? Posso ajudar com a sua passagem?", "timestamp": str(i)} for i in range(50)]
+        messages.append({"content": "Olá tudo bem posso ajudar com a sua passagem", "timestamp": "99"})
+        selected = PromptBudgetBuilder(1000).select(messages)
+        self.assertEqual(len(selected), 1)
+        self.assertEqual(simhash(messages[0]["content"]), simhash(messages[-1]["content"]))
+
+    def test_truncates_oversized_item(self):
+        messages = [{"content": "palavra " * 5000, "timestamp": "1"}]
+        selected = PromptBudgetBuilder(200).select(messages)
+        self.assertEqual(len(selected), 1)
+        self.assertLessEqual(estimate_tokens(selected[0]["content"]), 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# tests/test_retention.py
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from app.services.cache_service import SQLiteCacheService
+from app.services.retention import RetentionEngine, jsonl_archiver
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+class _Query:
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+        self.ids = None
+        self.deleting = False
+        self.max_rows = None
+
+    def select(self, columns):
+        self.columns = columns
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row[column] < value)
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def delete(self):
+        self.deleting = True
+        return self
+
+    def in_(self, column, values):
+        self.ids = set(values)
+        return self
+
+    def execute(self):
+        if self.deleting:
+            self.table.deletes.append(len(self.ids))
+            deleted = [row for row in self.table.rows if row['id'] in self.ids]
+            self.table.rows = [row for row in self.table.rows if row['id'] not in self.ids]
+            return _Result(deleted)
+        rows = sorted((r for r in self.table.rows if all(f(r) for f in self.filters)), key=lambda r: r['id'])
+        rows = rows[:self.max_rows]
+        if self.columns == 'id':
+            rows = [{'id': row['id']} for row in rows]
+        return _Result(rows)
+
+class FakeTable:
+    """Tabela em memória com o subconjunto do postgrest usado pela retenção."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.deletes = []
+
+    def table(self, name):
+        return _Query(self)
+
+NOW = datetime.datetime(2025, 1, 10, 12, 0, 0)
+
+def _rows(old, recent):
+    rows = [{'id': i, 'content': f'velha {i}', 'processed_at': (NOW - datetime.timedelta(days=2, minutes=i)).isoformat()}
+            for i in range(old)]
+    rows += [{'id': old + i, 'content': f'nova {i}', 'processed_at': (NOW - datetime.timedelta(minutes=i)).isoformat()}
+             for i in range(recent)]
+    return rows
+
+class TestRetentionEngine(unittest.TestCase):
+    def _engine(self, client, **kwargs):
+        kwargs.setdefault('sleep', MagicMock())
+        return RetentionEngine(client, 'whatsapp_messages', datetime.timedelta(hours=24),
+                               time_column='processed_at', chunk_size=10, pause=0.5, **kwargs)
+
+    def test_deletes_only_expired_rows_in_chunks(self):
+        client = FakeTable(_rows(25, 5))
+        sleep = MagicMock()
+        progress = self._engine(client, sleep=sleep).run(now=NOW)
+        self.assertEqual(client.deletes, [10, 10, 5])
+        self.assertEqual(len(client.rows), 5)
+        self.assertTrue(all(row['content'].startswith('nova') for row in client.rows))
+        self.assertEqual((progress['status'], progress['deleted'], progress['chunks']), ('done', 25, 3))
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_max_chunks_leaves_rest_for_next_run(self):
+        client = FakeTable(_rows(25, 0))
+        engine = self._engine(client, max_chunks=2)
+        self.assertEqual(engine.run(now=NOW)['status'], 'partial')
+        self.assertEqual(len(client.rows), 5)
+        self.assertEqual(engine.run(now=NOW)['deleted'], 5)
+
+    def test_archives_before_deleting(self):
+        client = FakeTable(_rows(12, 1))
+        with tempfile.TemporaryDirectory() as directory:
+            self._engine(client, archive_fn=jsonl_archiver(directory)).run(now=NOW)
+            [name] = os.listdir(directory)
+            with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as f:
+                archived = [json.loads(line) for line in f]
+        self.assertEqual(len(archived), 12)
+        self.assertEqual(archived[0]['content'], 'velha 0')
+
+    def test_archive_failure_stops_deletion(self):
+        client = FakeTable(_rows(12, 0))
+        progress = self._engine(client, archive_fn=MagicMock(side_effect=IOError("disco cheio"))).run(now=NOW)
+        self.assertEqual(progress['status'], 'error')
+        self.assertEqual(len(client.rows), 12)
+
+    def test_progress_is_published(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SQLiteCacheService(os.path.join(directory, 'cache.sqlite3'))
+            self._engine(FakeTable(_rows(3, 0)), cache=cache).run(now=NOW)
+            published = cache.get('retention:whatsapp_messages')
+        self.assertEqual((published['status'], published['deleted']), ('done', 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+# tests/test_scheduler.py
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from app.services.scheduler import FileLeaderLock, JobScheduler, LeaderElection, PostgresAdvisoryLock
+
+def _try_lock(path, result):
+    result.put(FileLeaderLock(path).acquire())
+
+class TestLeaderElection(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'scheduler.lock')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_only_one_holder(self):
+        first, second = FileLeaderLock(self.path), FileLeaderLock(self.path)
+        self.assertTrue(first.acquire())
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+    def test_other_process_cannot_lead(self):
+        lock = FileLeaderLock(self.path)
+        self.assertTrue(lock.acquire())
+        result = multiprocessing.get_context('fork').Queue()
+        process = multiprocessing.get_context('fork').Process(target=_try_lock, args=(self.path, result))
+        process.start()
+        process.join(10)
+        self.assertFalse(result.get(timeout=5))
+        lock.release()
+
+    def test_database_lock_failure_releases_file_lock(self):
+        database_lock = MagicMock()
+        database_lock.acquire.return_value = False
+        election = LeaderElection([FileLeaderLock(self.path), database_lock])
+        self.assertFalse(election.try_acquire())
+        # Outro worker do host pode tentar a trava do banco
+        self.assertTrue(FileLeaderLock(self.path).acquire())
+
+    def test_advisory_lock(self):
+        psycopg2 = MagicMock()
+        cursor = psycopg2.connect.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (True,)
+        with patch.dict(sys.modules, {'psycopg2': psycopg2}):
+            lock = PostgresAdvisoryLock('postgresql://db', 42)
+            self.assertTrue(lock.acquire())
+            cursor.execute.assert_called_with("select pg_try_advisory_lock(%s)", (42,))
+            # Já líder: só verifica a conexão
+            self.assertTrue(lock.acquire())
+            self.assertEqual(psycopg2.connect.call_count, 1)
+            cursor.fetchone.return_value = (False,)
+            other = PostgresAdvisoryLock('postgresql://db', 42)
+            self.assertFalse(other.acquire())
+
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        self.election = MagicMock()
+        self.election.try_acquire.return_value = True
+        self.cache = MagicMock()
+        self.scheduler = JobScheduler(self.election, cache=self.cache, scheduler=MagicMock())
+
+    def test_register_adds_non_overlapping_job(self):
+        self.scheduler.register('sweep', MagicMock(), minutes=5)
+        kwargs = self.scheduler.scheduler.add_job.call_args.kwargs
+        self.assertEqual((kwargs['max_instances'], kwargs['coalesce'], kwargs['args']), (1, True, ['sweep']))
+
+    def test_runs_only_in_leader_and_records_metrics(self):
+        job = MagicMock()
+        self.scheduler.register('sweep', job, minutes=5)
+        self.election.try_acquire.return_value = False
+        self.assertIsNone(self.scheduler.run_job('sweep'))
+        job.assert_not_called()
+        self.election.try_acquire.return_value = True
+        self.assertEqual(self.scheduler.run_job('sweep'), 'ok')
+        stats = self.scheduler.stats['sweep']
+        self.assertEqual((stats['runs'], stats['last_status']), (1, 'ok'))
+        self.assertIsNotNone(stats['last_duration_seconds'])
+        self.assertEqual(self.cache.set.call_args.args[0], 'scheduler:jobs')
+
+    def test_processes_leading_different_jobs_keep_each_others_stats(self):
+        from app.services.cache_service import SQLiteCacheService
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = SQLiteCacheService(os.path.join(tmpdir, 'cache.sqlite3'))
+            deployment = JobScheduler(self.election, cache=cache, scheduler=MagicMock())
+            host = JobScheduler(self.election, cache=cache, scheduler=MagicMock())
+            for scheduler in (deployment, host):
+                scheduler.register('retention', MagicMock(), minutes=5)
+                scheduler.register('sweep', MagicMock(), minutes=5)
+            deployment.run_job('retention')
+            host.run_job('sweep')
+            jobs = cache.get('scheduler:jobs')['jobs']
+        self.assertEqual((jobs['retention']['runs'], jobs['sweep']['runs']), (1, 1))
+        self.assertEqual(jobs['sweep']['leader_pid'], os.getpid())
+
+    def test_failures_are_counted(self):
+        self.scheduler.register('retention', MagicMock(side_effect=Exception("falhou")), minutes=5)
+        self.assertEqual(self.scheduler.run_job('retention'), 'error')
+        self.assertEqual(self.scheduler.stats['retention']['failures'], 1)
+
+    def test_overlapping_run_is_skipped(self):
+        started, finish = threading.Event(), threading.Event()
+        def slow_job():
+            started.set()
+            finish.wait(5)
+        self.scheduler.register('retention', slow_job, minutes=5)
+        thread = threading.Thread(target=self.scheduler.run_job, args=('retention',))
+        thread.start()
+        started.wait(5)
+        self.assertEqual(self.scheduler.run_job('retention'), 'skipped')
+        finish.set()
+        thread.join()
+        self.assertEqual(self.scheduler.stats['retention']['skipped_overlap'], 1)
+        self.assertEqual(self.scheduler.stats['retention']['runs'], 1)
+
+    def test_job_with_own_election(self):
+        host = MagicMock()
+        host.try_acquire.return_value = True
+        self.election.try_acquire.return_value = False
+        local, shared = MagicMock(), MagicMock()
+        self.scheduler.register('sweep', local, minutes=5, election=host)
+        self.scheduler.register('retention', shared, minutes=5)
+        # Sem a trava da implantação, a tarefa local do host ainda roda
+        self.assertEqual(self.scheduler.run_job('sweep'), 'ok')
+        self.assertIsNone(self.scheduler.run_job('retention'))
+        local.assert_called_once()
+        shared.assert_not_called()
+        self.scheduler.shutdown()
+        host.release.assert_called_once()
+        self.election.release.assert_called_once()
+
+class TestBuildScheduler(unittest.TestCase):
+    @patch('app.jobs.get_shared_cache')
+    def test_host_local_jobs_do_not_take_the_advisory_lock(self, _cache):
+        from app import jobs
+        with patch.object(jobs.Config, 'SCHEDULER_PG_LOCK_DSN', 'postgresql://db'), \
+                patch('app.jobs.JobScheduler.register', autospec=True) as register, \
+                patch('apscheduler.schedulers.background.BackgroundScheduler'):
+            scheduler = jobs.build_scheduler()
+        elections = {call.args[1]: call.kwargs.get('election') or scheduler.election
+                     for call in register.call_args_list}
+        def advisory(job_id):
+            return any(isinstance(lock, PostgresAdvisoryLock) for lock in elections[job_id].locks)
+        self.assertTrue(advisory('delete_whatsapp_messages_job'))
+        self.assertFalse(advisory('conversation_score_rollup_job'))
+        self.assertFalse(advisory('cache_sweep_job'))
+        self.assertFalse(advisory('semantic_index_retention_job'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+# tests/test_search_service.py
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from postgrest.exceptions import APIError
+from app.services.cache_service import SQLiteCacheService
+from app.services.search_service import (
+    WHATSAPP_MESSAGES_VERSION, CachedMessageSearch, SQLiteMessageSearch, SupabaseMessageSearch,
+    end_of_day, query_terms, search_terms
+)
+from app.services.version_service import VersionWatermarks
+
+ROWS = [
+    {"id": 1, "sender_name": "João Silva", "content": "Quero saber o preço do plano anual", "timestamp": "2024-05-01T10:00:00"},
+    {"id": 2, "sender_name": "Maria", "content": "Qual o preço? Preço muito alto para o plano", "timestamp": "2024-05-02T09:00:00"},
+    {"id": 3, "sender_name": "joao pedro", "content": "Obrigado pela ajuda com o benefício", "timestamp": "2024-05-03T08:00:00"},
+    {"id": 4, "sender_name": "Carlos", "content": "Benefícios do plano mensal", "timestamp": "2024-05-04T12:00:00"},
+]
+
+class TestSearchTerms(unittest.TestCase):
+    def test_folds_and_drops_stopwords(self):
+        self.assertEqual(search_terms("Qual o Preço do plano? preço"), ["preco", "plano"])
+
+    def test_empty(self):
+        self.assertEqual(search_terms(None), [])
+        self.assertEqual(search_terms(""), [])
+
+    def test_stopwords_only_query_keeps_its_words(self):
+        self.assertEqual(query_terms("do o do"), ["do", "o"])
+        self.assertEqual(query_terms("Preço do plano"), ["preco", "plano"])
+        self.assertEqual(query_terms(None), [])
+
+    def test_end_of_day(self):
+        self.assertEqual(end_of_day("2024-05-01"), "2024-05-01T23:59:59.999999")
+        self.assertEqual(end_of_day("2024-05-01T10:00:00"), "2024-05-01T10:00:00")
+        self.assertIsNone(end_of_day(None))
+
+class TestSQLiteMessageSearch(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.search = SQLiteMessageSearch(self.path)
+        self.search.add_many(ROWS)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_ranked_accent_insensitive_match(self):
+        rows = self.search.search(content="preco")
+        self.assertEqual([row["id"] for row in rows], [2, 1])
+        self.assertGreater(rows[0]["rank"], rows[1]["rank"])
+        self.assertEqual(set(rows[0]), {"id", "sender_name", "content", "timestamp", "rank"})
+
+    def test_prefix_terms_are_anded(self):
+        self.assertEqual({row["id"] for row in self.search.search(content="beneficio")}, {3, 4})
+        self.assertEqual([row["id"] for row in self.search.search(content="beneficios plano")], [4])
+
+    def test_sender_and_dates(self):
+        rows = self.search.search(sender_name="JOÃO")
+        self.assertEqual([row["id"] for row in rows], [3, 1])
+        rows = self.search.search(start_date="2024-05-02", end_date="2024-05-03")
+        self.assertEqual([row["id"] for row in rows], [3, 2])
+
+    def test_limit(self):
+        self.assertEqual(len(self.search.search(limit=2)), 2)
+
+class TestSupabaseMessageSearch(unittest.TestCase):
+    def test_calls_rpc_with_normalized_params(self):
+        client = MagicMock()
+        client.rpc.return_value.execute.return_value.data = [{"id": 1}]
+        search = SupabaseMessageSearch(client)
+        rows = search.search(content="Preço do plano", sender_name="Ana", end_date="2024-05-01", limit=5)
+        self.assertEqual(rows, [{"id": 1}])
+        client.rpc.assert_called_once_with("search_whatsapp_messages", {
+            "p_terms": ["preco", "plano"],
+            "p_sender": "Ana",
+            "p_start": None,
+            "p_end": "2024-05-01T23:59:59.999999",
+            "p_limit": 5,
+        })
+        client.table.assert_not_called()
+
+    def test_falls_back_to_ilike_without_migration(self):
+        client = MagicMock()
+        client.rpc.return_value.execute.side_effect = APIError({"code": "PGRST202", "message": "not found"})
+        query = client.table.return_value.select.return_value
+        query.ilike.return_value = query
+        query.order.return_value.limit.return_value.execute.return_value.data = [{"id": 2}]
+        rows = SupabaseMessageSearch(client).search(content="preço")
+        self.assertEqual(rows, [{"id": 2}])
+        client.table.return_value.select.assert_called_once_with("id,sender_name,content,timestamp")
+        query.ilike.assert_called_once_with("content", "%preço%")
+
+    def test_other_errors_propagate(self):
+        client = MagicMock()
+        client.rpc.return_value.execute.side_effect = APIError({"code": "42501", "message": "denied"})
+        with self.assertRaises(APIError):
+            SupabaseMessageSearch(client).search(content="x")
+
+class TestBackendsAgree(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.sqlite = SQLiteMessageSearch(self.path)
+        self.sqlite.add_many(ROWS)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_stopwords_only_content_still_filters(self):
+        client = MagicMock()
+        client.rpc.return_value.execute.return_value.data = []
+        SupabaseMessageSearch(client).search(content="do")
+        # O Postgres recebe os mesmos termos que o SQLite usa, não uma lista vazia (que não filtraria nada)
+        self.assertEqual(client.rpc.call_args.args[1]["p_terms"], ["do"])
+        self.assertEqual({row["id"] for row in self.sqlite.search(content="do")}, {1, 4})
+        self.assertNotEqual(CachedMessageSearch.normalize(content="do"), CachedMessageSearch.normalize())
+
+class TestCachedMessageSearch(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.versions = VersionWatermarks(SQLiteCacheService(self.path))
+        self.backend = MagicMock()
+        self.backend.search.return_value = [{"id": 1, "content": "preço"}]
+        self.search = CachedMessageSearch(self.backend, self.versions, ttl=60)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_equivalent_parameters_hit_the_cache(self):
+        first = self.search.search(content="Preço do plano", sender_name="João ", end_date="2024-05-01")
+        second = self.search.search(content="plano preco", sender_name="joao",
+                                    end_date="2024-05-01T23:59:59.999999")
+        self.assertEqual(first, second)
+        self.assertEqual(self.backend.search.call_count, 1)
+        self.assertEqual(self.search.metrics()["hits"], 1)
+
+    def test_different_parameters_miss(self):
+        self.search.search(content="preço", limit=10)
+        self.search.search(content="preço", limit=20)
+        self.assertEqual(self.backend.search.call_count, 2)
+
+    def test_generation_bump_invalidates(self):
+        self.search.search(content="preço")
+        self.versions.bump(*WHATSAPP_MESSAGES_VERSION)
+        self.backend.search.return_value = [{"id": 1}, {"id": 2}]
+        self.assertEqual(len(self.search.search(content="preço")), 2)
+        self.assertEqual(self.backend.search.call_count, 2)
+
+    def test_empty_results_are_cached(self):
+        self.backend.search.return_value = []
+        self.assertEqual(self.search.search(content="nada"), [])
+        self.assertEqual(self.search.search(content="nada"), [])
+        self.assertEqual(self.backend.search.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# tests/test_semantic_index.py
+import shutil
+import tempfile
+import unittest
+from app.services import semantic_index
+from app.services.semantic_index import SemanticIndex
+
+MESSAGES = [
+    "Quero reclamar do atendimento, ninguém responde",
+    "O boleto venceu, pode mandar outro?",
+    "Estou muito insatisfeito, vou fazer uma reclamação",
+    "Qual o preço do plano anual?",
+    "Reclamei ontem e ainda não resolveram",
+]
+
+def _rows(messages, first_id=1, processed_at="2024-05-01T10:00:00"):
+    return [
+        {"id": first_id + i, "sender_name": f"Cliente {i}", "content": content,
+         "timestamp": "2024-05-01T10:00:00", "processed_at": processed_at}
+        for i, content in enumerate(messages)
+    ]
+
+@unittest.skipIf(semantic_index.np is None, "numpy não instalado")
+class TestSemanticIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = SemanticIndex(self.directory, dim=128, buckets=1 << 12, initial_capacity=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_related_inflections_rank_first(self):
+        self.index.add_many(_rows(MESSAGES))
+        hits = self.index.search("reclamação", k=3)
+        self.assertEqual({hit["id"] for hit in hits}, {1, 3, 5})
+        self.assertEqual(hits[0]["id"], 3)
+        self.assertEqual(set(hits[0]), {"id", "sender_name", "content", "timestamp", "score"})
+        self.assertTrue(all(a["score"] >= b["score"] for a, b in zip(hits, hits[1:])))
+
+    def test_grows_and_skips_known_ids(self):
+        self.assertEqual(self.index.add_many(_rows(MESSAGES)), 5)
+        self.assertEqual(self.index.add_many(_rows(MESSAGES[:2])), 0)
+        metrics = self.index.metrics()
+        self.assertEqual(metrics["rows"], 5)
+        self.assertGreaterEqual(metrics["capacity"], 5)
+
+    def test_persists_and_sees_other_writers(self):
+        self.index.add_many(_rows(MESSAGES[:2]))
+        other = SemanticIndex(self.directory)
+        other.add_many(_rows(MESSAGES[2:], first_id=3))
+        self.assertEqual(other.dim, 128)
+        self.assertEqual(self.index.search("reclamação", k=1)[0]["id"], 3)
+
+    def test_forget_before(self):
+        self.index.add_many(_rows(MESSAGES[:3], processed_at="2024-01-01T00:00:00"))
+        self.index.add_many(_rows(MESSAGES[3:], first_id=4, processed_at="2024-06-01T00:00:00"))
+        self.assertEqual(self.index.forget_before("2024-03-01T00:00:00"), 3)
+        self.assertEqual([hit["id"] for hit in self.index.search("reclamação", k=5)], [5])
+        self.assertEqual(self.index.metrics()["live_rows"], 2)
+
+    def test_forget_removes_document_frequencies(self):
+        self.index.add_many(_rows(MESSAGES[:1], processed_at="2024-01-01T00:00:00"))
+        self.assertGreater(int(self.index._df.sum()), 0)
+        self.index.forget_before("2024-03-01T00:00:00")
+        self.assertEqual(int(self.index._df.sum()), 0)
+        self.assertEqual(self.index._state()["docs"], 0)
+
+    def test_compacts_when_most_rows_are_forgotten(self):
+        old = _rows(MESSAGES * 4, processed_at="2024-01-01T00:00:00")
+        self.index.add_many(old)
+        self.index.add_many(_rows(MESSAGES[2:3], first_id=100, processed_at="2024-06-01T00:00:00"))
+        reader = SemanticIndex(self.directory)
+        self.assertEqual(len(reader.search("reclamação", k=1)), 1)
+        self.index.forget_before("2024-03-01T00:00:00")
+        metrics = self.index.metrics()
+        self.assertEqual((metrics["rows"], metrics["live_rows"], metrics["generation"]), (1, 1, 1))
+        self.assertEqual(metrics["file_bytes"], 2 * 128 * 4)
+        # Outro processo com a geração anterior mapeada passa para a nova
+        self.assertEqual([hit["id"] for hit in reader.search("reclamação", k=5)], [100])
+        self.index.add_many(_rows(MESSAGES[:1], first_id=200))
+        self.assertEqual({hit["id"] for hit in reader.search("reclamação", k=5)}, {100, 200})
+        self.assertEqual(reader.metrics()["rows"], 2)
+
+    def test_empty_query_and_index(self):
+        self.assertEqual(self.index.search("reclamação"), [])
+        self.index.add_many(_rows(MESSAGES))
+        self.assertEqual(self.index.search("de o a"), [])
+
+if __name__ == "__main__":
+    unittest.main()